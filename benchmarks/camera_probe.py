@@ -0,0 +1,98 @@
+"""Wall-clock time of camera_list/camera_name.py against benchmarks/fake_cogniac.py
+
+Starts the fake API with --tenants tenants of --cameras network cameras each
+and runs the script once per --workers value (1 is the old serial
+behaviour), each in a scratch directory, reporting elapsed time and the fake
+API's request, response and TCP connection counts:
+
+    python benchmarks/camera_probe.py --cameras 2000 --latency 0.05 --workers 1 8 32
+    python benchmarks/camera_probe.py --tenants 4 --workers 16 16 --token-cache
+
+With --token-cache the runs share one token cache, so every run after the
+first should make no login requests. With --snapshot they share one camera
+snapshot, so runs after the first search media only for cameras that changed,
+which none do here.
+
+--rate is passed to the script as PROBE_RATE; 0 leaves the searches unthrottled
+so the pool size alone is measured.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import fake_cogniac
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'camera_list', 'camera_name.py')
+
+# Routes that log in rather than read data
+LOGIN_ROUTES = ('tenants', 'token')
+
+def run(api_url, workers, rate, page_size, token_cache, snapshot, timeout):
+    requests.post(api_url + '/_reset')
+    env = dict(
+        os.environ,
+        COGNIAC_API_BASE=api_url + '/1',
+        COGNIAC_TOKEN_CACHE=token_cache,
+        COG_USER='benchmark',
+        COG_PASS='benchmark',
+        CAMERA_PAGE_SIZE=str(page_size),
+        PROBE_WORKERS=str(workers),
+        PROBE_RATE=str(rate)
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        env['SNAPSHOT_PATH'] = snapshot or os.path.join(workdir, 'camera_status.snapshot.sqlite3')
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, SCRIPT], cwd=workdir, env=env, capture_output=True, text=True,
+                                   timeout=timeout)
+        elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f'camera_name.py failed with {workers} workers:\n{completed.stderr}')
+    stats = requests.get(api_url + '/_stats').json()
+    return {
+        'workers': workers,
+        'seconds': round(elapsed, 2),
+        'login_requests': sum(stats['requests'].get(route, 0) for route in LOGIN_ROUTES),
+        'camera_pages': stats['requests'].get('network_cameras', 0),
+        'media_searches': stats['requests'].get('media_search', 0),
+        'connections': stats['connections'],
+        'responses': stats['responses'],
+        'script_latency_line': next((line for line in completed.stdout.splitlines() if 'media searches' in line), None)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cameras', type=int, default=1000, help='network cameras per tenant')
+    parser.add_argument('--tenants', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=500, help='CAMERA_PAGE_SIZE for the script')
+    parser.add_argument('--token-cache', action='store_true', help='share one token cache across the runs')
+    parser.add_argument('--snapshot', action='store_true', help='share one camera snapshot across the runs')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--rate', type=float, default=0.0, help='PROBE_RATE for the script (0 = unlimited)')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every fake API request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of searches answered 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fake searches per second before 429s')
+    parser.add_argument('--api-port', type=int, default=8904)
+    parser.add_argument('--timeout', type=float, default=3600)
+    args = parser.parse_args()
+
+    server = fake_cogniac.serve(args.api_port, latency=args.latency, error_rate=args.error_rate,
+                                rate_limit=args.rate_limit, cameras=args.cameras, tenants=args.tenants)
+    try:
+        api_url = f'http://127.0.0.1:{args.api_port}'
+        with tempfile.TemporaryDirectory() as cache_dir:
+            token_cache = os.path.join(cache_dir, 'token_cache.json') if args.token_cache else ''
+            snapshot = os.path.join(cache_dir, 'camera_status.snapshot.sqlite3') if args.snapshot else None
+            report = [run(api_url, workers, args.rate, args.page_size, token_cache, snapshot, args.timeout)
+                      for workers in args.workers]
+    finally:
+        server.shutdown()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Time parsing of camera descriptions, old regex loop against cameradescriptionapi/description_parser.py
+
+Builds --count synthetic descriptions: fields in random order, some missing
+or blank, extra lines, no trailing newline on half of them and no
+description on every twentieth camera. Then it times each way of turning
+them into a DataFrame of fields, best of --repeat:
+
+    python benchmarks/description_parser.py --count 100000
+
+Also reports how many fields the old loop missed, such as fields on a last
+line with no newline after it, that the new parser finds.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cameradescriptionapi'))
+
+import description_parser
+from description_parser import DEFAULT_FIELDS, NOT_AVAILABLE, DescriptionParser
+
+# The per-field patterns cameradescriptionapi.py used to search for, one re.search each
+LEGACY_PATTERNS = {
+    'Use case': r'Use case:\s*(.*?)\n',
+    'Manufacturer': r'Manufacturer:\s*(.*?)\n',
+    'Model': r'Model:\s*(.*?)\n',
+    'Kitchen': r'Kitchen:\s*(.*?)\n',
+    'Line': r'Line:\s*(.*?)(?:\n|$)'
+}
+
+def legacy_extract_fields(description):
+    if not description:
+        return dict.fromkeys(LEGACY_PATTERNS, NOT_AVAILABLE)
+    extracted_data = {}
+    for field, pattern in LEGACY_PATTERNS.items():
+        match = re.search(pattern, description)
+        extracted_data[field] = match.group(1) if match else NOT_AVAILABLE
+    return extracted_data
+
+def synthetic_descriptions(count, seed):
+    rng = random.Random(seed)
+    descriptions = []
+    for index in range(count):
+        if index % 20 == 0:
+            descriptions.append(None)
+            continue
+        lines = [f'{label}: {label.split()[0]} {rng.randrange(1000)}' for label in DEFAULT_FIELDS if rng.random() > 0.1]
+        if rng.random() < 0.05:
+            lines.append(f'{rng.choice(DEFAULT_FIELDS)}:')
+        lines.insert(rng.randrange(len(lines) + 1), f'Notes: installed {rng.randrange(2015, 2026)}')
+        rng.shuffle(lines)
+        text = '\n'.join(lines)
+        descriptions.append(text + '\n' if index % 2 else text)
+    return descriptions
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000, help='descriptions to parse')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    descriptions = synthetic_descriptions(args.count, args.seed)
+    series = pd.Series(descriptions)
+    fields = DescriptionParser()
+    columns = list(DEFAULT_FIELDS)
+
+    runs = {
+        'legacy_loop': lambda: pd.DataFrame([legacy_extract_fields(d) for d in descriptions], columns=columns),
+        'parse': lambda: pd.DataFrame([fields.parse(d) for d in descriptions], columns=columns),
+        'parse_many': lambda: pd.DataFrame(fields.parse_many(descriptions), columns=columns),
+        'parse_series': lambda: fields.parse_series(series)
+    }
+    report = {'count': args.count, 'pyarrow': description_parser.pyarrow is not None, 'seconds': {}}
+    frames = {}
+    for name, run in runs.items():
+        seconds, frames[name] = best_of(args.repeat, run)
+        report['seconds'][name] = round(seconds, 3)
+    report['descriptions_per_second'] = {name: round(args.count / seconds) for name, seconds in report['seconds'].items()}
+    report['speedup_over_legacy'] = {
+        name: round(report['seconds']['legacy_loop'] / seconds, 2) for name, seconds in report['seconds'].items()
+    }
+
+    new = frames['parse_series']
+    for name in ('parse', 'parse_many'):
+        # Values only: the constructor and str.extract pick different string dtypes
+        if not (frames[name].to_numpy() == new.to_numpy()).all():
+            raise RuntimeError(f'{name} and parse_series disagree')
+    legacy = frames['legacy_loop']
+    report['fields_only_new_parser_finds'] = int(((legacy == NOT_AVAILABLE) & (new != NOT_AVAILABLE)).sum().sum())
+    report['fields_that_differ'] = int((legacy != new).sum().sum())
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
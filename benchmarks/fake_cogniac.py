@@ -0,0 +1,359 @@
+"""Local stand-in for the parts of the Cogniac API the upload service and camera scripts use
+
+Counts every request by route, every response by status and every TCP
+connection, so round trips per image and connection reuse can be measured:
+
+    python benchmarks/fake_cogniac.py --port 8900 --latency 0.05 --error-rate 0.01 --rate-limit 200
+    COG_URL_PREFIX=http://127.0.0.1:8900 COG_USER=x COG_PASS=x COG_TENANT=t python devserver.py
+    curl http://127.0.0.1:8900/_stats
+
+--tenants gives the user that many tenants, each with --cameras network
+cameras, listed a page at a time when the client passes limit.
+
+--error-rate answers that fraction of media and camera requests with a 500;
+--rate-limit answers 429 with Retry-After once more than that many of them
+arrive per second. Login requests are never failed or throttled. POST
+/_reset clears the counters.
+
+The bulk association route, /1/subjects/<uid>/mediaAssociate, is not part
+of the Cogniac API or SDK. Like the real API, the fake answers it with a
+404 unless started with --bulk, which is only for exercising the service's
+ASSOCIATE_BULK_PATH against an API that has such a call.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeCogniac:
+    """In-memory state shared by all request handlers"""
+
+    def __init__(self, bulk=False, bulk_error_rate=0.0, latency=0.0, error_rate=0.0, rate_limit=0.0, cameras=50,
+                 tenants=1):
+        self.bulk = bulk
+        self.latency = latency
+        self.bulk_error_rate = bulk_error_rate
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.media = set()
+        self.associations = {}
+        self.upload_sessions = {}
+        self.counts = {}
+        self.statuses = {}
+        self.connections = 0
+        # Token bucket for --rate-limit, holding up to one second of requests
+        self.tokens = rate_limit
+        self.refilled_at = time.monotonic()
+        self.tenants = [{'tenant_id': 'fake_tenant', 'name': 'Fake Tenant'}] + [
+            {'tenant_id': f'fake_tenant_{number}', 'name': f'Fake Tenant {number}'} for number in range(1, tenants)
+        ]
+        # tenant_id -> network cameras; the first tenant's keep their original ids
+        self.cameras = {}
+        for number, tenant in enumerate(self.tenants):
+            prefix = f"{tenant['tenant_id']}_" if number else ''
+            self.cameras[tenant['tenant_id']] = [
+                {
+                    'network_camera_id': f'{prefix}cam{index}',
+                    'camera_name': f'{prefix}Camera {index}',
+                    'active': index % 3 != 0,
+                    'subject_uid': f'camera_subject_{index}' if index % 5 else None,
+                    'description': f'Site {index % 7} - Zone {index % 4} - {"PTZ" if index % 2 else "Fixed"}'
+                }
+                for index in range(cameras)
+            ]
+
+    def count(self, route):
+        with self.lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def count_status(self, status):
+        with self.lock:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def throttled(self):
+        """Take a token from the bucket; returns seconds until one is available if it is empty"""
+        if not self.rate_limit:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled_at) * self.rate_limit)
+            self.refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate_limit
+
+    def create_media(self):
+        with self.lock:
+            media_id = f'media{next(self.ids)}'
+            self.media.add(media_id)
+        return media_id
+
+    def associate(self, subject_uid, media_id):
+        """Return a capture_id, or None if the media does not exist"""
+        with self.lock:
+            if media_id not in self.media:
+                return None
+            capture_id = f'capture{next(self.ids)}'
+            self.associations.setdefault(subject_uid, set()).add(media_id)
+        return capture_id
+
+    def start_upload(self, file_size):
+        with self.lock:
+            upload_session_id = uuid.uuid4().hex
+            self.upload_sessions[upload_session_id] = file_size
+        return upload_session_id
+
+    def finish_upload(self, upload_session_id):
+        """Return the media_id for a finished resumable upload, or None for an unknown session"""
+        with self.lock:
+            if self.upload_sessions.pop(upload_session_id, None) is None:
+                return None
+        return self.create_media()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': dict(self.counts),
+                'total_requests': sum(self.counts.values()),
+                'responses': dict(self.statuses),
+                'connections': self.connections,
+                'media': len(self.media),
+                'associations': sum(len(media) for media in self.associations.values())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.statuses.clear()
+            self.connections = 0
+
+ROUTES = [
+    ('GET', r'/21/users/mfa/status', 'mfa_status'),
+    ('GET', r'/1/token', 'token'),
+    ('GET', r'/1/tenants/current', 'tenant'),
+    ('GET', r'/1/users/current', 'user'),
+    ('GET', r'/1/users/current/tenants', 'tenants'),
+    ('GET', r'/1/subjects/(?P<subject_uid>[^/]+)', 'get_subject'),
+    ('POST', r'/1/subjects', 'create_subject'),
+    ('POST', r'/1/media', 'create_media'),
+    ('POST', r'/1/media/resumable', 'resumable_upload'),
+    ('POST', r'/1/media/search', 'media_search'),
+    ('GET', r'/1/tenants/current/networkCameras', 'network_cameras'),
+    ('POST', r'/1/subjects/(?P<subject_uid>[^/]+)/media', 'associate'),
+    ('POST', r'/1/subjects/(?P<subject_uid>[^/]+)/mediaAssociate', 'bulk_associate'),
+    ('GET', r'/_stats', 'stats'),
+    ('POST', r'/_reset', 'reset')
+]
+
+# Never failed or throttled, so a client can always log in
+LOGIN_ROUTES = {'mfa_status', 'token', 'tenant', 'user', 'tenants'}
+TEST_ROUTES = {'stats', 'reset'}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeCogniac/1.0'
+
+    def setup(self):
+        super().setup()
+        # One per TCP connection, so keep-alive reuse shows in /_stats
+        self.server.state.count_connection()
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+    def dispatch(self, method):
+        path = self.path.split('?', 1)[0]
+        for route_method, pattern, name in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if name in TEST_ROUTES:
+                    return self.respond(*getattr(self, 'handle_' + name)(body))
+                state = self.server.state
+                state.count(name)
+                if name not in LOGIN_ROUTES:
+                    retry_after = state.throttled()
+                    if retry_after is not None:
+                        return self.respond(429, {'message': 'Rate limit exceeded'},
+                                            {'Retry-After': str(math.ceil(retry_after))})
+                if state.latency:
+                    time.sleep(state.latency)
+                if name not in LOGIN_ROUTES and random.random() < state.error_rate:
+                    return self.respond(500, {'message': 'Injected server error'})
+                status, payload = getattr(self, 'handle_' + name)(body, **match.groupdict())
+                return self.respond(status, payload)
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.respond(404, {'message': f'No route for {method} {path}'})
+
+    def respond(self, status, payload, headers=None):
+        if self.path.split('?', 1)[0] not in ('/_stats', '/_reset'):
+            self.server.state.count_status(status)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_mfa_status(self, body):
+        return 200, {}
+
+    def query(self):
+        return {name: values[0] for name, values in parse_qs(self.path.partition('?')[2]).items()}
+
+    def handle_token(self, body):
+        # The token names its tenant, so tenant-scoped routes know whose data to return
+        tenant_id = self.query().get('tenant_id', 'fake_tenant')
+        return 200, {'access_token': f'fake-token:{tenant_id}', 'expires_in': 3600}
+
+    def handle_tenant(self, body):
+        return 200, {'tenant_id': 'fake_tenant', 'name': 'Fake Tenant', 'region': None}
+
+    def handle_user(self, body):
+        return 200, {'user_id': 'fake_user', 'given_name': 'Fake', 'surname': 'User', 'email': 'fake@example.com'}
+
+    def handle_tenants(self, body):
+        return 200, {'tenants': self.server.state.tenants}
+
+    def handle_get_subject(self, body, subject_uid):
+        return 200, {'subject_uid': subject_uid, 'name': subject_uid}
+
+    def handle_create_subject(self, body):
+        return 200, {'subject_uid': 'fake_subject', 'name': 'Fake Subject'}
+
+    def handle_create_media(self, body):
+        return 200, {'media_id': self.server.state.create_media()}
+
+    def handle_resumable_upload(self, body):
+        """The SDK's multipart upload for files over 12MB: start, transfer each chunk, finish"""
+        state = self.server.state
+        if not self.headers.get('Content-Type', '').startswith('application/json'):
+            # A 'transfer' chunk, sent as multipart form data
+            return 200, {}
+        data = json.loads(body or b'{}')
+        if data.get('upload_phase') == 'start':
+            return 200, {'upload_session_id': state.start_upload(data.get('file_size')), 'chunk_size': 4 * 1024 * 1024}
+        if data.get('upload_phase') == 'finish':
+            media_id = state.finish_upload(data.get('upload_session_id'))
+            if media_id is None:
+                return 404, {'message': 'Unknown upload_session_id'}
+            return 200, {'media_id': media_id}
+        return 400, {'message': f"Unknown upload_phase {data.get('upload_phase')}"}
+
+    def handle_media_search(self, body):
+        """Media of a subject: whatever was associated here, plus a stand-in item for every other camera subject"""
+        state = self.server.state
+        data = json.loads(body or b'{}')
+        subject_uid = data.get('subject_uid')
+        with state.lock:
+            media = sorted(state.associations.get(subject_uid, ()))
+        if not media and subject_uid and subject_uid.startswith('camera_subject_') \
+                and int(subject_uid.rsplit('_', 1)[1]) % 2 == 0:
+            media = [f'{subject_uid}_media']
+        return 200, {'media': [{'media_id': media_id} for media_id in media[:data.get('size') or None]]}
+
+    def handle_network_cameras(self, body):
+        """Cameras of the token's tenant, in pages of limit starting at start when limit is given"""
+        token = self.headers.get('Authorization', '').rpartition(' ')[2]
+        cameras = self.server.state.cameras.get(token.partition(':')[2] or 'fake_tenant', [])
+        query = self.query()
+        if 'limit' not in query:
+            return 200, {'data': cameras}
+        limit, start = int(query['limit']), int(query.get('start', 0))
+        paging = {}
+        if start + limit < len(cameras):
+            next_query = urlencode({'limit': limit, 'start': start + limit})
+            paging['next'] = f"http://{self.headers['Host']}/1/tenants/current/networkCameras?{next_query}"
+        return 200, {'data': cameras[start:start + limit], 'paging': paging}
+
+    def handle_associate(self, body, subject_uid):
+        media_id = json.loads(body or b'{}').get('media_id')
+        capture_id = self.server.state.associate(subject_uid, media_id)
+        if capture_id is None:
+            return 404, {'message': f'Unknown media_id {media_id}'}
+        return 200, {'capture_id': capture_id}
+
+    def handle_bulk_associate(self, body, subject_uid):
+        state = self.server.state
+        if not state.bulk:
+            return 404, {'message': 'Not found'}
+        results = []
+        for entry in json.loads(body or b'{}').get('media', []):
+            media_id = entry.get('media_id')
+            capture_id = None
+            if random.random() >= state.bulk_error_rate:
+                capture_id = state.associate(subject_uid, media_id)
+            if capture_id is None:
+                results.append({'media_id': media_id, 'error': 'Association failed'})
+            else:
+                results.append({'media_id': media_id, 'capture_id': capture_id})
+        return 200, {'results': results}
+
+    def handle_stats(self, body):
+        return 200, self.server.state.stats()
+
+    def handle_reset(self, body):
+        self.server.state.reset()
+        return 200, {}
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once; the default backlog of 5 drops some
+    request_queue_size = 128
+
+def serve(port=8900, bulk=False, bulk_error_rate=0.0, latency=0.0, error_rate=0.0, rate_limit=0.0, cameras=50,
+          tenants=1):
+    """Start the fake API on a background thread and return the server"""
+    server = Server(('127.0.0.1', port), Handler)
+    server.state = FakeCogniac(bulk=bulk, bulk_error_rate=bulk_error_rate, latency=latency,
+                               error_rate=error_rate, rate_limit=rate_limit, cameras=cameras, tenants=tenants)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--bulk', action='store_true',
+                        help='serve the hypothetical bulk association endpoint instead of answering 404')
+    parser.add_argument('--bulk-error-rate', type=float, default=0.0,
+                        help='fraction of media the bulk endpoint reports as failed')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of media and camera requests answered with a 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='media and camera requests per second before answering 429 (0 = unlimited)')
+    parser.add_argument('--cameras', type=int, default=50, help='number of network cameras per tenant')
+    parser.add_argument('--tenants', type=int, default=1, help='number of tenants the user belongs to')
+    args = parser.parse_args()
+
+    server = serve(args.port, bulk=args.bulk, bulk_error_rate=args.bulk_error_rate, latency=args.latency,
+                   error_rate=args.error_rate, rate_limit=args.rate_limit, cameras=args.cameras, tenants=args.tenants)
+    print(f'Fake Cogniac API listening on http://127.0.0.1:{args.port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
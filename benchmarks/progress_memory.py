@@ -0,0 +1,90 @@
+"""Measure what tracking batch progress costs per file, in memory and on disk
+
+Fills a fresh job store with batches of folder-style results, then reports
+Python heap growth (tracemalloc) and database bytes per tracked file, and
+what eviction to an archive leaves behind:
+
+    python benchmarks/progress_memory.py --files 10000 50000 200000
+
+Heap per file should stay flat as --files grows: progress lives in SQLite,
+not in per-process dicts.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_store import JobStore, _compact
+
+def database_bytes(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) if os.path.isdir(path) else 0
+
+def run(files, batch_size, workdir):
+    path = os.path.join(workdir, f'jobs_{files}.sqlite3')
+    archive_dir = os.path.join(workdir, f'archive_{files}')
+    store = JobStore(path)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    verbose_bytes = compact_bytes = 0
+    for batch_index in range(0, files, batch_size):
+        batch_id = f'bench_{batch_index}'
+        count = min(batch_size, files - batch_index)
+        items = [(f'IMG_{seq:06d}.jpg', f'/data/cameras/site-{batch_index}/IMG_{seq:06d}.jpg') for seq in range(count)]
+        store.create_batch(batch_id, 'folder', ['benchmark'], items, {'folder_path': '/data/cameras'})
+        for seq, (filename, _) in enumerate(items):
+            result = {'filename': filename, 'status': 'success', 'media_id': f'{batch_index:08x}{seq:08x}'}
+            verbose_bytes += len(json.dumps(result))
+            compact_bytes += len(_compact(result, filename))
+            store.record_result(batch_id, seq, result)
+        store.finish_batch(batch_id)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    store._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    stored = database_bytes(path)
+
+    evicted = store.evict_finished(max_batches=0, archive_dir=archive_dir)
+    # Freed pages are reused by later batches; vacuum only to show what is left
+    store._conn.execute('VACUUM')
+    store._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return {
+        'files': files,
+        'results_per_second': round(files / elapsed),
+        'heap_bytes_per_file': round((current - baseline) / files, 2),
+        'peak_heap_bytes': peak - baseline,
+        'result_json_bytes_per_file': {
+            'verbose': round(verbose_bytes / files, 1),
+            'compact': round(compact_bytes / files, 1)
+        },
+        'db_bytes_per_file': round(stored / files, 1),
+        'evicted_batches': len(evicted),
+        'db_bytes_after_eviction': database_bytes(path),
+        'archive_bytes_per_file': round(directory_bytes(archive_dir) / files, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = [run(files, args.batch_size, workdir) for files in args.files]
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
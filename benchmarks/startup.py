@@ -0,0 +1,94 @@
+"""Measure how long the upload service takes to start and to finish its first upload
+
+Each run starts a fresh interpreter against benchmarks/fake_cogniac.py and
+times importing the app, the first /health answer, the first 200 from /ready
+(which starts the Cogniac login in the background) and the first /upload:
+
+    python benchmarks/startup.py --runs 5 --latency 0.2
+
+--latency adds that many seconds to every fake API request, standing in for
+the round trips to the real service.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import fake_cogniac
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; prints one JSON line of timings
+CHILD = r'''
+import io, json, os, time
+started = time.perf_counter()
+import wsgi as main
+imported = time.perf_counter()
+client = main.app.test_client()
+assert client.get('/health').status_code == 200
+healthy = time.perf_counter()
+while client.get('/ready').status_code != 200:
+    time.sleep(0.01)
+ready = time.perf_counter()
+response = client.post('/upload', data={'image': (io.BytesIO(os.urandom(2048)), 'startup.jpg')})
+assert response.status_code == 200, response.get_json()
+uploaded = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_health': healthy - started,
+    'ready': ready - started,
+    'first_upload': uploaded - started
+}))
+'''
+
+def run_once(port, workdir):
+    env = dict(
+        os.environ,
+        COG_URL_PREFIX=f'http://127.0.0.1:{port}',
+        COG_USER='benchmark',
+        COG_PASS='benchmark',
+        COG_TENANT='benchmark',
+        JOB_DB_PATH=os.path.join(workdir, 'jobs.sqlite3'),
+        DEDUP_DB_PATH=os.path.join(workdir, 'dedup_index.sqlite3'),
+        UPLOAD_SESSION_DIR=os.path.join(workdir, 'upload_sessions'),
+        PYTHONPATH=REPO_DIR
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=workdir,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API request')
+    parser.add_argument('--port', type=int, default=8901)
+    args = parser.parse_args()
+
+    server = fake_cogniac.serve(args.port, latency=args.latency)
+    runs = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            runs.append(run_once(args.port, workdir))
+    server.shutdown()
+
+    report = {
+        'runs': args.runs,
+        'api_latency': args.latency,
+        'median_seconds': {
+            name: round(statistics.median(run[name] for run in runs), 4)
+            for name in runs[0]
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
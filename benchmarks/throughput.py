@@ -0,0 +1,272 @@
+"""End-to-end throughput of the upload service against benchmarks/fake_cogniac.py
+
+Starts the fake API in this process and, for each scenario, a fresh upload
+service in a child process, then drives /upload, /batch-upload or
+/upload-folder with unique random images. For each scenario it reports
+images per second, p50/p99 latency (per request for /upload, from submission
+to completion for each batch otherwise), the service's peak RSS, and fake
+API requests and responses per image:
+
+    python benchmarks/throughput.py --images 500 --latency 0.05 --save
+    python benchmarks/throughput.py --images 500 --latency 0.05 --compare benchmarks/results/<earlier>.json
+
+--save writes the report to benchmarks/results/, named by time and git
+commit. --compare flags every metric more than --tolerance worse than the
+saved report and exits non-zero if any is.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fake_cogniac
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+SCENARIOS = ('upload', 'batch', 'folder')
+
+# Metric -> True if higher is better
+METRICS = {
+    'images_per_second': True,
+    'latency_p50': False,
+    'latency_p99': False,
+    'peak_rss_mb': False,
+    'requests_per_image': False
+}
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def peak_rss_mb(pid):
+    """High-water resident set size of a running process, from /proc (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Service:
+    """The upload service on the development server in a child process, with its own state directory"""
+
+    def __init__(self, api_port, port, workdir):
+        self.url = f'http://127.0.0.1:{port}'
+        env = dict(
+            os.environ,
+            COG_URL_PREFIX=f'http://127.0.0.1:{api_port}',
+            COG_USER='benchmark',
+            COG_PASS='benchmark',
+            COG_TENANT='benchmark',
+            JOB_DB_PATH=os.path.join(workdir, 'jobs.sqlite3'),
+            DEDUP_DB_PATH=os.path.join(workdir, 'dedup_index.sqlite3'),
+            UPLOAD_SESSION_DIR=os.path.join(workdir, 'upload_sessions'),
+            PYTHONPATH=REPO_DIR
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', f'import wsgi; wsgi.app.run(port={port}, threaded=True)'],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Upload service exited with status {self.process.returncode}')
+            try:
+                if requests.get(self.url + '/ready', timeout=5).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError('Upload service did not become ready')
+
+    def stop(self):
+        peak = peak_rss_mb(self.process.pid)
+        self.process.terminate()
+        self.process.wait(timeout=30)
+        return peak
+
+def wait_for_batch(session, url, batch_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = session.get(f'{url}/batch-status/{batch_id}', params={'summary': 1}).json()
+        if status['status'] != 'processing':
+            return status
+        time.sleep(0.05)
+    raise RuntimeError(f'Batch {batch_id} did not finish within {timeout} seconds')
+
+def run_upload(url, images, concurrency, timeout):
+    def send(index):
+        started = time.perf_counter()
+        response = requests.post(f'{url}/upload', files={'image': (f'bench_{index}.jpg', images[index])},
+                                 timeout=timeout)
+        return time.perf_counter() - started, response.status_code == 200
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, range(len(images))))
+
+def run_batch(url, images, concurrency, timeout, batch_size):
+    def send(first):
+        with requests.Session() as session:
+            started = time.perf_counter()
+            files = [('images', (f'bench_{index}.jpg', images[index]))
+                     for index in range(first, min(first + batch_size, len(images)))]
+            response = session.post(f'{url}/batch-upload', files=files, timeout=timeout)
+            response.raise_for_status()
+            status = wait_for_batch(session, url, response.json()['batch_id'], timeout)
+            return time.perf_counter() - started, status['failed'] == 0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, range(0, len(images), batch_size)))
+
+def run_folder(url, images, concurrency, timeout, batch_size, workdir):
+    folders = []
+    for first in range(0, len(images), batch_size):
+        folder = os.path.join(workdir, f'folder_{first}')
+        os.makedirs(folder)
+        for index in range(first, min(first + batch_size, len(images))):
+            with open(os.path.join(folder, f'bench_{index}.jpg'), 'wb') as f:
+                f.write(images[index])
+        folders.append(folder)
+
+    def send(folder):
+        with requests.Session() as session:
+            started = time.perf_counter()
+            response = session.post(f'{url}/upload-folder', json={'folder_path': folder}, timeout=timeout)
+            response.raise_for_status()
+            status = wait_for_batch(session, url, response.json()['batch_id'], timeout)
+            return time.perf_counter() - started, status['failed'] == 0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, folders))
+
+def run_scenario(name, args):
+    api_url = f'http://127.0.0.1:{args.api_port}'
+    # Unique bytes per image, so the service's duplicate detection never skips an upload
+    images = [os.urandom(args.image_kb * 1024) for _ in range(args.images)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        service = Service(args.api_port, args.port, workdir)
+        try:
+            service.wait_ready()
+            requests.post(api_url + '/_reset')
+            started = time.perf_counter()
+            if name == 'upload':
+                timings = run_upload(service.url, images, args.concurrency, args.timeout)
+            elif name == 'batch':
+                timings = run_batch(service.url, images, args.concurrency, args.timeout, args.batch_size)
+            else:
+                timings = run_folder(service.url, images, args.concurrency, args.timeout, args.batch_size, workdir)
+            elapsed = time.perf_counter() - started
+            stats = requests.get(api_url + '/_stats').json()
+        finally:
+            peak = service.stop()
+
+    latencies = [latency for latency, _ in timings]
+    return {
+        'images': len(images),
+        'images_per_second': round(len(images) / elapsed, 1),
+        'latency_p50': round(percentile(latencies, 50), 4),
+        'latency_p99': round(percentile(latencies, 99), 4),
+        'failed_requests': sum(1 for _, ok in timings if not ok),
+        'peak_rss_mb': peak,
+        'requests_per_image': round(stats['total_requests'] / len(images), 2),
+        'api_requests': stats['requests'],
+        'api_responses': stats['responses']
+    }
+
+def compare(report, baseline, tolerance):
+    """Return (scenario, metric, baseline, current) for every metric worse than baseline by more than tolerance"""
+    regressions = []
+    for scenario, results in report['scenarios'].items():
+        previous = baseline['scenarios'].get(scenario)
+        if previous is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            current, before = results.get(metric), previous.get(metric)
+            if current is None or not before:
+                continue
+            change = (current - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append((scenario, metric, before, current))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--images', type=int, default=200, help='images per scenario')
+    parser.add_argument('--image-kb', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=50, help='images per /batch-upload request or folder')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests or batches in flight at once')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake media requests answered 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fake media requests per second before 429s')
+    parser.add_argument('--api-port', type=int, default=8902)
+    parser.add_argument('--port', type=int, default=8903)
+    parser.add_argument('--save', action='store_true', help='write the report to benchmarks/results/')
+    parser.add_argument('--compare', metavar='REPORT', help='a saved report to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed fractional slowdown before flagging')
+    args = parser.parse_args()
+
+    server = fake_cogniac.serve(args.api_port, latency=args.latency, error_rate=args.error_rate,
+                                rate_limit=args.rate_limit)
+    try:
+        scenarios = {name: run_scenario(name, args) for name in args.scenarios}
+    finally:
+        server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            name: getattr(args, name)
+            for name in ('images', 'image_kb', 'batch_size', 'concurrency', 'latency', 'error_rate', 'rate_limit')
+        },
+        'scenarios': scenarios
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"throughput-{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'unknown'}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print('Warning: the baseline was run with a different configuration')
+        regressions = compare(report, baseline, args.tolerance)
+        for scenario, metric, before, current in regressions:
+            print(f'REGRESSION {scenario} {metric}: {before} -> {current}')
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {baseline.get('commit')}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import Future
+
+class BulkAssociator:
+    """Associates media with a subject in groups instead of one request per media
+
+    Callers block in associate() until their group is sent, which happens once
+    max_size media are waiting or max_wait seconds after the first one joined.
+    associate_many(media_ids) makes one bulk request and returns
+    {media_id: capture_id} for the media it associated. Media missing from that
+    answer, or in a group whose request failed, are associated one at a time
+    with associate_one(media_id) on the caller's own thread, so each file gets
+    its own result or error. If the bulk request is rejected as unsupported
+    (404/405), or max_failures groups in a row fail for any reason or get no
+    media associated, every later association goes straight to
+    associate_one(). Callers with nothing to group with, such as a single
+    interactive upload, pass group=False and skip the wait.
+    """
+
+    def __init__(self, associate_many, associate_one, max_size=25, max_wait=0.25, max_failures=3):
+        self.associate_many = associate_many
+        self.associate_one = associate_one
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.max_failures = max_failures
+        self.supported = max_size > 1
+        self._lock = threading.Lock()
+        self._group = None
+        self._consecutive_failures = 0
+        self._stats = {
+            'groups': 0,
+            'grouped_media': 0,
+            'group_failures': 0,
+            'single_requests': 0,
+            'total_group_latency': 0.0
+        }
+
+    def associate(self, media_id, group=True):
+        """Associate one media with the subject; returns its capture_id"""
+        if group and self.supported:
+            capture_id = self._join_group(media_id).result()
+            if capture_id is not None:
+                return capture_id
+        with self._lock:
+            self._stats['single_requests'] += 1
+        return self.associate_one(media_id)
+
+    def _join_group(self, media_id):
+        future = Future()
+        with self._lock:
+            group = self._group
+            if group is None:
+                group = self._group = {'entries': [], 'sent': False}
+                timer = threading.Timer(self.max_wait, self._flush, args=(group,))
+                timer.daemon = True
+                timer.start()
+            group['entries'].append((media_id, future))
+            full = len(group['entries']) >= self.max_size
+        if full:
+            # This caller filled the group; send it now rather than waiting for the timer
+            self._flush(group)
+        return future
+
+    def _flush(self, group):
+        with self._lock:
+            # The timer and a full group may both try to send the same group
+            if group['sent']:
+                return
+            group['sent'] = True
+            if self._group is group:
+                self._group = None
+            entries = group['entries']
+
+        started = time.monotonic()
+        error = None
+        try:
+            capture_ids = self.associate_many([media_id for media_id, _ in entries])
+        except Exception as e:
+            capture_ids = {}
+            error = e
+
+        with self._lock:
+            if capture_ids:
+                self._consecutive_failures = 0
+            else:
+                self._stats['group_failures'] += 1
+                self._consecutive_failures += 1
+                unsupported = getattr(error, 'status_code', None) in (404, 405)
+                if self.supported and (unsupported or self._consecutive_failures >= self.max_failures):
+                    self.supported = False
+                    reason = str(error) if error is not None else 'no media were associated'
+                    print(f"Bulk association is not working; associating media one at a time: {reason}")
+            self._stats['groups'] += 1
+            self._stats['grouped_media'] += len(entries)
+            self._stats['total_group_latency'] += time.monotonic() - started
+        for media_id, future in entries:
+            future.set_result(capture_ids.get(media_id))
+
+    def snapshot(self):
+        """Return group sizes and how many media needed a request of their own"""
+        with self._lock:
+            groups = self._stats['groups']
+            return {
+                'enabled': self.supported,
+                'max_size': self.max_size,
+                'max_wait': self.max_wait,
+                'groups': groups,
+                'group_failures': self._stats['group_failures'],
+                'avg_group_size': round(self._stats['grouped_media'] / groups, 2) if groups else 0.0,
+                'avg_group_latency': round(self._stats['total_group_latency'] / groups, 3) if groups else 0.0,
+                'single_requests': self._stats['single_requests']
+            }
@@ -0,0 +1,254 @@
+import csv
+import json
+import sqlite3
+import threading
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# The camera fields whose change means a camera's row has to be worked out again
+TRACKED_FIELDS = ('description', 'active', 'subject_uid')
+# Data rows per Excel sheet, below the format's limit of 1,048,576 rows including the header
+EXCEL_SHEET_ROWS = 1048575
+
+def camera_state(camera):
+    return {field: camera.get(field) for field in TRACKED_FIELDS}
+
+class CameraSnapshot:
+    """The cameras a script saw on its previous run and the row it wrote for each
+
+    Keyed by (tenant_id, network_camera_id). A run compares each camera with
+    compare(), stores what it wrote with record() and calls finish(), which
+    drops cameras that were not seen again and returns them. Everything a
+    run records is one transaction, committed by finish(), so an interrupted
+    run leaves the previous snapshot as it was.
+
+    With max_age, a row worked out more than max_age seconds ago is not
+    offered for reuse, even if its camera is unchanged; record() with
+    reused=True keeps the time the row was worked out.
+    """
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cameras ('
+            ' tenant_id TEXT NOT NULL,'
+            ' camera_id TEXT NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' row TEXT NOT NULL,'
+            ' run_id INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' row_at REAL NOT NULL DEFAULT 0,'
+            ' PRIMARY KEY (tenant_id, camera_id))'
+        )
+        # Snapshots from before rows were timed count as too old to reuse
+        if 'row_at' not in [column[1] for column in self._conn.execute('PRAGMA table_info(cameras)')]:
+            self._conn.execute('ALTER TABLE cameras ADD COLUMN row_at REAL NOT NULL DEFAULT 0')
+        self.run_id = (self._conn.execute('SELECT MAX(run_id) FROM cameras').fetchone()[0] or 0) + 1
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def compare(self, tenant_id, camera):
+        """Return (change, changed_fields, previous_row)
+
+        change is 'added', 'changed' or 'unchanged'; previous_row is None
+        unless the camera is unchanged and its row is within max_age.
+        """
+        with self._lock:
+            found = self._conn.execute(
+                'SELECT state, row, row_at FROM cameras WHERE tenant_id = ? AND camera_id = ?',
+                (tenant_id, camera['network_camera_id'])
+            ).fetchone()
+        if found is None:
+            return 'added', list(TRACKED_FIELDS), None
+        previous, state = json.loads(found[0]), camera_state(camera)
+        changed = [field for field in TRACKED_FIELDS if previous.get(field) != state[field]]
+        if changed:
+            return 'changed', changed, None
+        if self.max_age is not None and found[2] + self.max_age < time.time():
+            return 'unchanged', [], None
+        return 'unchanged', [], json.loads(found[1])
+
+    def record(self, tenant_id, camera, row, reused=False):
+        """Store the row written for a camera; reused=True if it is the previous_row compare() returned"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO cameras (tenant_id, camera_id, state, row, run_id, updated_at, row_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (tenant_id, camera_id) DO UPDATE SET state = excluded.state, row = excluded.row, '
+                'run_id = excluded.run_id, updated_at = excluded.updated_at, '
+                'row_at = CASE WHEN ? THEN cameras.row_at ELSE excluded.row_at END',
+                (tenant_id, camera['network_camera_id'], json.dumps(camera_state(camera)), json.dumps(row),
+                 self.run_id, now, now, int(reused))
+            )
+
+    def finish(self):
+        """Commit this run and return the rows of cameras that were not seen in it, which are dropped"""
+        with self._lock:
+            removed = [
+                (tenant_id, camera_id, json.loads(row)) for tenant_id, camera_id, row in self._conn.execute(
+                    'SELECT tenant_id, camera_id, row FROM cameras WHERE run_id != ? ORDER BY tenant_id, camera_id',
+                    (self.run_id,)
+                )
+            ]
+            self._conn.execute('DELETE FROM cameras WHERE run_id != ?', (self.run_id,))
+            self._conn.execute('COMMIT')
+        return removed
+
+    def close(self):
+        """Close without committing, keeping the previous snapshot"""
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            self._conn.close()
+
+class CsvRowWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+class ParquetRowWriter:
+    """Buffers batch_rows rows at a time and writes each batch as a row group"""
+
+    def __init__(self, path, columns, batch_rows=10000):
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self._schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            columns = {column: [None if row.get(column) is None else str(row[column]) for row in self._rows]
+                       for column in self.columns}
+            self._writer.write_table(pyarrow.table(columns, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+class ExcelRowWriter:
+    """Streams rows into a write-only workbook, starting a new sheet when one is full"""
+
+    def __init__(self, path, columns, sheet_name='Cameras'):
+        self.path = path
+        self.columns = columns
+        self.sheet_name = sheet_name
+        self._workbook = Workbook(write_only=True)
+        self._sheets = 0
+        self._sheet = None
+        self._sheet_rows = 0
+
+    def write(self, row):
+        if self._sheet is None or self._sheet_rows >= EXCEL_SHEET_ROWS:
+            self._sheets += 1
+            self._sheet = self._workbook.create_sheet(
+                self.sheet_name if self._sheets == 1 else f'{self.sheet_name} {self._sheets}'
+            )
+            self._sheet.append(self.columns)
+            self._sheet_rows = 0
+        self._sheet.append([row.get(column) for column in self.columns])
+        self._sheet_rows += 1
+
+    def close(self):
+        if self._sheet is None:
+            self._workbook.create_sheet(self.sheet_name).append(self.columns)
+        self._workbook.save(self.path)
+
+# Output format, which is also the file extension -> writer
+ROW_WRITERS = {
+    'csv': CsvRowWriter,
+    'parquet': ParquetRowWriter,
+    'xlsx': ExcelRowWriter
+}
+
+def check_output_formats(formats):
+    """Raise ValueError if a format is unknown or the library it needs is not installed"""
+    unknown = [name for name in formats if name not in ROW_WRITERS]
+    if unknown:
+        raise ValueError(f"Unknown output format(s) {', '.join(unknown)}; use {', '.join(ROW_WRITERS)}")
+    if not formats:
+        raise ValueError(f"No output format given; use {', '.join(ROW_WRITERS)}")
+    if 'parquet' in formats and pyarrow is None:
+        raise ValueError('Parquet output requires pyarrow')
+    if 'xlsx' in formats and Workbook is None:
+        raise ValueError('Excel output requires openpyxl')
+
+class RowWriters:
+    """Writes each row to one file per output format as it arrives"""
+
+    def __init__(self, stem, formats, columns):
+        check_output_formats(formats)
+        self.paths = []
+        self._writers = []
+        try:
+            for name in formats:
+                path = f'{stem}.{name}'
+                self._writers.append(ROW_WRITERS[name](path, columns))
+                self.paths.append(path)
+        except Exception:
+            self.close()
+            raise
+        self.rows = 0
+
+    def write(self, row):
+        for writer in self._writers:
+            writer.write(row)
+        self.rows += 1
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+class DiffReport:
+    """CSV of the cameras added, changed or removed since the previous snapshot, written as they are found"""
+
+    COLUMNS = ['Change', 'Tenant', 'Camera ID', 'Camera', 'Changed fields']
+
+    def __init__(self, path):
+        self.path = path
+        self.counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        self._writer = CsvRowWriter(path, self.COLUMNS)
+
+    def add(self, change, tenant, camera_id, camera_name, changed_fields=()):
+        self.counts[change] += 1
+        if change != 'unchanged':
+            self._writer.write({
+                'Change': change,
+                'Tenant': tenant,
+                'Camera ID': camera_id,
+                'Camera': camera_name,
+                'Changed fields': ', '.join(changed_fields)
+            })
+
+    def close(self):
+        self._writer.close()
+
+    def summary(self):
+        return ', '.join(f'{count} {change}' for change, count in self.counts.items())
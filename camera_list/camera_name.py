@@ -1,73 +1,133 @@
-import requests
-import pandas as pd
 import os
+import sys
+import time
 from datetime import datetime
 
+import requests
+
+# The shared Cogniac client and inventory helpers live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cogniac_rest import API_BASE, TOKEN_CACHE_PATH, CogniacRestClient, map_ordered
+from camera_inventory import CameraSnapshot, DiffReport, RowWriters, check_output_formats
+
 # === CONFIGURATION ===
-username = "Cogniac username"  # 🔁 Replace with your Cogniac username
-password = "Cogniac password"  # 🔁 Replace with your Cogniac password
-API_BASE = "https://api.cogniac.io/1"
+username = os.getenv("COG_USER", "Cogniac username")  # 🔁 Replace with your Cogniac username
+password = os.getenv("COG_PASS", "Cogniac password")  # 🔁 Replace with your Cogniac password
+API_BASE = os.getenv("COGNIAC_API_BASE", API_BASE)
+TOKEN_CACHE = os.getenv("COGNIAC_TOKEN_CACHE", TOKEN_CACHE_PATH)  # tokens reused between runs ("" = never cache)
+PAGE_SIZE = int(os.getenv("CAMERA_PAGE_SIZE", 500))  # cameras fetched per request
+
+# === OUTPUT ===
+OUTPUT_FORMATS = [name.strip() for name in os.getenv("OUTPUT_FORMATS", "csv").split(",") if name.strip()]  # csv, parquet, xlsx
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "camera_status.snapshot.sqlite3")  # cameras and results of the last run
+FULL_REFRESH = os.getenv("FULL_REFRESH") == "1"  # check footage of every camera, not just new or changed ones
+FOOTAGE_MAX_AGE = float(os.getenv("FOOTAGE_MAX_AGE", 86400))  # seconds a footage result is reused (0 = always check)
+
+# === MEDIA PROBING ===
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", 16))  # media searches in flight at once
+PROBE_RATE = float(os.getenv("PROBE_RATE", 20))  # API requests started per second (0 = unlimited)
+PROBE_RETRIES = int(os.getenv("PROBE_RETRIES", 3))  # retries per request on 429, 5xx or connection errors
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 30))  # seconds per request
 
 # === TIMESTAMP FOR FILE ===
 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-base_file = "camera_status.xlsx"
-if os.path.exists(base_file):
-    EXCEL_FILE = f"camera_status_{timestamp}.xlsx"
+base_stem = "camera_status"
+check_output_formats(OUTPUT_FORMATS)
+if any(os.path.exists(f"{base_stem}.{name}") for name in OUTPUT_FORMATS):
+    OUTPUT_STEM = f"camera_status_{timestamp}"
 else:
-    EXCEL_FILE = base_file
-
-# === STEP 1: Get Tenant ID ===
-print("🔐 Getting tenant ID...")
-tenants_resp = requests.get(f"{API_BASE}/users/current/tenants", auth=(username, password))
-tenants_resp.raise_for_status()
-tenant_id = tenants_resp.json()['tenants'][0]['tenant_id']
-
-# === STEP 2: Get Access Token ===
-print("🔑 Getting access token...")
-token_resp = requests.get(f"{API_BASE}/token", params={"tenant_id": tenant_id}, auth=(username, password))
-token_resp.raise_for_status()
-access_token = token_resp.json()['access_token']
-headers = {"Authorization": f"Bearer {access_token}"}
-
-# === STEP 3: Fetch Network Cameras ===
-print("📡 Fetching all network cameras...")
-camera_resp = requests.get(f"{API_BASE}/tenants/current/networkCameras", headers=headers)
-camera_resp.raise_for_status()
-cameras = camera_resp.json().get("data", camera_resp.json())
+    OUTPUT_STEM = base_stem
+COLUMNS = ["Tenant", "Cameras name", "Connected to an app", "Footage in Cogniac"]
+
+client = CogniacRestClient(
+    username,
+    password,
+    api_base=API_BASE,
+    workers=PROBE_WORKERS,
+    rate=PROBE_RATE,
+    retries=PROBE_RETRIES,
+    timeout=PROBE_TIMEOUT,
+    token_cache=TOKEN_CACHE or None
+)
+
+# === STEP 1: Get Tenants ===
+print("🔐 Getting tenants...")
+tenants = client.tenants()
+print(f"🏢 Found {len(tenants)} tenant(s)")
+
+# === STEP 2: Stream Network Cameras ===
+# Access tokens are fetched per tenant on first use, or taken from the token cache
+print("📡 Streaming network cameras from all tenants...")
+cameras = client.iter_all_cameras(tenants, page_size=PAGE_SIZE)
+
+# === STEP 3: Compare With the Last Run ===
+snapshot = CameraSnapshot(SNAPSHOT_PATH, max_age=FOOTAGE_MAX_AGE)
+diff = DiffReport(f"{OUTPUT_STEM}_changes.csv")
+
+def compared(cameras):
+    # Runs on this thread as the probes are queued, so the snapshot is only used from here
+    for tenant, cam in cameras:
+        name = cam.get("camera_name", cam.get("network_camera_id"))
+        change, changed_fields, previous_row = snapshot.compare(tenant["tenant_id"], cam)
+        diff.add(change, tenant.get("name", tenant["tenant_id"]), cam["network_camera_id"], name, changed_fields)
+        # Footage that could not be checked last time is checked again; results older than
+        # FOOTAGE_MAX_AGE already come back as None, so a "No" turns into "Yes" once footage arrives
+        if FULL_REFRESH or (previous_row and cam.get("subject_uid") and previous_row["Footage in Cogniac"] == "Unknown"):
+            previous_row = None
+        yield tenant, cam, previous_row
 
 # === STEP 4: Function to Check Media ===
-def has_media(subject_uid, headers):
-    media_url = f"{API_BASE}/media/search"
-    payload = {
-        "subject_uid": subject_uid,
-        "size": 1
-    }
-    response = requests.post(media_url, headers=headers, json=payload)
+def has_media(tenant_id, subject_uid):
+    try:
+        response = client.media_search(tenant_id, subject_uid)
+    except requests.RequestException:
+        return "Unknown"
     if response.status_code == 200:
         media = response.json().get("media", [])
         return "Yes" if media else "No"
     else:
         return "Unknown"
 
-# === STEP 5: Build DataFrame ===
-camera_data = []
-for cam in cameras:
-    name = cam.get("camera_name", cam.get("network_camera_id"))
-    connected = "Yes" if cam.get("active") else "No"
+def camera_row(entry):
+    tenant, cam, previous_row = entry
     subject_uid = cam.get("subject_uid")
-    footage = has_media(subject_uid, headers) if subject_uid else "Unknown"
-
-    camera_data.append({
-        "Cameras name": name,
-        "Connected to an app": connected,
+    reused = previous_row is not None
+    if previous_row is not None:
+        footage = previous_row["Footage in Cogniac"]
+    else:
+        footage = has_media(tenant["tenant_id"], subject_uid) if subject_uid else "Unknown"
+    return tenant, cam, reused, {
+        "Tenant": tenant.get("name", tenant["tenant_id"]),
+        "Cameras name": cam.get("camera_name", cam.get("network_camera_id")),
+        "Connected to an app": "Yes" if cam.get("active") else "No",
         "Footage in Cogniac": footage
-    })
+    }
 
-df = pd.DataFrame(camera_data)
+# === STEP 5: Write Rows as They Come In ===
+print(f"🔎 Checking footage of new and changed cameras ({PROBE_WORKERS} at a time)...")
+probe_started = time.perf_counter()
+output = RowWriters(OUTPUT_STEM, OUTPUT_FORMATS, COLUMNS)
+try:
+    # Rows come back in camera order, however the searches finish
+    for tenant, cam, reused, row in map_ordered(camera_row, compared(cameras), PROBE_WORKERS):
+        output.write(row)
+        # A reused result keeps the time it was checked, so it still ages out
+        snapshot.record(tenant["tenant_id"], cam, row, reused=reused)
+    for tenant_id, camera_id, row in snapshot.finish():
+        diff.add("removed", row.get("Tenant", tenant_id), camera_id, row.get("Cameras name"))
+finally:
+    output.close()
+    diff.close()
+    snapshot.close()
+probe_elapsed = time.perf_counter() - probe_started
 
-# === Write to Excel ===
-print(f"📁 Writing data to file: {EXCEL_FILE}")
-with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl') as writer:
-    df.to_excel(writer, index=False, sheet_name="Cameras")
+latency = client.latency_summary("media_search")
+print(f"⏱️ {output.rows} cameras, {latency['count']} media searches in {probe_elapsed:.1f}s")
+if latency["count"]:
+    print(
+        f"⏱️ Media search latency p50 {latency['p50'] * 1000:.0f}ms, p95 {latency['p95'] * 1000:.0f}ms, "
+        f"p99 {latency['p99'] * 1000:.0f}ms, max {latency['max'] * 1000:.0f}ms"
+    )
+print(f"🗂️ Since the last run: {diff.summary()} (details in {diff.path})")
 
-print("✅ Done! Data saved to Excel.")
+print(f"✅ Done! Data saved to {', '.join(output.paths)}.")
@@ -1,91 +1,107 @@
-import requests
 import pandas as pd
+import itertools
 import os
+import sys
 from datetime import datetime
-import re
+
+# The shared Cogniac client and inventory helpers live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cogniac_rest import API_BASE, TOKEN_CACHE_PATH, CogniacRestClient
+from camera_inventory import CameraSnapshot, DiffReport, RowWriters, check_output_formats
+from description_parser import DEFAULT_FIELDS, DescriptionParser, fields_from_spec
 
 # === CONFIGURATION ===
-username = "Cogniac username"  # 🔁 Replace with your Cogniac username
-password = "Cogniac password"  # 🔁 Replace with your Cogniac password
-API_BASE = "https://api.cogniac.io/1"
+username = os.getenv("COG_USER", "Cogniac username")  # 🔁 Replace with your Cogniac username
+password = os.getenv("COG_PASS", "Cogniac password")  # 🔁 Replace with your Cogniac password
+API_BASE = os.getenv("COGNIAC_API_BASE", API_BASE)
+TOKEN_CACHE = os.getenv("COGNIAC_TOKEN_CACHE", TOKEN_CACHE_PATH)  # tokens reused between runs ("" = never cache)
+PAGE_SIZE = int(os.getenv("CAMERA_PAGE_SIZE", 500))  # cameras fetched per request
+# Description labels to extract, as "Label" or "Column=Label", comma separated
+DESCRIPTION_FIELDS = os.getenv("DESCRIPTION_FIELDS", ",".join(DEFAULT_FIELDS))
+
+# === OUTPUT ===
+OUTPUT_FORMATS = [name.strip() for name in os.getenv("OUTPUT_FORMATS", "csv").split(",") if name.strip()]  # csv, parquet, xlsx
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "camera_description.snapshot.sqlite3")  # cameras and fields of the last run
+FULL_REFRESH = os.getenv("FULL_REFRESH") == "1"  # parse every description, not just new or changed ones
+PARSE_CHUNK = int(os.getenv("PARSE_CHUNK", 10000))  # descriptions parsed together in one vectorized pass
 
 # === TIMESTAMP FOR FILE ===
 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-base_file = "camera_status.xlsx"
-if os.path.exists(base_file):
-    EXCEL_FILE = f"camera_status_{timestamp}.xlsx"
+base_stem = "camera_description"
+check_output_formats(OUTPUT_FORMATS)
+if any(os.path.exists(f"{base_stem}.{name}") for name in OUTPUT_FORMATS):
+    OUTPUT_STEM = f"camera_description_{timestamp}"
 else:
-    EXCEL_FILE = base_file
-
-# === STEP 1: Get Tenant ID ===
-print("🔐 Getting tenant ID...")
-tenants_resp = requests.get(f"{API_BASE}/users/current/tenants", auth=(username, password))
-tenants_resp.raise_for_status()
-tenant_id = tenants_resp.json()['tenants'][0]['tenant_id']
-
-# === STEP 2: Get Access Token ===
-print("🔑 Getting access token...")
-token_resp = requests.get(f"{API_BASE}/token", params={"tenant_id": tenant_id}, auth=(username, password))
-token_resp.raise_for_status()
-access_token = token_resp.json()['access_token']
-headers = {"Authorization": f"Bearer {access_token}"}
-
-# === STEP 3: Fetch Network Cameras ===
-print("📡 Fetching all network cameras...")
-camera_resp = requests.get(f"{API_BASE}/tenants/current/networkCameras", headers=headers)
-camera_resp.raise_for_status()
-cameras = camera_resp.json().get("data", camera_resp.json())
+    OUTPUT_STEM = base_stem
 
-# === STEP 4: Function to Extract Fields from Description ===
-def extract_fields(description):
-    # If description is None, return "Not Available" for all fields
-    if not description:
-        return {
-            "Use case": "Not Available",
-            "Manufacturer": "Not Available",
-            "Model": "Not Available",
-            "Kitchen": "Not Available",
-            "Line": "Not Available"
-        }
+client = CogniacRestClient(username, password, api_base=API_BASE, token_cache=TOKEN_CACHE or None)
+parser = DescriptionParser(fields_from_spec(DESCRIPTION_FIELDS))
+COLUMNS = ["Tenant", "Camera Name"] + parser.columns
 
-    # Define regex patterns for extracting the fields from the description
-    fields = {
-        "Use case": r"Use case:\s*(.*?)\n",
-        "Manufacturer": r"Manufacturer:\s*(.*?)\n",
-        "Model": r"Model:\s*(.*?)\n",
-        "Kitchen": r"Kitchen:\s*(.*?)\n",
-        "Line": r"Line:\s*(.*?)(?:\n|$)"  # Match Line, even if it does not end with newline
-    }
+# === STEP 1: Get Tenants ===
+print("🔐 Getting tenants...")
+tenants = client.tenants()
+print(f"🏢 Found {len(tenants)} tenant(s)")
 
-    # Extract the fields based on the regex patterns
-    extracted_data = {}
-    for field, pattern in fields.items():
-        match = re.search(pattern, description)
-        extracted_data[field] = match.group(1) if match else "Not Available"
+# === STEP 2: Stream Network Cameras ===
+# Access tokens are fetched per tenant on first use, or taken from the token cache
+print("📡 Streaming network cameras from all tenants...")
+cameras = client.iter_all_cameras(tenants, page_size=PAGE_SIZE)
 
-    return extracted_data
+# === STEP 3: Compare With the Last Run ===
+snapshot = CameraSnapshot(SNAPSHOT_PATH)
+diff = DiffReport(f"{OUTPUT_STEM}_changes.csv")
 
-# === STEP 5: Extract Camera Details and Format Description ===
-camera_data = []
-for cam in cameras:
-    name = cam.get("camera_name", cam.get("network_camera_id"))
-    description = cam.get("description", None)  # Extract description (can be None)
+def compared(chunk):
+    entries = []
+    for tenant, cam in chunk:
+        name = cam.get("camera_name", cam.get("network_camera_id"))
+        change, changed_fields, previous_row = snapshot.compare(tenant["tenant_id"], cam)
+        diff.add(change, tenant.get("name", tenant["tenant_id"]), cam["network_camera_id"], name, changed_fields)
+        # Rows from before a field was added to DESCRIPTION_FIELDS are parsed again
+        if FULL_REFRESH or (previous_row and any(column not in previous_row for column in parser.columns)):
+            previous_row = None
+        entries.append((tenant, cam, previous_row))
+    return entries
 
-    # Extract the structured fields from the description
-    fields = extract_fields(description)
+# === STEP 4: Extract Fields and Write Rows ===
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
 
-    # Append the camera name and the extracted fields to the data list
-    camera_data.append({
-        "Camera Name": name,
-        **fields  # Unpack the extracted fields into the dictionary
-    })
+print("🧩 Extracting fields from new and changed descriptions...")
+parsed_count = 0
+output = RowWriters(OUTPUT_STEM, OUTPUT_FORMATS, COLUMNS)
+try:
+    for chunk in chunks(cameras, PARSE_CHUNK):
+        entries = compared(chunk)
+        # Only new and changed descriptions are parsed, all of the chunk's at once
+        stale = [index for index, (_, _, previous_row) in enumerate(entries) if previous_row is None]
+        descriptions = pd.Series([entries[index][1].get("description") for index in stale], dtype=object)
+        parsed = dict(zip(stale, parser.parse_series(descriptions).to_dict("records")))
+        parsed_count += len(stale)
 
-# === STEP 6: Build DataFrame ===
-df = pd.DataFrame(camera_data)
+        for index, (tenant, cam, previous_row) in enumerate(entries):
+            fields = parsed[index] if previous_row is None else {column: previous_row[column] for column in parser.columns}
+            row = {
+                "Tenant": tenant.get("name", tenant["tenant_id"]),
+                "Camera Name": cam.get("camera_name", cam.get("network_camera_id")),
+                **fields  # Unpack the extracted fields into the dictionary
+            }
+            output.write(row)
+            snapshot.record(tenant["tenant_id"], cam, row)
+    for tenant_id, camera_id, row in snapshot.finish():
+        diff.add("removed", row.get("Tenant", tenant_id), camera_id, row.get("Camera Name"))
+finally:
+    output.close()
+    diff.close()
+    snapshot.close()
 
-# === Write to Excel ===
-print(f"📁 Writing data to file: {EXCEL_FILE}")
-with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl') as writer:
-    df.to_excel(writer, index=False, sheet_name="Cameras")
+print(f"🧾 {output.rows} cameras, {parsed_count} descriptions parsed")
+print(f"🗂️ Since the last run: {diff.summary()} (details in {diff.path})")
 
-print("✅ Done! Data saved to Excel.")
+print(f"✅ Done! Data saved to {', '.join(output.paths)}.")
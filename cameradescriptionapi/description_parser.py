@@ -0,0 +1,91 @@
+import re
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+NOT_AVAILABLE = "Not Available"
+# Labels read from camera descriptions when none are configured
+DEFAULT_FIELDS = ("Use case", "Manufacturer", "Model", "Kitchen", "Line")
+
+# The rest of the line after 'Label:'; surrounding whitespace is stripped afterwards, which keeps the
+# pattern simple enough for RE2 to run it quickly
+_VALUE = r"[ \t]*:(?P<value>[^\n]*)"
+
+def _escape(label):
+    # re.escape escapes spaces, which RE2 (used by pyarrow) does not accept
+    return re.escape(label).replace("\\ ", " ")
+
+def fields_from_spec(spec):
+    """Parse 'Use case,Site=Kitchen' into {'Use case': 'Use case', 'Site': 'Kitchen'} (column -> label)"""
+    fields = {}
+    for entry in spec.split(","):
+        column, _, label = entry.partition("=")
+        if column.strip():
+            fields[column.strip()] = (label or column).strip()
+    return fields
+
+class DescriptionParser:
+    """Reads 'Label: value' lines out of camera descriptions
+
+    fields lists the labels to read, or maps output columns to labels. A
+    label only counts at the start of a line, so 'Model:' inside
+    'Camera Model:' is not read as Model, and the last line is read whether
+    or not the description ends in a newline. The first occurrence of a
+    label wins. Fields that are absent or blank are set to missing.
+
+    parse() and parse_many() read each description in a single pass with
+    one compiled pattern. parse_series() runs Series.str.extract over a
+    whole column of Arrow strings when pyarrow is installed; without it,
+    str.extract loops in Python once per field, so the single pass is used.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, missing=NOT_AVAILABLE):
+        if not isinstance(fields, dict):
+            fields = {label: label for label in fields}
+        self.fields = dict(fields)
+        self.columns = list(fields)
+        self.missing = missing
+        # Longest first, so a label that is a prefix of another never shadows it
+        labels = sorted(set(fields.values()), key=len, reverse=True)
+        self._line_pattern = re.compile(
+            r"^[ \t]*(?P<label>" + "|".join(_escape(label) for label in labels) + ")" + _VALUE, re.M
+        )
+        self._column_patterns = {
+            column: r"(?m)^[ \t]*" + _escape(label) + _VALUE for column, label in fields.items()
+        }
+
+    def parse(self, description):
+        """Return {column: value} for one description, which may be None or NaN"""
+        if not isinstance(description, str) or not description:
+            return dict.fromkeys(self.columns, self.missing)
+        # Reversed so the first occurrence of a repeated label is the one kept
+        found = dict(reversed(self._line_pattern.findall(description)))
+        return {column: found.get(label, "").strip() or self.missing for column, label in self.fields.items()}
+
+    def parse_many(self, descriptions):
+        """Yield a tuple of values in column order for each description, lazily"""
+        findall = self._line_pattern.findall
+        labels = list(self.fields.values())
+        missing = self.missing
+        for description in descriptions:
+            if not isinstance(description, str) or not description:
+                yield (missing,) * len(labels)
+                continue
+            found = dict(reversed(findall(description)))
+            yield tuple(found.get(label, "").strip() or missing for label in labels)
+
+    def parse_series(self, descriptions):
+        """Return a DataFrame of the fields, with the same index as a Series of descriptions"""
+        if pyarrow is None:
+            return pd.DataFrame(self.parse_many(descriptions), columns=self.columns, index=descriptions.index)
+        # Extract, strip and fill all run in C++ on Arrow strings
+        text = descriptions.astype(pd.ArrowDtype(pyarrow.string()))
+        columns = {}
+        for column, pattern in self._column_patterns.items():
+            values = text.str.extract(pattern, expand=False).str.strip().fillna("")
+            columns[column] = values.where(values != "", self.missing)
+        return pd.DataFrame(columns, index=descriptions.index)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+class CogniacUnavailable(Exception):
+    """Raised while connecting to Cogniac is failing; keeps the last underlying error"""
+
+    def __init__(self, last_error):
+        Exception.__init__(self, f"Cogniac is unavailable: {str(last_error)}")
+        self.last_error = last_error
+
+class CogniacClient:
+    """Connects to Cogniac on first use instead of at import, once per process
+
+    connect() returns (connection, subject). The first caller connects while
+    any others wait for it. After a failed attempt, callers fail fast with
+    CogniacUnavailable for retry_after seconds instead of each retrying the
+    login. Once connected the connection is kept for the life of the process;
+    the SDK logs in again by itself when a request comes back 401, so an
+    expired token never needs a reconnect here.
+    """
+
+    def __init__(self, connect, retry_after=10.0):
+        self._connect = connect
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._connection = None
+        self._subject = None
+        self._connected_at = None
+        self._last_error = None
+        self._failed_at = None
+        self._connecting = False
+
+    def get(self):
+        """Return (connection, subject), connecting if needed"""
+        connection, subject = self._connection, self._subject
+        if connection is not None:
+            return connection, subject
+
+        with self._lock:
+            if self._connection is not None:
+                return self._connection, self._subject
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_after:
+                raise CogniacUnavailable(self._last_error)
+
+            try:
+                connection, subject = self._connect()
+            except Exception as e:
+                self._last_error = e
+                self._failed_at = time.monotonic()
+                raise CogniacUnavailable(e)
+
+            # status() reads these without the lock; the timestamp must be in place first
+            self._connected_at = time.monotonic()
+            self._connection, self._subject = connection, subject
+            self._last_error = None
+            self._failed_at = None
+            return connection, subject
+
+    def connection(self):
+        return self.get()[0]
+
+    def subject(self):
+        return self.get()[1]
+
+    def start_connecting(self):
+        """Connect on a background thread if not connected yet; returns immediately"""
+        if self._connection is not None or self._connecting:
+            return
+        self._connecting = True
+
+        def connect():
+            try:
+                self.get()
+            except CogniacUnavailable:
+                pass
+            finally:
+                self._connecting = False
+
+        thread = threading.Thread(target=connect)
+        thread.daemon = True
+        thread.start()
+
+    def status(self):
+        """Return whether a connection is up and the last connection error, without waiting on a login"""
+        connection, connected_at, last_error = self._connection, self._connected_at, self._last_error
+        return {
+            'connected': connection is not None,
+            'connecting': self._connecting,
+            'connection_age': round(time.monotonic() - connected_at, 1) if connection is not None else None,
+            'last_error': str(last_error) if last_error is not None else None
+        }
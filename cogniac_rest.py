@@ -0,0 +1,299 @@
+import collections
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_BASE = 'https://api.cogniac.io/1'
+TOKEN_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cogniac', 'token_cache.json')
+# A cached token this close to expiring is replaced rather than used
+TOKEN_EXPIRY_MARGIN = 60
+# How long the list of the user's tenants is reused before asking again
+TENANTS_TTL = 3600
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1/rate seconds apart, across all threads; rate 0 means no limit"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class TokenCache:
+    """Access tokens and tenant lists kept on disk between runs, each with an expiry
+
+    The file is only readable by its owner and is replaced atomically, so
+    concurrent runs never see it half written. Passwords are never stored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """Return (value, expires_at), or (None, 0) if there is no entry or it is about to expire"""
+        entry = self._load().get(key)
+        if entry is None or entry['expires_at'] - TOKEN_EXPIRY_MARGIN <= time.time():
+            return None, 0
+        return entry['value'], entry['expires_at']
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            now = time.time()
+            entries = {k: entry for k, entry in self._load().items() if entry['expires_at'] > now}
+            entries[key] = {'value': value, 'expires_at': expires_at}
+            try:
+                self._save(entries)
+            except OSError as e:
+                print(f'⚠️ Could not write token cache {self.path}: {e}')
+
+    def discard(self, key):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                try:
+                    self._save(entries)
+                except OSError:
+                    pass
+
+class CogniacRestClient:
+    """Cogniac REST API for the camera scripts, over one pooled keep-alive session
+
+    Tokens and the tenant list are cached on disk (token_cache, or None to
+    disable), so repeated runs skip logging in until the token expires. 429s
+    honour Retry-After and 5xx and connection errors are retried with
+    exponential backoff. Every API call after login waits on one rate
+    limiter, and its latency is recorded by name for latency_summary().
+    """
+
+    def __init__(self, username, password, api_base=API_BASE, workers=16, rate=0.0, retries=3, timeout=30.0,
+                 token_cache=TOKEN_CACHE_PATH):
+        self.username = username
+        self.password = password
+        self.api_base = api_base.rstrip('/')
+        self.workers = workers
+        self.timeout = timeout
+        self.cache = TokenCache(token_cache) if token_cache else None
+        self.rate_limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,  # the scripts only read, so POSTs such as media search are safe to repeat
+            raise_on_status=False
+        )
+        # One keep-alive connection per worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._tokens = {}
+        # One lock per tenant, so tenants log in in parallel but each only once
+        self._token_locks = {}
+        self._latencies = {}
+
+    def _cache_key(self, *parts):
+        return ' '.join((self.api_base, self.username) + parts)
+
+    def _url(self, path):
+        # Absolute URLs, such as paging links, are used as they are
+        return path if '://' in path else f"{self.api_base}/{path.lstrip('/')}"
+
+    def tenants(self):
+        """Return the user's tenants as [{'tenant_id', 'name', ...}]"""
+        key = self._cache_key('tenants')
+        tenants = self.cache.get(key)[0] if self.cache else None
+        if tenants is None:
+            response = self.session.get(self._url('users/current/tenants'), auth=(self.username, self.password),
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            tenants = response.json()['tenants']
+            if self.cache:
+                self.cache.put(key, tenants, time.time() + TENANTS_TTL)
+        return tenants
+
+    def token(self, tenant_id):
+        """Return an access token for the tenant, from memory, the cache or a fresh login"""
+        with self._lock:
+            tenant_lock = self._token_locks.setdefault(tenant_id, threading.Lock())
+        with tenant_lock:
+            token, expires_at = self._tokens.get(tenant_id, (None, 0))
+            if token is not None and expires_at - TOKEN_EXPIRY_MARGIN > time.time():
+                return token
+            key = self._cache_key('token', tenant_id)
+            token, expires_at = self.cache.get(key) if self.cache else (None, 0)
+            if token is None:
+                response = self.session.get(self._url('token'), params={'tenant_id': tenant_id},
+                                            auth=(self.username, self.password), timeout=self.timeout)
+                response.raise_for_status()
+                body = response.json()
+                token, expires_at = body['access_token'], time.time() + body.get('expires_in', 3600)
+                if self.cache:
+                    self.cache.put(key, token, expires_at)
+            self._tokens[tenant_id] = (token, expires_at)
+            return token
+
+    def _forget_token(self, tenant_id):
+        with self._token_locks[tenant_id]:
+            self._tokens.pop(tenant_id, None)
+            if self.cache:
+                self.cache.discard(self._cache_key('token', tenant_id))
+
+    def request(self, method, path, tenant_id, name=None, **kwargs):
+        """Authenticated request for the tenant, timed under name
+
+        A 401 means the token was revoked or expired early: it is dropped and
+        the request is sent once more with a fresh one.
+        """
+        for attempt in range(2):
+            headers = {'Authorization': f'Bearer {self.token(tenant_id)}'}
+            self.rate_limiter.wait()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, self._url(path), headers=headers, timeout=self.timeout,
+                                                **kwargs)
+            finally:
+                self._observe(name or path, time.perf_counter() - started)
+            if response.status_code != 401 or attempt:
+                return response
+            self._forget_token(tenant_id)
+
+    def _observe(self, name, seconds):
+        with self._lock:
+            self._latencies.setdefault(name, []).append(seconds)
+
+    def latency_summary(self, name):
+        """Return count, p50, p95, p99 and max latency in seconds of the requests timed under name"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(name, ()))
+        if not latencies:
+            return {'count': 0}
+        def percentile(q):
+            return latencies[max(0, math.ceil(q / 100 * len(latencies)) - 1)]
+        return {
+            'count': len(latencies),
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': latencies[-1]
+        }
+
+    def camera_pages(self, tenant_id, page_size=500):
+        """Yield the tenant's network cameras a page at a time, following paging links"""
+        path = f'tenants/current/networkCameras?limit={page_size}'
+        while path:
+            response = self.request('GET', path, tenant_id, name='network_cameras')
+            response.raise_for_status()
+            body = response.json()
+            if isinstance(body, list):
+                # No paging envelope: everything came in one response
+                yield body
+                return
+            yield body.get('data', [])
+            path = (body.get('paging') or {}).get('next')
+
+    def iter_cameras(self, tenant_id, page_size=500):
+        """Yield the tenant's network cameras one at a time, fetching pages as they are needed"""
+        for page in self.camera_pages(tenant_id, page_size):
+            yield from page
+
+    def iter_all_cameras(self, tenants=None, page_size=500, prefetch=2):
+        """Yield (tenant, camera) for every camera of every tenant, tenant by tenant
+
+        Tenants are fetched in parallel, each on its own thread that stays at
+        most prefetch pages ahead of the caller, so memory holds a few pages
+        per tenant however large the fleet is.
+        """
+        tenants = self.tenants() if tenants is None else tenants
+        if not tenants:
+            return
+        stop = threading.Event()
+        page_queues = [queue.Queue(maxsize=prefetch) for _ in tenants]
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, len(tenants)), thread_name_prefix='camera-pages')
+        try:
+            for tenant, pages in zip(tenants, page_queues):
+                pool.submit(self._fetch_pages, tenant['tenant_id'], page_size, pages, stop)
+            for tenant, pages in zip(tenants, page_queues):
+                while True:
+                    page = pages.get()
+                    if page is None:
+                        break
+                    if isinstance(page, Exception):
+                        raise page
+                    for camera in page:
+                        yield tenant, camera
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_pages(self, tenant_id, page_size, pages, stop):
+        def put(item):
+            # Blocks while the caller is prefetch pages behind, but gives up once it stops reading
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for page in self.camera_pages(tenant_id, page_size):
+                if not put(page):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    def media_search(self, tenant_id, subject_uid, size=1):
+        """Return the response of a media search for the subject, timed as 'media_search'"""
+        return self.request('POST', 'media/search', tenant_id, name='media_search',
+                            json={'subject_uid': subject_uid, 'size': size})
+
+def map_ordered(fn, items, workers):
+    """Like ThreadPoolExecutor.map, but reads items only as results are consumed
+
+    At most twice workers calls are queued at once, so a lazy iterable of
+    any length stays lazy. Results come back in the order of items.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+def root_error(error):
+    """The error behind a tenacity RetryError, which the Cogniac SDK raises once its own retries run out"""
+    last_attempt = getattr(error, 'last_attempt', None)
+    cause = last_attempt.exception() if last_attempt is not None else None
+    return root_error(cause) if cause is not None else error
+
+def is_congestion_error(error):
+    """True for throttling (429), server errors (5xx) and timeouts"""
+    error = root_error(error)
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None and (status_code == 429 or status_code >= 500):
+        return True
+    if isinstance(error, TimeoutError):
+        return True
+    name = type(error).__name__
+    return name == 'ServerError' or 'Timeout' in name
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on in-flight Cogniac API calls
+
+    The limit grows by roughly one per round of successful calls that finish
+    under target_latency, and is multiplied by decrease_factor when a call is
+    throttled, fails with a server error, times out or runs slow. A call
+    sending more than target_bytes gets proportionally longer before it
+    counts as slow, so large uploads don't throttle everything else.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=32, target_latency=5.0, target_bytes=None,
+                 decrease_factor=0.5, history_size=200):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.target_bytes = target_bytes
+        self.decrease_factor = decrease_factor
+        self.history = deque(maxlen=history_size)
+
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._calls = 0
+        self._congested = 0
+        self._record('initial')
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @contextmanager
+    def slot(self, size=None):
+        """Hold one concurrency slot for the duration of an API call sending size bytes"""
+        started = self.acquire()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(started, error, size)
+
+    def acquire(self):
+        """Block until a slot is free; returns the start time to pass to release()"""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, error=None, size=None):
+        """Free a slot and adjust the limit from the call's outcome"""
+        latency = time.monotonic() - started
+        target_latency = self.target_latency
+        if size and self.target_bytes:
+            target_latency *= max(1.0, size / self.target_bytes)
+        with self._condition:
+            self._in_flight -= 1
+            self._calls += 1
+
+            if (error is not None and is_congestion_error(error)) or latency > target_latency:
+                self._congested += 1
+                # Calls already in flight when we last backed off report the same congestion; count it once
+                if started > self._last_decrease:
+                    self._limit = max(self.minimum, self._limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+                    self._record('error' if error is not None else 'slow', latency)
+            elif error is None:
+                previous = int(self._limit)
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+                if int(self._limit) != previous:
+                    self._record('increase', latency)
+
+            self._condition.notify_all()
+
+    def _record(self, reason, latency=None):
+        self.history.append({
+            'timestamp': time.time(),
+            'limit': int(self._limit),
+            'reason': reason,
+            'latency': round(latency, 3) if latency is not None else None
+        })
+
+    def snapshot(self):
+        """Return the current limit, counters and limit history"""
+        with self._condition:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'minimum': self.minimum,
+                'maximum': self.maximum,
+                'target_latency': self.target_latency,
+                'target_bytes': self.target_bytes,
+                'calls': self._calls,
+                'congested_calls': self._congested,
+                'history': list(self.history)
+            }
@@ -0,0 +1,129 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_stream(stream):
+    """Return the SHA-256 hex digest of a seekable stream and rewind it"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file on disk"""
+    with open(path, 'rb') as f:
+        return hash_stream(f)
+
+class DedupIndex:
+    """Persistent index of content hashes already uploaded to each subject"""
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+
+        # Worker processes share the file; wait for another one's write lock rather than failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            ' digest TEXT NOT NULL,'
+            ' subject_uid TEXT NOT NULL,'
+            ' media_id TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' last_used REAL NOT NULL,'
+            ' PRIMARY KEY (digest, subject_uid))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used)')
+        self._conn.commit()
+
+    @contextmanager
+    def reserve(self, digest, subject_uid):
+        """Serialize lookup+upload of identical content so concurrent copies upload once"""
+        key = (digest, subject_uid)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._pending[key]
+
+    def lookup(self, digest, subject_uid):
+        """Return the media_id previously uploaded for this content, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT media_id FROM media WHERE digest = ? AND subject_uid = ?',
+                (digest, subject_uid)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute(
+                'UPDATE media SET last_used = ? WHERE digest = ? AND subject_uid = ?',
+                (time.time(), digest, subject_uid)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def record(self, digest, subject_uid, media_id):
+        """Remember the media_id created for this content"""
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT INTO media (digest, subject_uid, media_id, created_at, last_used) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (digest, subject_uid, media_id, now, now)
+                )
+                self._evict()
+            except sqlite3.IntegrityError:
+                self._conn.execute(
+                    'UPDATE media SET media_id = ?, last_used = ? WHERE digest = ? AND subject_uid = ?',
+                    (media_id, now, digest, subject_uid)
+                )
+            self._conn.commit()
+
+    def _count(self):
+        return self._conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def _evict(self):
+        # Count in the database, since other worker processes insert too. Drop the
+        # least recently used tenth so eviction doesn't run on every insert
+        count = self._count()
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + max(1, self.max_entries // 10)
+        self._conn.execute(
+            'DELETE FROM media WHERE rowid IN '
+            '(SELECT rowid FROM media ORDER BY last_used LIMIT ?)',
+            (excess,)
+        )
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': self._count(),
+                'max_entries': self.max_entries
+            }
@@ -0,0 +1,23 @@
+"""Development server: python devserver.py; in production serve wsgi:app with gunicorn
+
+Set FLASK_DEBUG=1 for the debugger and reloader, PORT to change the port
+from 5000. Preprocessing workers re-run this script as __mp_main__, which is
+why main (and with it the job store, dedup index and upload workers) is only
+imported when it runs as __main__.
+"""
+import os
+
+if __name__ == '__main__':
+    from werkzeug.serving import is_running_from_reloader
+
+    from main import app, start_background_work
+
+    debug = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes')
+    # With the reloader on, this process only watches for changes and restarts a child that serves
+    if not debug or is_running_from_reloader():
+        start_background_work()
+    app.run(
+        debug=debug,
+        port=int(os.getenv('PORT', 5000)),
+        threaded=True
+    )
@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+import time
+
+class FolderManifest:
+    """Persistent record of the files already synced from each folder to each subject
+
+    Entries are keyed by (folder, subject_uid, path) and hold the size and
+    modification time the file had when it was read, its content hash and
+    the media_id it was uploaded as. A file whose size and mtime still match
+    is skipped without being read. media_id is None for files deliberately
+    not uploaded, such as near-duplicates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Worker processes can share the file
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' folder TEXT NOT NULL,'
+            ' subject_uid TEXT NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' digest TEXT,'
+            ' media_id TEXT,'
+            ' synced_at REAL NOT NULL,'
+            ' PRIMARY KEY (folder, subject_uid, path))'
+        )
+        self._conn.commit()
+
+    def unchanged(self, folder, subject_uid, path, size, mtime_ns):
+        """True if the file was synced before and its size and mtime have not changed since"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns FROM files WHERE folder = ? AND subject_uid = ? AND path = ?',
+                (folder, subject_uid, path)
+            ).fetchone()
+        return row is not None and row == (size, mtime_ns)
+
+    def record(self, folder, subject_uid, path, size, mtime_ns, digest, media_id):
+        """Remember a synced file, replacing any earlier entry for the same path"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (folder, subject_uid, path, size, mtime_ns, digest, media_id, synced_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (folder, subject_uid, path, size, mtime_ns, digest, media_id, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self, folder, subject_uid):
+        """Return how many files of the folder are in the manifest and when the last one was synced"""
+        with self._lock:
+            count, last_synced = self._conn.execute(
+                'SELECT COUNT(*), MAX(synced_at) FROM files WHERE folder = ? AND subject_uid = ?',
+                (folder, subject_uid)
+            ).fetchone()
+        return {'files': count, 'last_synced_at': last_synced}
@@ -0,0 +1,101 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Pillow is only needed when preprocessing is requested
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# Output format name -> (Pillow format, file extension)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp')
+}
+
+def is_available():
+    """Return True if the optional Pillow dependency is installed"""
+    return Image is not None
+
+def parse_options(values, defaults):
+    """Build preprocessing options from request fields; returns (options or None, error)
+
+    values and defaults are mappings with max_dimension, output_format and
+    quality. Preprocessing is off unless max_dimension or output_format is set,
+    but quality is checked either way, so a bad value is reported rather than
+    ignored.
+    """
+    max_dimension = values.get('max_dimension', defaults.get('max_dimension'))
+    output_format = values.get('output_format', defaults.get('output_format'))
+    quality = values.get('quality', defaults.get('quality'))
+    try:
+        quality = int(quality) if quality not in (None, '') else 85
+    except (TypeError, ValueError):
+        return None, 'quality must be an integer'
+    if not 1 <= quality <= 100:
+        return None, 'quality must be between 1 and 100'
+    if max_dimension in (None, '') and output_format in (None, ''):
+        return None, None
+
+    if not is_available():
+        return None, 'Image preprocessing requires Pillow'
+    try:
+        max_dimension = int(max_dimension) if max_dimension not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'max_dimension must be an integer'
+    if max_dimension is not None and max_dimension < 1:
+        return None, 'max_dimension must be positive'
+    output_format = (output_format or 'jpeg').lower()
+    if output_format == 'jpg':
+        output_format = 'jpeg'
+    if output_format not in OUTPUT_FORMATS:
+        return None, f'Unknown output_format: {output_format}'
+    return {'max_dimension': max_dimension, 'output_format': output_format, 'quality': quality}, None
+
+def output_filename(filename, output_format):
+    """filename with its extension changed to match the re-encoded image"""
+    return os.path.splitext(filename)[0] + OUTPUT_FORMATS[output_format][1]
+
+def preprocess(source, max_dimension=None, output_format='jpeg', quality=85):
+    """Downscale and re-encode an image path or bytes; returns (encoded bytes, original size)
+
+    Orientation from EXIF is applied to the pixels, then all metadata is
+    dropped. Runs in a worker process, so it only takes and returns plain data.
+    """
+    if isinstance(source, bytes):
+        original_size = len(source)
+        source = io.BytesIO(source)
+    else:
+        original_size = os.path.getsize(source)
+
+    pil_format = OUTPUT_FORMATS[output_format][0]
+    with Image.open(source) as img:
+        if max_dimension is not None:
+            # Let the JPEG decoder downscale while decoding when the image is far larger than needed
+            img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        if max_dimension is not None and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'L') and not (pil_format == 'WEBP' and img.mode == 'RGBA'):
+            img = img.convert('RGBA' if pil_format == 'WEBP' and 'A' in img.getbands() else 'RGB')
+
+        output = io.BytesIO()
+        # No exif= argument, so nothing from the original's metadata is written
+        img.save(output, pil_format, quality=quality)
+    return output.getvalue(), original_size
+
+def create_pool(workers):
+    """Process pool for preprocess()
+
+    Workers are forked from a fork server with this module preloaded, since
+    forking the web worker itself is unsafe once it runs threads. Like
+    spawned workers they still re-run the script the process was started
+    from as __mp_main__, so that script must only import the app when run
+    as __main__ (see devserver.py).
+    """
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
@@ -0,0 +1,574 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Item states
+PENDING = 'pending'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+
+# Batch counters bumped for each result status; anything else counts as failed
+RESULT_COUNTERS = {
+    'success': ('successful',),
+    'duplicate': ('successful', 'duplicates'),
+    'near_duplicate': ('near_duplicates',)
+}
+
+def _compact(result, filename):
+    """Serialize a result without spaces, leaving out the filename when the item row already has it"""
+    if result.get('filename') == filename:
+        result = {key: value for key, value in result.items() if key != 'filename'}
+    return json.dumps(result, separators=(',', ':'))
+
+def _expand(data, filename):
+    result = json.loads(data)
+    if 'filename' not in result:
+        result = dict(filename=filename, **result)
+    return result
+
+class JobStore:
+    """SQLite-backed record of batches and the state of every file in them
+
+    Several worker processes can share one database file: every write runs
+    in an IMMEDIATE transaction, so read-then-write steps such as numbering
+    results are never interleaved with another process, and each batch is
+    leased to the process running it (see claim_batches()).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Notified whenever this process bumps the change version (see wait_for_change())
+        self._changed = threading.Condition()
+        # Other processes may hold the write lock briefly; wait for it rather than failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL keeps the per-result commits cheap and lets readers run alongside the writer
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS batches ('
+            ' batch_id TEXT PRIMARY KEY,'
+            ' kind TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' meta_tags TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' total INTEGER NOT NULL,'
+            ' completed INTEGER NOT NULL DEFAULT 0,'
+            ' successful INTEGER NOT NULL DEFAULT 0,'
+            ' failed INTEGER NOT NULL DEFAULT 0,'
+            ' duplicates INTEGER NOT NULL DEFAULT 0,'
+            ' near_duplicates INTEGER NOT NULL DEFAULT 0,'
+            ' last_result_seq INTEGER NOT NULL DEFAULT 0,'
+            ' scanning INTEGER NOT NULL DEFAULT 0,'
+            ' bytes_saved INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' batch_id TEXT NOT NULL,'
+            ' seq INTEGER NOT NULL,'
+            ' filename TEXT NOT NULL,'
+            ' source TEXT,'
+            ' state TEXT NOT NULL,'
+            ' result TEXT,'
+            ' completed_seq INTEGER,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' PRIMARY KEY (batch_id, seq));'
+            'CREATE INDEX IF NOT EXISTS items_completed ON items (batch_id, completed_seq);'
+            'CREATE INDEX IF NOT EXISTS items_source ON items (batch_id, source);'
+            # One row counting the changes waiters care about, across every process sharing the file
+            'CREATE TABLE IF NOT EXISTS changes (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL);'
+            'INSERT OR IGNORE INTO changes (id, version) VALUES (0, 0);'
+            # Folders re-synced on a timer, each run by the one worker process holding its lease
+            'CREATE TABLE IF NOT EXISTS watches ('
+            ' watch_id TEXT PRIMARY KEY,'
+            ' meta_tags TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' interval REAL NOT NULL,'
+            " batches TEXT NOT NULL DEFAULT '[]',"
+            ' created_at REAL NOT NULL,'
+            ' last_sync_at REAL,'
+            ' owner TEXT,'
+            ' lease_expires REAL NOT NULL DEFAULT 0);'
+        )
+        self._add_column('batches', 'last_result_seq', 'INTEGER NOT NULL DEFAULT 0')
+        # Folder batches add items while the folder is still being walked
+        self._add_column('batches', 'scanning', 'INTEGER NOT NULL DEFAULT 0')
+        # Bytes trimmed off uploads by preprocessing
+        self._add_column('batches', 'bytes_saved', 'INTEGER NOT NULL DEFAULT 0')
+        # The worker process running the batch, and until when it holds it
+        self._add_column('batches', 'owner', 'TEXT')
+        self._add_column('batches', 'lease_expires', 'REAL NOT NULL DEFAULT 0')
+        # Times each item was picked up, kept when it is requeued
+        self._add_column('items', 'attempts', 'INTEGER NOT NULL DEFAULT 0')
+        self._conn.commit()
+
+    def _add_column(self, table, column, definition):
+        """Add a column missing from a database created by an older version"""
+        columns = [row['name'] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    @contextmanager
+    def _write(self):
+        """Run the enclosed statements as one transaction that holds the database write lock"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def create_batch(self, batch_id, kind, meta_tags, items, options=None, scanning=False, owner=None, lease=0):
+        """Record a new batch; items is a list of (filename, source) pairs
+
+        With scanning=True more items are expected through add_items() until
+        finish_scan() is called. owner holds the batch for lease seconds.
+        """
+        now = time.time()
+        with self._write():
+            self._conn.execute(
+                'INSERT INTO batches (batch_id, kind, status, meta_tags, options, total, scanning, owner, '
+                'lease_expires, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (batch_id, kind, 'processing', json.dumps(meta_tags), json.dumps(options or {}),
+                 len(items), int(scanning), owner, now + lease if owner else 0, now, now)
+            )
+            self._conn.executemany(
+                'INSERT INTO items (batch_id, seq, filename, source, state) VALUES (?, ?, ?, ?, ?)',
+                [(batch_id, seq, filename, source, PENDING) for seq, (filename, source) in enumerate(items)]
+            )
+
+    def add_items(self, batch_id, items):
+        """Append (filename, source) pairs to a batch; returns the seq of the first one"""
+        with self._write():
+            first_seq = self._conn.execute(
+                'SELECT total FROM batches WHERE batch_id = ?', (batch_id,)
+            ).fetchone()['total']
+            self._conn.executemany(
+                'INSERT INTO items (batch_id, seq, filename, source, state) VALUES (?, ?, ?, ?, ?)',
+                [(batch_id, first_seq + offset, filename, source, PENDING)
+                 for offset, (filename, source) in enumerate(items)]
+            )
+            self._conn.execute(
+                'UPDATE batches SET total = total + ?, updated_at = ? WHERE batch_id = ?',
+                (len(items), time.time(), batch_id)
+            )
+        return first_seq
+
+    def finish_scan(self, batch_id):
+        """Note that every item of the batch has been added"""
+        with self._write():
+            self._conn.execute('UPDATE batches SET scanning = 0 WHERE batch_id = ?', (batch_id,))
+
+    def has_source(self, batch_id, source):
+        """True if the batch already has an item for this source path"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM items WHERE batch_id = ? AND source = ? LIMIT 1', (batch_id, source)
+            ).fetchone() is not None
+
+    def mark_uploading(self, batch_id, seq):
+        """Note that a worker has picked up this item, counting one more attempt"""
+        with self._write():
+            self._conn.execute(
+                'UPDATE items SET state = ?, attempts = attempts + 1 WHERE batch_id = ? AND seq = ?',
+                (UPLOADING, batch_id, seq)
+            )
+
+    def record_result(self, batch_id, seq, result):
+        """Store an item's result and bump the batch counters
+
+        An item tried more than once gets its attempt count, across retries
+        and requeues, added to the result as 'attempts'.
+        """
+        counters = ('completed',) + RESULT_COUNTERS.get(result['status'], ('failed',))
+        state = FAILED if counters[-1] == 'failed' else DONE
+        with self._write():
+            # Results are numbered in completion order; numbers are never reused, even after a retry
+            result_seq = self._conn.execute(
+                'SELECT last_result_seq FROM batches WHERE batch_id = ?', (batch_id,)
+            ).fetchone()['last_result_seq'] + 1
+            item = self._conn.execute(
+                'SELECT filename, attempts FROM items WHERE batch_id = ? AND seq = ?', (batch_id, seq)
+            ).fetchone()
+            filename = item['filename']
+            if item['attempts'] > 1:
+                result = dict(result, attempts=item['attempts'])
+            self._conn.execute(
+                'UPDATE items SET state = ?, result = ?, completed_seq = ? WHERE batch_id = ? AND seq = ?',
+                (state, _compact(result, filename), result_seq, batch_id, seq)
+            )
+            self._conn.execute(
+                'UPDATE batches SET {}, last_result_seq = last_result_seq + 1, bytes_saved = bytes_saved + ?, '
+                'updated_at = ? WHERE batch_id = ?'.format(', '.join(f'{c} = {c} + 1' for c in counters)),
+                (result.get('bytes_saved', 0), time.time(), batch_id)
+            )
+            self._bump_version()
+        self._notify()
+
+    def finish_batch(self, batch_id, status='completed'):
+        """Close the batch and compact it: only failed items keep their source, for /batch-retry"""
+        with self._write():
+            self._conn.execute(
+                'UPDATE batches SET status = ?, lease_expires = 0, updated_at = ? WHERE batch_id = ?',
+                (status, time.time(), batch_id)
+            )
+            self._conn.execute(
+                'UPDATE items SET source = NULL WHERE batch_id = ? AND state = ? AND source IS NOT NULL',
+                (batch_id, DONE)
+            )
+            self._bump_version()
+        self._notify()
+
+    def _bump_version(self):
+        # Inside the transaction that makes the change, so the new version is never seen without it
+        self._conn.execute('UPDATE changes SET version = version + 1')
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def change_version(self):
+        """Return the change version, which grows whenever a result is recorded or a batch changes status"""
+        with self._lock:
+            return self._conn.execute('SELECT version FROM changes').fetchone()[0]
+
+    def wait_for_change(self, since, timeout, poll_interval=0.5):
+        """Block until the change version is past `since`; returns the new version, or None on timeout
+
+        Read the version before reading the state it covers, then pass it
+        here: a change committed in between is seen at once, never missed.
+        Changes made in this process wake waiters immediately; those from
+        other processes sharing the file are noticed within poll_interval.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                version = self.change_version()
+                if version > since:
+                    return version
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # The condition is held from the check until wait() releases it, so a notify can't slip between
+                self._changed.wait(min(poll_interval, remaining))
+
+    def get_batch(self, batch_id):
+        """Return the batch summary as a dict, or None if unknown"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM batches WHERE batch_id = ?', (batch_id,)).fetchone()
+        return self._batch_dict(row) if row else None
+
+    def get_results(self, batch_id, since=0, limit=None):
+        """Return (result_seq, result) pairs recorded after `since`, in completion order"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT completed_seq, filename, result FROM items WHERE batch_id = ? AND completed_seq > ? '
+                'ORDER BY completed_seq LIMIT ?',
+                (batch_id, since, -1 if limit is None else limit)
+            ).fetchall()
+        return [(row['completed_seq'], _expand(row['result'], row['filename'])) for row in rows]
+
+    def unfinished_batches(self):
+        """Return summaries of batches that were still processing"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM batches WHERE status = 'processing' ORDER BY created_at"
+            ).fetchall()
+        return [self._batch_dict(row) for row in rows]
+
+    def claim_batches(self, owner, lease):
+        """Take over unfinished batches whose lease has run out; returns their summaries
+
+        A batch's lease runs out when the process running it stopped without
+        finishing it, so exactly one of the processes sharing the database
+        picks it up.
+        """
+        now = time.time()
+        with self._write():
+            # An owner's own lapsed batches are still running in it; only other owners' are taken
+            rows = self._conn.execute(
+                "SELECT * FROM batches WHERE status = 'processing' AND lease_expires < ? "
+                'AND (owner IS NULL OR owner != ?) ORDER BY created_at',
+                (now, owner)
+            ).fetchall()
+            self._conn.executemany(
+                'UPDATE batches SET owner = ?, lease_expires = ? WHERE batch_id = ?',
+                [(owner, now + lease, row['batch_id']) for row in rows]
+            )
+        return [dict(self._batch_dict(row), owner=owner) for row in rows]
+
+    def renew_leases(self, owner, lease):
+        """Extend the lease on every unfinished batch and folder watch this owner holds"""
+        expires = time.time() + lease
+        with self._write():
+            self._conn.execute(
+                "UPDATE batches SET lease_expires = ? WHERE owner = ? AND status = 'processing'",
+                (expires, owner)
+            )
+            self._conn.execute('UPDATE watches SET lease_expires = ? WHERE owner = ?', (expires, owner))
+
+    def release_leases(self, owner):
+        """Give up this owner's unfinished batches and folder watches so another process can resume them right away"""
+        with self._write():
+            self._conn.execute(
+                "UPDATE batches SET lease_expires = 0 WHERE owner = ? AND status = 'processing'", (owner,)
+            )
+            self._conn.execute('UPDATE watches SET lease_expires = 0 WHERE owner = ?', (owner,))
+
+    def create_watch(self, watch_id, options, meta_tags, interval, owner, lease):
+        """Record a folder watch, held by owner for lease seconds; returns it"""
+        now = time.time()
+        with self._write():
+            self._conn.execute(
+                'INSERT INTO watches (watch_id, meta_tags, options, interval, created_at, owner, lease_expires) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (watch_id, json.dumps(meta_tags), json.dumps(options), interval, now, owner, now + lease)
+            )
+        return self.get_watch(watch_id)
+
+    def get_watch(self, watch_id):
+        """Return the folder watch as a dict, or None if unknown or stopped"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM watches WHERE watch_id = ?', (watch_id,)).fetchone()
+        return self._watch_dict(row) if row else None
+
+    def list_watches(self):
+        """Return every folder watch, whichever process runs it"""
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM watches ORDER BY created_at').fetchall()
+        return [self._watch_dict(row) for row in rows]
+
+    def delete_watch(self, watch_id):
+        """Stop a folder watch; returns it as it was, or None if unknown
+
+        Its owner notices the next time it checks holds_watch().
+        """
+        with self._write():
+            row = self._conn.execute('SELECT * FROM watches WHERE watch_id = ?', (watch_id,)).fetchone()
+            self._conn.execute('DELETE FROM watches WHERE watch_id = ?', (watch_id,))
+        return self._watch_dict(row) if row else None
+
+    def holds_watch(self, watch_id, owner):
+        """True while the watch exists and owner is the process running it"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM watches WHERE watch_id = ? AND owner = ?', (watch_id, owner)
+            ).fetchone() is not None
+
+    def add_watch_batch(self, watch_id, batch_id, keep):
+        """Note a batch started by a folder watch, keeping the IDs of the latest `keep`"""
+        with self._write():
+            row = self._conn.execute('SELECT batches FROM watches WHERE watch_id = ?', (watch_id,)).fetchone()
+            if row is not None:
+                batches = (json.loads(row['batches']) + [batch_id])[-keep:]
+                self._conn.execute(
+                    'UPDATE watches SET batches = ? WHERE watch_id = ?', (json.dumps(batches), watch_id)
+                )
+
+    def watch_synced(self, watch_id):
+        """Note that a folder watch has finished a sync pass"""
+        with self._write():
+            self._conn.execute('UPDATE watches SET last_sync_at = ? WHERE watch_id = ?', (time.time(), watch_id))
+
+    def claim_watches(self, owner, lease):
+        """Take over folder watches whose lease has run out; returns them
+
+        Like claim_batches(), so each watch is run by exactly one of the
+        processes sharing the database, including after a restart.
+        """
+        now = time.time()
+        with self._write():
+            rows = self._conn.execute(
+                'SELECT * FROM watches WHERE lease_expires < ? AND (owner IS NULL OR owner != ?) '
+                'ORDER BY created_at',
+                (now, owner)
+            ).fetchall()
+            self._conn.executemany(
+                'UPDATE watches SET owner = ?, lease_expires = ? WHERE watch_id = ?',
+                [(owner, now + lease, row['watch_id']) for row in rows]
+            )
+        return [dict(self._watch_dict(row), owner=owner) for row in rows]
+
+    def iter_pending_items(self, batch_id, page_size=1000):
+        """Yield (seq, filename, source) for items that have no result yet, a page at a time
+
+        Only items that existed when iteration started are yielded.
+        """
+        with self._lock:
+            max_seq = self._conn.execute(
+                'SELECT total FROM batches WHERE batch_id = ?', (batch_id,)
+            ).fetchone()['total'] - 1
+        last_seq = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT seq, filename, source FROM items '
+                    'WHERE batch_id = ? AND seq > ? AND seq <= ? AND state IN (?, ?) ORDER BY seq LIMIT ?',
+                    (batch_id, last_seq, max_seq, PENDING, UPLOADING, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row['seq'], row['filename'], row['source']
+            last_seq = rows[-1]['seq']
+
+    def failed_items(self, batch_id):
+        """Return (seq, filename, source, media_id) for items whose upload failed
+
+        media_id is set when the media was created but the failure came after.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq, filename, source, result FROM items WHERE batch_id = ? AND state = ? ORDER BY seq',
+                (batch_id, FAILED)
+            ).fetchall()
+        return [
+            (row['seq'], row['filename'], row['source'], json.loads(row['result'] or '{}').get('media_id'))
+            for row in rows
+        ]
+
+    def requeue_items(self, batch_id, seqs, owner=None, lease=0):
+        """Reset failed items to pending and reopen the batch, leased to owner
+
+        Items keep their attempt counts. Returns how many items were reset,
+        or None if the batch is already processing.
+        """
+        with self._write():
+            status = self._conn.execute('SELECT status FROM batches WHERE batch_id = ?', (batch_id,)).fetchone()
+            if status is None or status['status'] == 'processing':
+                return None
+            requeued = 0
+            for seq in seqs:
+                requeued += self._conn.execute(
+                    'UPDATE items SET state = ?, result = NULL, completed_seq = NULL '
+                    'WHERE batch_id = ? AND seq = ? AND state = ?',
+                    (PENDING, batch_id, seq, FAILED)
+                ).rowcount
+            now = time.time()
+            self._conn.execute(
+                "UPDATE batches SET status = 'processing', completed = completed - ?, failed = failed - ?, "
+                'owner = ?, lease_expires = ?, updated_at = ? WHERE batch_id = ?',
+                (requeued, requeued, owner, now + lease if owner else 0, now, batch_id)
+            )
+            self._bump_version()
+        self._notify()
+        return requeued
+
+    def evict_finished(self, max_age=None, max_batches=None, archive_dir=None):
+        """Delete finished batches to keep the store bounded; returns the evicted batch IDs
+
+        A batch goes once it was last updated more than max_age seconds ago, or
+        when it is not among the max_batches most recently updated finished
+        batches. With archive_dir, its summary and results are written there
+        first (see load_archive()).
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT batch_id, updated_at FROM batches WHERE status != 'processing' ORDER BY updated_at DESC"
+            ).fetchall()
+        expired = [
+            (row['batch_id'], row['updated_at']) for index, row in enumerate(rows)
+            if (max_batches is not None and index >= max_batches)
+            or (max_age is not None and row['updated_at'] < now - max_age)
+        ]
+
+        evicted = []
+        for batch_id, updated_at in expired:
+            if archive_dir:
+                self._archive(batch_id, archive_dir)
+            with self._write():
+                # Skip it if a retry reopened or touched the batch since it was picked
+                if self._conn.execute(
+                    "DELETE FROM batches WHERE batch_id = ? AND status != 'processing' AND updated_at = ?",
+                    (batch_id, updated_at)
+                ).rowcount:
+                    self._conn.execute('DELETE FROM items WHERE batch_id = ?', (batch_id,))
+                    self._bump_version()
+                    evicted.append(batch_id)
+        if evicted:
+            self._notify()
+        return evicted
+
+    def _archive(self, batch_id, archive_dir, page_size=1000):
+        """Write the batch summary, then one (result_seq, result) pair per line, to a gzipped JSON lines file"""
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, batch_id + '.jsonl.gz')
+        # Unique temporary name: other worker processes may archive the same batch
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wt') as f:
+            f.write(json.dumps(self.get_batch(batch_id)) + '\n')
+            since = 0
+            while True:
+                results = self.get_results(batch_id, since=since, limit=page_size)
+                if not results:
+                    break
+                for result_seq, result in results:
+                    f.write(json.dumps([result_seq, result], separators=(',', ':')) + '\n')
+                since = results[-1][0]
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _batch_dict(row):
+        batch = dict(row)
+        batch['meta_tags'] = json.loads(batch['meta_tags'])
+        batch['options'] = json.loads(batch['options'])
+        return batch
+
+    @staticmethod
+    def _watch_dict(row):
+        watch = dict(row)
+        for key in ('meta_tags', 'options', 'batches'):
+            watch[key] = json.loads(watch[key])
+        return watch
+
+# Progress store backends by URL scheme; each takes the rest of the URL
+JOB_STORE_BACKENDS = {
+    # sqlite:///jobs.sqlite3 (relative) or sqlite:////var/lib/uploader/jobs.sqlite3 (absolute);
+    # the file can be shared by every worker process on the host
+    'sqlite': lambda location: JobStore(location[1:] if location.startswith('/') else location),
+    # Nothing survives a restart and nothing is shared; only for a single worker process
+    'memory': lambda location: JobStore(':memory:')
+}
+
+def open_job_store(url):
+    """Open the progress store named by a URL such as sqlite:///jobs.sqlite3 or memory://
+
+    A bare path is taken as a SQLite file.
+    """
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        return JobStore(url)
+    if scheme not in JOB_STORE_BACKENDS:
+        raise ValueError(f"Unknown job store backend '{scheme}'; expected one of {', '.join(JOB_STORE_BACKENDS)}")
+    return JOB_STORE_BACKENDS[scheme](location)
+
+def load_archive(archive_dir, batch_id, since=0, limit=None):
+    """Read an evicted batch back; returns (summary, [(result_seq, result), ...]) or None
+
+    Like get_results(), only results after `since` are returned, at most limit.
+    """
+    if os.path.basename(batch_id) != batch_id or batch_id.startswith('.'):
+        return None
+    try:
+        f = gzip.open(os.path.join(archive_dir, batch_id + '.jsonl.gz'), 'rt')
+    except OSError:
+        return None
+    with f:
+        batch = json.loads(f.readline())
+        results = []
+        for line in f:
+            if limit is not None and len(results) >= limit:
+                break
+            result_seq, result = json.loads(line)
+            if result_seq > since:
+                results.append((result_seq, result))
+    return batch, results
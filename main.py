@@ -1,301 +1,946 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import json
 from cogniac import CogniacConnection, CogniacMedia, CogniacSubject
 import os
+import io
+import shutil
+import tempfile
 from dotenv import load_dotenv
 from flask_cors import CORS
+from flask.wrappers import Request
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import ClientDisconnected
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import itertools
+import atexit
+import socket
+import uuid
+from collections import OrderedDict
+from dedup_index import DedupIndex, hash_file, hash_stream
+from folder_manifest import FolderManifest
+from job_store import load_archive, open_job_store
+from concurrency import AdaptiveConcurrencyLimiter
+from scheduler import INTERACTIVE, UploadScheduler
+from upload_methods import AssociationFailed, UploadMethodRouter
+from retry_policy import RetryBudget, RetryPolicy, is_retryable
+from multipart_ingest import iter_multipart, multipart_boundary
+from bulk_associate import BulkAssociator
+from upload_sessions import OffsetMismatch, UploadSessionStore, parse_content_range
+from cogniac_client import CogniacClient
+from metrics import Counter, GaugeFunction, Histogram
+from sampling_profiler import SamplingProfiler
+import metrics
+import perceptual_hash
+import image_preprocess
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-
 # Get environment variables
 COG_USER = os.getenv('COG_USER')
 COG_PASS = os.getenv('COG_PASS')
 COG_TENANT = os.getenv('COG_TENANT')
 SUBJECT_UID = 'text1_1swflmmt'  # Change this as needed
 
-# Initialize Cogniac connection
-cc = CogniacConnection(username=COG_USER, password=COG_PASS, tenant_id=COG_TENANT)
-print(f"Connection successful to {cc}")
+# After a failed Cogniac login, uploads fail fast for this many seconds before
+# it is tried again. An expired token is renewed by the SDK on its own
+COGNIAC_CONNECT_RETRY = float(os.getenv('COGNIAC_CONNECT_RETRY', 10))
+
+# Uploaded files larger than this are spooled to a temporary file instead of memory
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+
+# Content-hash index of media already uploaded, so resubmitted images are not uploaded twice
+DEDUP_DB_PATH = os.getenv('DEDUP_DB_PATH', 'dedup_index.sqlite3')
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 100000))
+
+# Whether /upload-folder descends into subfolders when the request doesn't say; resumed batches
+# that predate the recursive option use it too
+FOLDER_RECURSIVE_DEFAULT = False
+
+# Per folder and subject record of synced files, for /upload-folder with sync
+FOLDER_MANIFEST_PATH = os.getenv('FOLDER_MANIFEST_PATH', 'folder_manifest.sqlite3')
+# Shortest allowed watch_interval (seconds) for watched folders
+FOLDER_WATCH_MIN_INTERVAL = 10
+# Batch IDs kept per watched folder for /folder-watches
+FOLDER_WATCH_HISTORY = 20
+
+# Default Hamming distance under which folder images count as near-duplicates (unset disables)
+NEAR_DUPLICATE_THRESHOLD = os.getenv('NEAR_DUPLICATE_THRESHOLD')
+NEAR_DUPLICATE_HASH = os.getenv('NEAR_DUPLICATE_HASH', 'dhash')
+# Uploaded images a folder batch compares each new image with, most recent first
+NEAR_DUPLICATE_WINDOW = int(os.getenv('NEAR_DUPLICATE_WINDOW', 10000))
+
+# Durable record of batches so a restart resumes them instead of losing progress
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'jobs.sqlite3')
+# Progress store backend, e.g. sqlite:////var/lib/uploader/jobs.sqlite3 or memory://; defaults to the SQLite file above.
+# Worker processes that share a SQLite file share batch progress, so any of them can answer for any batch
+JOB_STORE_URL = os.getenv('JOB_STORE_URL', JOB_DB_PATH)
+# A worker holds each batch it runs for this many seconds at a time, renewing as it goes;
+# batches whose holder stopped are resumed by another worker once the lease runs out
+BATCH_LEASE_SECONDS = float(os.getenv('BATCH_LEASE_SECONDS', 60))
+# Finished batches are dropped from the job store after BATCH_RETENTION seconds, and beyond the
+# BATCH_RETENTION_MAX most recently finished; with BATCH_ARCHIVE_DIR set they are archived there first
+# and /batch-status keeps answering for them
+BATCH_RETENTION = float(os.getenv('BATCH_RETENTION', 7 * 24 * 3600))
+BATCH_RETENTION_MAX = int(os.getenv('BATCH_RETENTION_MAX', 10000))
+BATCH_ARCHIVE_DIR = os.getenv('BATCH_ARCHIVE_DIR')
+BATCH_EVICT_INTERVAL = 300
+# Optional directory where /batch-upload files are kept until uploaded, so those batches can resume too
+JOB_PAYLOAD_DIR = os.getenv('JOB_PAYLOAD_DIR')
+
+# Bounds for the adaptive (AIMD) limit on concurrent Cogniac API calls;
+# UPLOAD_CONCURRENCY_MAX is also the size of the process-wide upload worker pool
+UPLOAD_CONCURRENCY_INITIAL = int(os.getenv('UPLOAD_CONCURRENCY_INITIAL', 10))
+UPLOAD_CONCURRENCY_MIN = int(os.getenv('UPLOAD_CONCURRENCY_MIN', 1))
+UPLOAD_CONCURRENCY_MAX = int(os.getenv('UPLOAD_CONCURRENCY_MAX', 32))
+# Calls slower than this (seconds) are treated as a sign of congestion; uploads larger than
+# UPLOAD_TARGET_BYTES are allowed proportionally longer
+UPLOAD_TARGET_LATENCY = float(os.getenv('UPLOAD_TARGET_LATENCY', 5.0))
+UPLOAD_TARGET_BYTES = int(os.getenv('UPLOAD_TARGET_BYTES', 2 * 1024 * 1024))
+
+# A rejected upload method is skipped for this many seconds before being probed again
+UPLOAD_METHOD_COOLDOWN = float(os.getenv('UPLOAD_METHOD_COOLDOWN', 300))
+
+# Directory for request profiles; unset disables profiling. When set, a request with ?profile=1
+# or an X-Profile: 1 header has every thread's stack sampled every PROFILE_INTERVAL seconds
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+
+# Optional downscale/re-encode before upload; each can be overridden per request with the
+# max_dimension, output_format (jpeg or webp) and quality fields
+PREPROCESS_MAX_DIMENSION = os.getenv('PREPROCESS_MAX_DIMENSION')
+PREPROCESS_OUTPUT_FORMAT = os.getenv('PREPROCESS_OUTPUT_FORMAT')
+PREPROCESS_QUALITY = int(os.getenv('PREPROCESS_QUALITY', 85))
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', os.cpu_count() or 1))
+PREPROCESS_DEFAULTS = {
+    'max_dimension': PREPROCESS_MAX_DIMENSION,
+    'output_format': PREPROCESS_OUTPUT_FORMAT,
+    'quality': PREPROCESS_QUALITY
+}
+# Form fields that configure preprocessing rather than becoming meta_tags
+PREPROCESS_FIELDS = ('max_dimension', 'output_format', 'quality')
+
+# Resumable upload sessions are assembled here and deleted after this many idle seconds
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', 'upload_sessions')
+UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))
+UPLOAD_SESSION_SWEEP_INTERVAL = 60
+
+# Batch media can be associated with the subject in groups of up to this many. The Cogniac SDK has
+# no bulk association call, so this is off (1) unless the API behind ASSOCIATE_BULK_PATH offers one
+ASSOCIATE_GROUP_SIZE = int(os.getenv('ASSOCIATE_GROUP_SIZE', 1))
+# Longest a created media waits for its group to fill before the group is sent anyway
+ASSOCIATE_GROUP_WAIT = float(os.getenv('ASSOCIATE_GROUP_WAIT', 0.25))
+# Bulk association endpoint; after a 404/405, or ASSOCIATE_GROUP_MAX_FAILURES failed groups in a row,
+# media are associated one request at a time
+ASSOCIATE_BULK_PATH = os.getenv('ASSOCIATE_BULK_PATH', '/1/subjects/{subject_uid}/mediaAssociate')
+ASSOCIATE_GROUP_MAX_FAILURES = int(os.getenv('ASSOCIATE_GROUP_MAX_FAILURES', 3))
+
+# Per-item retries for transient failures, separate from the upload method fallback
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 1.0))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 30.0))
+# Each batch may spend this fraction of its size on retries (but at least RETRY_BUDGET_MIN)
+RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', 0.2))
+RETRY_BUDGET_MIN = int(os.getenv('RETRY_BUDGET_MIN', 10))
+# How long failed /batch-upload files are kept in memory for /batch-retry, and how many bytes of them
+# at most; past that the oldest go first. Each worker process keeps its own
+FAILED_PAYLOAD_TTL = float(os.getenv('FAILED_PAYLOAD_TTL', 3600))
+FAILED_PAYLOAD_MAX_BYTES = int(os.getenv('FAILED_PAYLOAD_MAX_BYTES', 256 * 1024 * 1024))
+
+# Seconds between keep-alive comments on idle /batch-events streams
+BATCH_EVENTS_HEARTBEAT = float(os.getenv('BATCH_EVENTS_HEARTBEAT', 15))
+
+# /batch-upload images received but not yet uploaded; bounds the memory a single upload can hold
+BATCH_UPLOAD_MAX_PARTS = int(os.getenv('BATCH_UPLOAD_MAX_PARTS', 32))
+BATCH_UPLOAD_MAX_FILES = 500
 
-# Get or create subject
-try:
-    subject = CogniacSubject.get(cc, SUBJECT_UID)
-    print(f"Found existing subject: {subject.subject_uid}")
-except Exception:
-    subject = CogniacSubject.create(cc, uid=SUBJECT_UID, name='Training Subject', consensus=True)
-    print(f"Created new subject: {subject.subject_uid}")
+# Most items of one batch held in memory (queued, uploading or waiting to retry) at a time
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', 256))
+# Folder images are registered with the job store in chunks of this size while scanning
+FOLDER_SCAN_CHUNK = 256
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+
+class SpooledRequest(Request):
+    """Request that buffers uploaded files in memory up to UPLOAD_SPOOL_MAX_BYTES"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+
+# Initialize Flask app
+app = Flask(__name__)
+app.request_class = SpooledRequest
+CORS(app, resources={r"/*": {"origins": "*"}})
+
+def connect_to_cogniac():
+    """Log in to Cogniac and get or create the subject; returns (connection, subject)"""
+    cc = CogniacConnection(username=COG_USER, password=COG_PASS, tenant_id=COG_TENANT)
+    print(f"Connection successful to {cc}")
+    
+    # Get or create subject
+    try:
+        subject = CogniacSubject.get(cc, SUBJECT_UID)
+        print(f"Found existing subject: {subject.subject_uid}")
+    except Exception:
+        subject = CogniacSubject.create(cc, uid=SUBJECT_UID, name='Training Subject', consensus=True)
+        print(f"Created new subject: {subject.subject_uid}")
+    return cc, subject
+
+# Connect lazily, so starting a worker never waits on (or fails with) Cogniac
+cogniac_client = CogniacClient(
+    connect_to_cogniac,
+    retry_after=COGNIAC_CONNECT_RETRY
+)
+
+dedup_index = DedupIndex(DEDUP_DB_PATH, max_entries=DEDUP_MAX_ENTRIES)
+folder_manifest = FolderManifest(FOLDER_MANIFEST_PATH)
 
 # Store upload progress
-upload_progress = {}
+job_store = open_job_store(JOB_STORE_URL)
 
-def upload_single_image(file_data, meta_tags, batch_id):
-    """Upload a single image and return result"""
-    temp_dir = os.path.join(os.getcwd(), "temp_uploads", batch_id)
-    os.makedirs(temp_dir, exist_ok=True)
+# Identifies this worker process as the holder of the batches it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Prometheus metrics, served on /metrics
+stage_seconds = Histogram('uploader_stage_seconds', 'Time spent in each stage of handling an image', ['stage'])
+queue_wait_seconds = Histogram('uploader_queue_wait_seconds', 'Time uploads waited for an upload worker', ['queue'])
+bytes_uploaded = Counter('uploader_bytes_uploaded_total', 'Bytes of image data sent to Cogniac')
+
+upload_limiter = AdaptiveConcurrencyLimiter(
+    initial=UPLOAD_CONCURRENCY_INITIAL,
+    minimum=UPLOAD_CONCURRENCY_MIN,
+    maximum=UPLOAD_CONCURRENCY_MAX,
+    target_latency=UPLOAD_TARGET_LATENCY,
+    target_bytes=UPLOAD_TARGET_BYTES
+)
+
+# One worker pool for every upload in the process, fair-shared across batches
+upload_scheduler = UploadScheduler(
+    UPLOAD_CONCURRENCY_MAX,
+    limit=lambda: upload_limiter.limit,
+    on_wait=lambda key, wait: queue_wait_seconds.observe(wait, queue='interactive' if key == INTERACTIVE else 'batch')
+)
+
+retry_policy = RetryPolicy(
+    max_attempts=RETRY_MAX_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY,
+    max_delay=RETRY_MAX_DELAY
+)
+
+upload_sessions = UploadSessionStore(UPLOAD_SESSION_DIR, UPLOAD_SESSION_TTL)
+
+# Worker processes for image preprocessing, started on first use
+preprocess_pool = None
+preprocess_pool_lock = threading.Lock()
+
+# Buffers of failed /batch-upload items as (buffer, size, expires) by (batch_id, seq), oldest first, so
+# /batch-retry can resend the original bytes. They are only in the memory of the worker that ran the batch
+failed_payloads = OrderedDict()
+failed_payload_bytes = 0
+failed_payloads_lock = threading.Lock()
+
+# Stop events of the folder watches this worker runs, by watch_id; the watches themselves are in the job store
+folder_watches = {}
+folder_watches_lock = threading.Lock()
+batch_retry_lock = threading.Lock()
+
+def cogniac_call(fn, *args, payload_bytes=None, **kwargs):
+    """Make a Cogniac API call inside an adaptive concurrency slot; payload_bytes is the size of any upload"""
+    started = time.perf_counter()
+    with upload_limiter.slot(payload_bytes):
+        stage_seconds.observe(time.perf_counter() - started, stage='concurrency_wait')
+        return fn(*args, **kwargs)
+
+def associate_media_group(media_ids):
+    """Associate several media with the subject in one request; returns {media_id: capture_id}"""
+    resp = cogniac_call(
+        cogniac_client.connection()._post,
+        ASSOCIATE_BULK_PATH.format(subject_uid=SUBJECT_UID),
+        json={'media': [{'media_id': media_id, 'consensus': 'None', 'uncal_prob': .99} for media_id in media_ids]}
+    )
+    # Media left out of the answer or reported with an error are retried on their own
+    return {
+        entry['media_id']: entry['capture_id']
+        for entry in resp.json().get('results', [])
+        if entry.get('capture_id') and not entry.get('error')
+    }
+
+def associate_single_media(media_id):
+    return cogniac_call(cogniac_client.subject().associate_media, media_id)
+
+subject_associator = BulkAssociator(
+    associate_media_group,
+    associate_single_media,
+    max_size=ASSOCIATE_GROUP_SIZE,
+    max_wait=ASSOCIATE_GROUP_WAIT,
+    max_failures=ASSOCIATE_GROUP_MAX_FAILURES
+)
+
+def media_source(source, filename):
+    """CogniacMedia.create arguments for a file path or an open buffer"""
+    if isinstance(source, str):
+        return {'filename': source}
+    return {'filename': filename, 'fp': source}
+
+# Each upload method returns (media, associated); media it leaves unassociated are
+# associated by upload_to_cogniac as a separate step
+
+def create_training_media(source, filename, meta_tags):
+    """Method 1: Try the standard create approach"""
+    with stage_seconds.time(stage='create'):
+        media = cogniac_call(
+            CogniacMedia.create,
+            cogniac_client.connection(),
+            meta_tags=meta_tags,
+            force_set='training',
+            payload_bytes=source_size(source),
+            **media_source(source, filename)
+        )
+    return media, False
+
+def create_media(source, filename, meta_tags):
+    """Method 2: Try creating media with different parameters"""
+    with stage_seconds.time(stage='create'):
+        media = cogniac_call(
+            CogniacMedia.create,
+            cogniac_client.connection(),
+            meta_tags=meta_tags,
+            payload_bytes=source_size(source),
+            **media_source(source, filename)
+        )
+    return media, False
+
+def upload_media_direct(source, filename, meta_tags):
+    """Method 3: Try uploading directly through connection, which also associates the media"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return upload_media_direct(f, filename, meta_tags)
+    source.seek(0)
+    with stage_seconds.time(stage='upload_media'):
+        media = cogniac_call(
+            cogniac_client.connection().upload_media,
+            source,
+            filename=filename,
+            meta_tags=meta_tags,
+            subject_uid=SUBJECT_UID,
+            payload_bytes=source_size(source)
+        )
+    return media, True
+
+upload_router = UploadMethodRouter(
+    [
+        ('create_training', create_training_media),
+        ('create', create_media),
+        ('upload_media', upload_media_direct)
+    ],
+    cooldown=UPLOAD_METHOD_COOLDOWN
+)
+
+def upload_to_cogniac(source, filename, meta_tags, media_id=None, batch_id=None):
+    """Upload a file path or buffer with the best known method, associate it with the subject and return its media_id
+
+    Only creating the media falls back from method to method. If the
+    association fails afterwards, AssociationFailed carries the new
+    media_id; passing it back in as media_id retries just the association
+    rather than creating the media again. Only batch uploads are grouped
+    for association; a lone upload has nothing to wait for.
+    """
+    if media_id is None:
+        with stage_seconds.time(stage='upload'):
+            media, associated = upload_router.run(source, filename, meta_tags)
+        bytes_uploaded.inc(source_size(source))
+        media_id = media.media_id
+        if associated:
+            return media_id
     
-    filename = file_data['filename']
-    temp_path = os.path.join(temp_dir, filename)
+    try:
+        with stage_seconds.time(stage='associate'):
+            subject_associator.associate(media_id, group=batch_id is not None)
+    except Exception as e:
+        raise AssociationFailed(media_id, e)
+    return media_id
+
+def source_size(source):
+    """Size in bytes of a file path or seekable buffer"""
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+def get_preprocess_pool():
+    """Return the preprocessing process pool, starting it if needed"""
+    global preprocess_pool
+    with preprocess_pool_lock:
+        if preprocess_pool is None:
+            preprocess_pool = image_preprocess.create_pool(PREPROCESS_WORKERS)
+            # Lets the workers exit cleanly rather than leaving their semaphores behind
+            atexit.register(preprocess_pool.shutdown)
+        return preprocess_pool
+
+def preprocess_image(source, filename, preprocess):
+    """Downscale/re-encode a path or buffer in the process pool
+
+    Returns (source, filename, bytes_saved) to upload. Images that can't be
+    processed are uploaded unchanged, with bytes_saved None.
+    """
+    copy_path = None
+    try:
+        with stage_seconds.time(stage='preprocess'):
+            if isinstance(source, str):
+                payload = source
+            elif source_size(source) <= UPLOAD_SPOOL_MAX_BYTES:
+                # Small enough to have been spooled in memory; the worker process gets its own copy
+                source.seek(0)
+                payload = source.read()
+                source.seek(0)
+            else:
+                # Spooled to disk: copy it to a file the worker can open, a chunk at a time
+                payload = copy_path = spool_to_file(source, os.path.splitext(filename)[1])
+            data, original_size = get_preprocess_pool().submit(
+                image_preprocess.preprocess, payload, **preprocess
+            ).result()
+    except Exception as e:
+        print(f"Could not preprocess {filename}, uploading it unchanged: {str(e)}")
+        return source, filename, None
+    finally:
+        if copy_path is not None:
+            os.remove(copy_path)
     
+    return io.BytesIO(data), image_preprocess.output_filename(filename, preprocess['output_format']), original_size - len(data)
+
+def spool_to_file(buffer, suffix=''):
+    """Copy a seekable buffer to a new temporary file and return its path; the caller removes it"""
+    buffer.seek(0)
+    f = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
     try:
-        # Save the file
-        file_data['file'].save(temp_path)
+        with f:
+            shutil.copyfileobj(buffer, f)
+    except BaseException:
+        os.remove(f.name)
+        raise
+    buffer.seek(0)
+    return f.name
+
+def parse_flag(data, name, default):
+    """Read a boolean request field, JSON true/false or the strings 'true'/'false'; returns (value, error)"""
+    value = data.get(name, default)
+    if isinstance(value, bool):
+        return value, None
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true', None
+    return None, f'{name} must be true or false'
+
+def form_meta_tags(form, exclude=()):
+    """meta_tags from form data: the meta_tags fields, or else every other field as key:value"""
+    meta_tags = form.getlist('meta_tags')
+    if not meta_tags:
+        meta_tags = []
+        for key, value in form.items():
+            if key not in exclude:
+                meta_tags.append(f"{key}:{value}")
+    return meta_tags
+
+def upload_error(filename, error):
+    """Result for an image whose upload raised"""
+    result = {
+        'status': 'error',
+        'filename': filename,
+        'error': str(error),
+        'retryable': is_retryable(error)
+    }
+    if isinstance(error, AssociationFailed):
+        # Created but not associated; /batch-retry picks this up
+        result['media_id'] = error.media_id
+    return result
+
+def upload_image_source(source, filename, meta_tags, preprocess=None, item=None, batch_id=None):
+    """Upload a file path or seekable buffer unless the subject already has its content
+
+    Every upload goes through here: hash, dedup lookup, optional
+    preprocessing, upload and recording the new media in the dedup index.
+    Returns (result, digest); upload errors are raised. item is the batch
+    item, if any: a media created by an attempt whose association failed is
+    kept in item['media_id'], and later attempts only associate it.
+    batch_id is None for uploads outside a batch.
+    """
+    with stage_seconds.time(stage='hash'):
+        digest = hash_file(source) if isinstance(source, str) else hash_stream(source)
+    with dedup_index.reserve(digest, SUBJECT_UID):
+        # Skip content that has already been uploaded to this subject
+        existing_media_id = dedup_index.lookup(digest, SUBJECT_UID)
+        if existing_media_id:
+            return {
+                'status': 'duplicate',
+                'filename': filename,
+                'media_id': existing_media_id
+            }, digest
         
         # Upload to Cogniac
+        created_media_id = item.get('media_id') if item is not None else None
+        upload_source, upload_filename, bytes_saved = source, filename, None
+        if preprocess and created_media_id is None:
+            upload_source, upload_filename, bytes_saved = preprocess_image(source, filename, preprocess)
         try:
-            # Method 1: Try the standard create and associate approach
-            media = CogniacMedia.create(
-                cc,
-                filename=temp_path,
-                meta_tags=meta_tags,
-                force_set='training'
-            )
-            subject.associate_media(media)
-            
-        except Exception as e1:
-            try:
-                # Method 2: Try creating media with different parameters
-                media = CogniacMedia.create(
-                    cc,
-                    filename=temp_path,
-                    meta_tags=meta_tags
-                )
-                subject.associate_media(media)
-                
-            except Exception as e2:
-                try:
-                    # Method 3: Try uploading directly through connection
-                    with open(temp_path, 'rb') as f:
-                        media = cc.upload_media(
-                            f,
-                            filename=filename,
-                            meta_tags=meta_tags,
-                            subject_uid=subject.subject_uid
-                        )
-                except Exception as e3:
-                    raise Exception(f"All upload methods failed. Last error: {str(e3)}")
-        
-        return {
-            'status': 'success',
-            'filename': filename,
-            'media_id': media.media_id
-        }
-        
+            media_id = upload_to_cogniac(upload_source, upload_filename, meta_tags, created_media_id, batch_id)
+        except AssociationFailed as e:
+            if item is not None:
+                item['media_id'] = e.media_id
+            raise
+        dedup_index.record(digest, SUBJECT_UID, media_id)
+    
+    result = {
+        'status': 'success',
+        'filename': filename,
+        'media_id': media_id
+    }
+    if bytes_saved is not None:
+        result['bytes_saved'] = bytes_saved
+    return result, digest
+
+def upload_single_image(file_data, meta_tags, batch_id, preprocess=None):
+    """Upload a single image and return result"""
+    # The caller owns file_data['buffer'] and may need it again for a retry;
+    # resumed items only have the copy kept in JOB_PAYLOAD_DIR
+    source = file_data.get('buffer')
+    if source is None:
+        source = file_data['payload_path']
+    try:
+        return upload_image_source(source, file_data['filename'], meta_tags, preprocess, file_data, batch_id)[0]
     except Exception as e:
-        return {
-            'status': 'error',
-            'filename': filename,
-            'error': str(e)
-        }
-    finally:
-        # Clean up temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        return upload_error(file_data['filename'], e)
 
 @app.route('/upload', methods=['POST'])
 def upload_image():
     """Single image upload endpoint"""
-    if 'image' not in request.files:
+    # Parsing the form is what reads the upload off the socket into its spool
+    with stage_seconds.time(stage='receive'):
+        files = request.files
+    if 'image' not in files:
         return jsonify({'error': 'No image file in request'}), 400
 
-    img = request.files['image']
+    img = files['image']
     filename = img.filename
 
     if not filename:
         return jsonify({'error': 'No filename provided'}), 400
 
-    # Save temporarily in a safe directory
-    temp_dir = os.path.join(os.getcwd(), "temp_uploads")
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_path = os.path.join(temp_dir, filename)
-    img.save(temp_path)
+    # Get meta_tags from form data
+    meta_tags = form_meta_tags(request.form, exclude=('image',) + PREPROCESS_FIELDS)
+
+    preprocess, error = image_preprocess.parse_options(request.form, PREPROCESS_DEFAULTS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # The upload is already buffered by SpooledRequest; hand it straight to Cogniac.
+    # Interactive uploads jump ahead of queued batch work.
+    file_data = {'filename': filename, 'buffer': img.stream}
+    result = upload_scheduler.submit(upload_single_image, file_data, meta_tags, None, preprocess).result()
+    return upload_response(result, filename, meta_tags)
+
+def upload_response(result, filename, meta_tags, **extra):
+    """Response for a single uploaded image, as returned by /upload"""
+    if result['status'] == 'error':
+        print(f"Error uploading media: {result['error']}")
+        return jsonify(dict(extra, error=f"Failed to upload media: {result['error']}")), 500
+
+    if result['status'] == 'duplicate':
+        print(f"Skipping duplicate of media: {result['media_id']}")
+        status = 'already uploaded'
+    else:
+        print(f"Successfully uploaded media: {result['media_id']}")
+        status = 'uploaded successfully'
+
+    response = {
+        'media_id': result['media_id'],
+        'subject_uid': SUBJECT_UID,
+        'filename': filename,
+        'meta_tags': meta_tags,
+        'status': status
+    }
+    if 'bytes_saved' in result:
+        response['bytes_saved'] = result['bytes_saved']
+    response.update(extra)
+    return jsonify(response)
+
+def session_summary(session):
+    """Public view of an upload session"""
+    return {
+        'session_id': session['session_id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['offset'],
+        'expires_at': session['expires_at']
+    }
+
+@app.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload for a large image
 
+    Send the bytes with PUT /upload-sessions/<id> and a Content-Range header,
+    check how much arrived with GET, then POST .../finalize to upload it.
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('filename'):
+        return jsonify({'error': 'filename is required in JSON body'}), 400
+    
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({'error': 'size must be a non-negative integer'}), 400
+    
+    preprocess, error = image_preprocess.parse_options(data, PREPROCESS_DEFAULTS)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    session = upload_sessions.create(
+        os.path.basename(data['filename']),
+        size,
+        data.get('meta_tags', []),
+        {'preprocess': preprocess}
+    )
+    return jsonify(session_summary(session)), 201
+
+@app.route('/upload-sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Report how many bytes of an upload have been received"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found or expired'}), 404
+    return jsonify(session_summary(session))
+
+@app.route('/upload-sessions/<session_id>', methods=['PUT'])
+def put_upload_session(session_id):
+    """Append a byte range to an upload
+
+    Content-Range: bytes <start>-<end>/<size or *>. The range must start at or
+    before the received offset; bytes already received are skipped. Without
+    the header, the body is the whole file.
+    """
+    content_range = request.headers.get('Content-Range')
+    if content_range is None:
+        start, length, total = 0, request.content_length, request.content_length
+        if length is None:
+            return jsonify({'error': 'Content-Range or Content-Length is required'}), 400
+    else:
+        parsed = parse_content_range(content_range)
+        if parsed is None:
+            return jsonify({'error': 'Content-Range must look like bytes <start>-<end>/<size or *>'}), 400
+        start, end, total = parsed
+        length = end - start + 1
+        if request.content_length is not None and request.content_length != length:
+            return jsonify({'error': 'Content-Length does not match Content-Range'}), 400
+    
+    try:
+        offset = upload_sessions.append(session_id, request.stream, start, length, total)
+    except KeyError:
+        return jsonify({'error': 'Upload session not found or expired'}), 404
+    except OffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), 416
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    session = upload_sessions.get(session_id)
+    response = session_summary(session)
+    response['complete'] = session['size'] is not None and offset == session['size']
+    return jsonify(response)
+
+@app.route('/upload-sessions/<session_id>', methods=['DELETE'])
+def delete_upload_session(session_id):
+    """Abandon an upload and free its disk space"""
+    if upload_sessions.get(session_id) is None:
+        return jsonify({'error': 'Upload session not found or expired'}), 404
+    upload_sessions.remove(session_id)
+    return jsonify({'session_id': session_id, 'status': 'deleted'})
+
+@app.route('/upload-sessions/<session_id>/finalize', methods=['POST'])
+def finalize_upload_session(session_id):
+    """Upload an assembled image to Cogniac; the session stays open if this fails"""
+    def upload(session):
+        file_data = {'filename': session['filename'], 'payload_path': upload_sessions.data_path(session_id)}
+        return upload_scheduler.submit(
+            upload_single_image,
+            file_data,
+            session['meta_tags'],
+            None,
+            session['options'].get('preprocess')
+        ).result()
+    
     try:
-        # Get meta_tags from form data
-        meta_tags = request.form.getlist('meta_tags')
-        if not meta_tags:
-            meta_tags = []
-            for key, value in request.form.items():
-                if key != 'image':
-                    meta_tags.append(f"{key}:{value}")
-
-        # Alternative approach - upload media and then associate with subject
+        session, result = upload_sessions.finalize(session_id, upload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    if session is None:
+        return jsonify({'error': 'Upload session not found or expired'}), 404
+    
+    return upload_response(result, session['filename'], session['meta_tags'], session_id=session_id)
+
+def expire_upload_sessions():
+    """Delete idle upload sessions in the background"""
+    while True:
+        time.sleep(UPLOAD_SESSION_SWEEP_INTERVAL)
         try:
-            media = CogniacMedia.create(
-                cc,
-                filename=temp_path,
-                meta_tags=meta_tags,
-                force_set='training'
-            )
-            subject.associate_media(media)
-            
-        except Exception as e1:
-            try:
-                media = CogniacMedia.create(
-                    cc,
-                    filename=temp_path,
-                    meta_tags=meta_tags
-                )
-                subject.associate_media(media)
-                
-            except Exception as e2:
-                try:
-                    with open(temp_path, 'rb') as f:
-                        media = cc.upload_media(
-                            f,
-                            filename=filename,
-                            meta_tags=meta_tags,
-                            subject_uid=subject.subject_uid
-                        )
-                        
-                except Exception as e3:
-                    raise Exception(f"All upload methods failed. Last error: {str(e3)}")
-        
-        print(f"Successfully uploaded media: {media.media_id}")
-        
-        return jsonify({
-            'media_id': media.media_id,
-            'subject_uid': subject.subject_uid,
-            'filename': filename,
-            'meta_tags': meta_tags,
-            'status': 'uploaded successfully'
-        })
-        
-    except Exception as e:
-        print(f"Error uploading media: {str(e)}")
-        return jsonify({'error': f'Failed to upload media: {str(e)}'}), 500
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+            expired = upload_sessions.expire_idle()
+        except OSError as e:
+            print(f"Could not expire upload sessions: {str(e)}")
+            continue
+        if expired:
+            print(f"Expired {expired} idle upload sessions")
+
+def new_batch_id(prefix):
+    """Batch ID that stays unique across worker processes and hosts sharing a job store"""
+    return f"{prefix}_{int(time.time())}_{uuid.uuid4().hex[:12]}"
 
 @app.route('/batch-upload', methods=['POST'])
 def batch_upload():
-    """Batch upload endpoint for multiple images"""
-    files = request.files.getlist('images')
+    """Batch upload endpoint for multiple images
+
+    The body is parsed as it arrives and each image starts uploading as soon
+    as its part is complete, so form fields (meta_tags) must come before the
+    images. Fields sent after the first image are ignored.
+    """
+    boundary = multipart_boundary(request.content_type)
+    if boundary is None:
+        return jsonify({'error': 'Request must be multipart/form-data'}), 400
     
-    if not files:
-        return jsonify({'error': 'No image files in request'}), 400
+    # Reading the body pauses while BATCH_UPLOAD_MAX_PARTS images are waiting to upload
+    part_slots = threading.BoundedSemaphore(BATCH_UPLOAD_MAX_PARTS)
+    accepted = 0
+    skipped = 0
     
-    if len(files) > 500:
-        return jsonify({'error': 'Maximum 500 images allowed per batch'}), 400
+    def file_factory(name, filename):
+        nonlocal skipped
+        if name != 'images':
+            return None
+        if accepted >= BATCH_UPLOAD_MAX_FILES:
+            skipped += 1
+            return None
+        part_slots.acquire()
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
     
-    # Generate batch ID
-    batch_id = f"batch_{int(time.time())}"
+    form = MultiDict()
+    ignored_fields = []
+    batch_id = None
+    pending = queue.Queue()
+    error = None
     
-    # Get meta_tags from form data
-    meta_tags = request.form.getlist('meta_tags')
-    if not meta_tags:
-        meta_tags = []
-        for key, value in request.form.items():
-            if key not in ['images']:
-                meta_tags.append(f"{key}:{value}")
-    
-    # Initialize progress tracking
-    upload_progress[batch_id] = {
-        'total': len(files),
-        'completed': 0,
-        'successful': 0,
-        'failed': 0,
-        'status': 'processing',
-        'results': []
-    }
-    
-    # Prepare file data
-    file_data_list = []
-    for file in files:
-        if file.filename:
-            file_data_list.append({
-                'file': file,
-                'filename': file.filename
-            })
-    
-    def process_batch():
-        """Process batch upload in background"""
-        successful_uploads = []
-        failed_uploads = []
-        
-        # Use ThreadPoolExecutor for parallel uploads (be careful with rate limits)
-        max_workers = min(10, len(file_data_list))  # Limit concurrent uploads
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all upload tasks
-            future_to_file = {
-                executor.submit(upload_single_image, file_data, meta_tags, batch_id): file_data
-                for file_data in file_data_list
-            }
+    try:
+        for part in iter_multipart(request.stream, boundary, file_factory):
+            if part[0] == 'field':
+                _, name, value = part
+                if batch_id is None:
+                    form.add(name, value)
+                else:
+                    ignored_fields.append(name)
+                continue
             
-            # Process completed uploads
-            for future in as_completed(future_to_file):
-                file_data = future_to_file[future]
-                try:
-                    result = future.result()
-                    
-                    if result['status'] == 'success':
-                        successful_uploads.append(result)
-                        upload_progress[batch_id]['successful'] += 1
-                    else:
-                        failed_uploads.append(result)
-                        upload_progress[batch_id]['failed'] += 1
-                    
-                    upload_progress[batch_id]['completed'] += 1
-                    upload_progress[batch_id]['results'].append(result)
-                    
-                except Exception as e:
-                    failed_uploads.append({
-                        'status': 'error',
-                        'filename': file_data['filename'],
-                        'error': str(e)
-                    })
-                    upload_progress[batch_id]['failed'] += 1
-                    upload_progress[batch_id]['completed'] += 1
-        
-        # Update final status
-        upload_progress[batch_id]['status'] = 'completed'
-        
-        # Clean up temp directory
-        temp_dir = os.path.join(os.getcwd(), "temp_uploads", batch_id)
-        if os.path.exists(temp_dir):
-            try:
-                os.rmdir(temp_dir)
-            except:
-                pass  # Directory might not be empty, that's okay
+            _, _, filename, buffer = part
+            if batch_id is None:
+                # The first image fixes the meta_tags and options; start uploading right away
+                preprocess, error = image_preprocess.parse_options(form, PREPROCESS_DEFAULTS)
+                if error:
+                    buffer.close()
+                    return jsonify({'error': error}), 400
+                batch_id = new_batch_id('batch')
+                meta_tags = form_meta_tags(form, exclude=('images',) + PREPROCESS_FIELDS)
+                options = {'preprocess': preprocess}
+                job_store.create_batch(batch_id, 'upload', meta_tags, [], options, scanning=True,
+                                       owner=WORKER_ID, lease=BATCH_LEASE_SECONDS)
+                start_batch(batch_id, iter(pending.get, None), batch_uploader(batch_id, meta_tags, options))
+            
+            file_data = {'buffer': buffer, 'filename': filename, 'part_slot': part_slots}
+            if JOB_PAYLOAD_DIR:
+                # Keep a copy on disk so the batch can resume after a restart
+                file_data['payload_path'] = save_payload(batch_id, accepted, buffer)
+            file_data['seq'] = job_store.add_items(batch_id, [(filename, file_data.get('payload_path'))])
+            pending.put(file_data)
+            accepted += 1
+    except (ValueError, ClientDisconnected) as e:
+        error = str(e)
+    finally:
+        if batch_id is not None:
+            job_store.finish_scan(batch_id)
+            pending.put(None)
     
-    # Start batch processing in background
-    thread = threading.Thread(target=process_batch)
-    thread.daemon = True
-    thread.start()
+    if batch_id is None:
+        if error:
+            return jsonify({'error': f'Malformed multipart body: {error}'}), 400
+        return jsonify({'error': 'No image files in request'}), 400
     
-    return jsonify({
+    if error:
+        print(f"Batch {batch_id} body ended early: {error}")
+        return jsonify({
+            'batch_id': batch_id,
+            'total_files': accepted,
+            'error': f'Request body ended early; only the first {accepted} images are being uploaded: {error}'
+        }), 400
+    
+    response = {
         'batch_id': batch_id,
-        'total_files': len(file_data_list),
+        'total_files': accepted,
         'status': 'processing',
         'message': 'Batch upload started. Use /batch-status/{batch_id} to check progress.'
-    })
+    }
+    if skipped:
+        response['skipped_files'] = skipped
+        response['message'] = (f'Maximum {BATCH_UPLOAD_MAX_FILES} images allowed per batch; '
+                               f'the other {skipped} were not uploaded. ' + response['message'])
+    if ignored_fields:
+        response['ignored_fields'] = ignored_fields
+    return jsonify(response)
 
-@app.route('/batch-status/<batch_id>', methods=['GET'])
-def get_batch_status(batch_id):
-    """Get batch upload status"""
-    if batch_id not in upload_progress:
-        return jsonify({'error': 'Batch ID not found'}), 404
-    
-    progress = upload_progress[batch_id]
-    
-    return jsonify({
+def batch_summary(batch_id, progress):
+    """Batch counters as returned by /batch-status"""
+    return {
         'batch_id': batch_id,
         'status': progress['status'],
         'total': progress['total'],
         'completed': progress['completed'],
         'successful': progress['successful'],
         'failed': progress['failed'],
-        'progress_percentage': (progress['completed'] / progress['total']) * 100,
-        'results': progress['results']
-    })
+        'duplicates': progress['duplicates'],
+        'near_duplicates': progress['near_duplicates'],
+        'bytes_saved': progress['bytes_saved'],
+        'scanning': bool(progress['scanning']),
+        'progress_percentage': (progress['completed'] / progress['total']) * 100 if progress['total'] else 0.0
+    }
+
+@app.route('/batch-status/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Get batch upload status
+
+    ?summary=1 leaves out per-file results. ?since=<seq> returns only results
+    recorded after that cursor (at most ?limit=); pass back next_since to
+    fetch the next increment.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    progress = job_store.get_batch(batch_id)
+    if progress is None:
+        archived = load_archive(BATCH_ARCHIVE_DIR, batch_id, since, limit) if BATCH_ARCHIVE_DIR else None
+        if archived is None:
+            return jsonify({'error': 'Batch ID not found'}), 404
+        progress, results = archived
+    else:
+        results = None
+    
+    response = batch_summary(batch_id, progress)
+    if request.args.get('summary', '').lower() in ('1', 'true', 'yes'):
+        return jsonify(response)
+    
+    if results is None:
+        results = job_store.get_results(batch_id, since=since, limit=limit)
+    response['results'] = [result for _, result in results]
+    response['next_since'] = results[-1][0] if results else since
+    return jsonify(response)
+
+@app.route('/batch-events/<batch_id>', methods=['GET'])
+def stream_batch_events(batch_id):
+    """Server-sent events: one 'result' event per finished file, then 'done'
+
+    Reconnecting clients resume from the Last-Event-ID header (or ?since=).
+    A batch evicted from the job store mid-stream is finished from its
+    archive if there is one, and otherwise ends with an 'evicted' event.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    archived = None
+    if job_store.get_batch(batch_id) is None:
+        archived = load_archive(BATCH_ARCHIVE_DIR, batch_id, since) if BATCH_ARCHIVE_DIR else None
+        if archived is None:
+            return jsonify({'error': 'Batch ID not found'}), 404
+    
+    def archived_events(progress, results):
+        for seq, result in results:
+            yield f"id: {seq}\nevent: result\ndata: {json.dumps(result)}\n\n"
+        yield f"event: done\ndata: {json.dumps(batch_summary(batch_id, progress))}\n\n"
+    
+    def events(cursor):
+        # Read before the state it covers, so nothing committed after the read is waited past
+        version = job_store.change_version()
+        while True:
+            progress = job_store.get_batch(batch_id)
+            if progress is None:
+                archive = load_archive(BATCH_ARCHIVE_DIR, batch_id, cursor) if BATCH_ARCHIVE_DIR else None
+                if archive:
+                    yield from archived_events(*archive)
+                else:
+                    evicted = {'batch_id': batch_id, 'error': 'Batch was removed from the job store'}
+                    yield f"event: evicted\ndata: {json.dumps(evicted)}\n\n"
+                return
+            results = job_store.get_results(batch_id, since=cursor, limit=500)
+            for seq, result in results:
+                yield f"id: {seq}\nevent: result\ndata: {json.dumps(result)}\n\n"
+                cursor = seq
+            
+            if results:
+                yield f"event: progress\ndata: {json.dumps(batch_summary(batch_id, progress))}\n\n"
+                continue
+            if progress['status'] != 'processing':
+                yield f"event: done\ndata: {json.dumps(batch_summary(batch_id, progress))}\n\n"
+                return
+            
+            changed = job_store.wait_for_change(version, BATCH_EVENTS_HEARTBEAT)
+            if changed is None:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            else:
+                version = changed
+    
+    return Response(
+        stream_with_context(archived_events(*archived) if archived else events(since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def upload_single_image_from_path(file_path, meta_tags, batch_id, near_duplicate_index=None, filename=None,
+                                  preprocess=None, sync_folder=None, item=None):
+    """Upload a single image from file path
+
+    With sync_folder, the file is recorded in that folder's manifest once it
+    is uploaded or found to be a duplicate, so the next sync skips it. item
+    is the batch item being uploaded, as for upload_image_source().
+    """
+    filename = filename or os.path.basename(file_path)
+    
+    try:
+        if sync_folder is not None:
+            # Taken before reading, so a change made during the upload is picked up by the next sync
+            stat = os.stat(file_path)
+        
+        perceptual = None
+        if near_duplicate_index is not None:
+            try:
+                with stage_seconds.time(stage='near_duplicate'):
+                    perceptual, match = near_duplicate_index.check(file_path, filename)
+            except Exception as e:
+                # Undecodable images are uploaded as usual rather than dropped
+                print(f"Could not hash {filename}: {str(e)}")
+                match = None
+            if match:
+                if sync_folder is not None:
+                    record_synced_file(sync_folder, filename, stat, None, None)
+                return {
+                    'status': 'near_duplicate',
+                    'filename': filename,
+                    'duplicate_of': match[0],
+                    'distance': match[1]
+                }
+        
+        result, digest = upload_image_source(file_path, filename, meta_tags, preprocess, item, batch_id)
+        # Only images now in Cogniac make later ones near-duplicates; a failed upload is retried in full
+        if perceptual is not None:
+            near_duplicate_index.add(perceptual, filename)
+        if sync_folder is not None:
+            record_synced_file(sync_folder, filename, stat, digest, result['media_id'])
+        return result
+        
+    except Exception as e:
+        return upload_error(filename, e)
 
 @app.route('/upload-folder', methods=['POST'])
 def upload_folder():
@@ -310,151 +955,712 @@ def upload_folder():
     if not os.path.exists(folder_path):
         return jsonify({'error': 'Folder path does not exist'}), 400
     
-    # Get all image files from folder
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-    image_files = []
+    recursive, error = parse_flag(data, 'recursive', FOLDER_RECURSIVE_DEFAULT)
+    if error:
+        return jsonify({'error': error}), 400
     
-    for filename in os.listdir(folder_path):
-        if any(filename.lower().endswith(ext) for ext in image_extensions):
-            image_files.append(os.path.join(folder_path, filename))
+    # Sync mode uploads only files that are new or changed since the last sync of this folder;
+    # a watch_interval keeps re-syncing it every that many seconds
+    watch_interval = data.get('watch_interval')
+    sync, error = parse_flag(data, 'sync', False)
+    if error:
+        return jsonify({'error': error}), 400
+    sync = sync or watch_interval is not None
+    if watch_interval is not None:
+        try:
+            watch_interval = float(watch_interval)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'watch_interval must be a number of seconds'}), 400
+        if watch_interval < FOLDER_WATCH_MIN_INTERVAL:
+            return jsonify({'error': f'watch_interval must be at least {FOLDER_WATCH_MIN_INTERVAL} seconds'}), 400
     
-    if not image_files:
-        return jsonify({'error': 'No image files found in the folder'}), 400
+    # Get meta_tags from request
+    meta_tags = data.get('meta_tags', [])
     
-    if len(image_files) > 500:
-        return jsonify({'error': f'Too many images ({len(image_files)}). Maximum 500 allowed.'}), 400
+    # Optional perceptual near-duplicate filtering for burst/frame captures
+    threshold = data.get('near_duplicate_threshold', NEAR_DUPLICATE_THRESHOLD)
+    hash_name = data.get('near_duplicate_hash', NEAR_DUPLICATE_HASH)
+    if threshold is not None:
+        if not perceptual_hash.is_available():
+            return jsonify({'error': 'Near-duplicate filtering requires numpy and Pillow'}), 400
+        if hash_name not in perceptual_hash.HASH_FUNCTIONS:
+            return jsonify({'error': f'Unknown near_duplicate_hash: {hash_name}'}), 400
+        try:
+            threshold = int(threshold)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'near_duplicate_threshold must be an integer'}), 400
     
-    # Generate batch ID
-    batch_id = f"folder_batch_{int(time.time())}"
+    # Optional downscale/re-encode before upload
+    preprocess, error = image_preprocess.parse_options(data, PREPROCESS_DEFAULTS)
+    if error:
+        return jsonify({'error': error}), 400
+    options = {
+        'folder_path': folder_path,
+        'recursive': recursive,
+        'near_duplicate_threshold': threshold,
+        'near_duplicate_hash': hash_name,
+        'preprocess': preprocess,
+        'sync': sync
+    }
     
-    # Get meta_tags from request
-    meta_tags = data.get('meta_tags', [])
+    batch_id, items = open_folder_batch(options, meta_tags)
+    if batch_id is None and not sync:
+        return jsonify({'error': 'No image files found in the folder'}), 400
     
-    # Initialize progress tracking
-    upload_progress[batch_id] = {
-        'total': len(image_files),
-        'completed': 0,
-        'successful': 0,
-        'failed': 0,
-        'status': 'processing',
-        'results': []
+    response = {
+        'batch_id': batch_id,
+        'status': 'processing' if batch_id else 'up to date',
+        'folder_path': folder_path,
+        'recursive': recursive,
+        'sync': sync
     }
+    if watch_interval is not None:
+        # The watcher runs this first batch itself, then re-syncs on its timer
+        watch = start_folder_watch(options, meta_tags, watch_interval, batch_id, items)
+        response['watch_id'] = watch['watch_id']
+        response['watch_interval'] = watch_interval
+    elif batch_id:
+        start_batch(batch_id, items, folder_uploader(batch_id, meta_tags, options))
     
-    def upload_single_image_from_path(file_path, meta_tags, batch_id):
-        """Upload a single image from file path"""
-        filename = os.path.basename(file_path)
-        
+    if batch_id:
+        # The folder is still being walked; this is the count registered so far, and /batch-status has the running total
+        progress = job_store.get_batch(batch_id)
+        response['total_files'] = progress['total']
+        response['scanning'] = bool(progress['scanning'])
+        response['message'] = f'Folder batch upload started; images are uploaded as the folder is scanned. Use /batch-status/{batch_id} to check progress.'
+    else:
+        response['total_files'] = 0
+        response['scanning'] = False
+        response['message'] = 'No new or changed images since the last sync'
+    return jsonify(response)
+
+def open_folder_batch(options, meta_tags):
+    """Start tracking a batch for the folder's images; returns (batch_id, items), or (None, None) if there are none
+
+    The folder is walked lazily; files are registered and uploaded as they
+    are found. In sync mode, files unchanged since the last sync are left out.
+    """
+    image_files = folder_images(options)
+    first_file = next(image_files, None)
+    if first_file is None:
+        return None, None
+    
+    batch_id = new_batch_id('folder_batch')
+    # Initialize progress tracking; the total grows as the folder is scanned
+    job_store.create_batch(batch_id, 'folder', meta_tags, [], options, scanning=True,
+                           owner=WORKER_ID, lease=BATCH_LEASE_SECONDS)
+    return batch_id, scan_folder_items(batch_id, options['folder_path'], itertools.chain([first_file], image_files))
+
+def folder_images(options):
+    """Yield the image paths a folder batch with these options uploads, walking the folder lazily"""
+    folder_path = options['folder_path']
+    image_files = iter_image_files(folder_path, options.get('recursive', FOLDER_RECURSIVE_DEFAULT))
+    if options.get('sync'):
+        image_files = changed_files(folder_path, image_files)
+    return image_files
+
+def changed_files(folder_path, image_files):
+    """Leave out files whose size and mtime match their manifest entry for this folder and subject"""
+    folder = os.path.realpath(folder_path)
+    for file_path in image_files:
         try:
-            # Upload to Cogniac
+            stat = os.stat(file_path)
+        except OSError:
+            # Deleted since it was listed
+            continue
+        path = os.path.relpath(file_path, folder_path)
+        if not folder_manifest.unchanged(folder, SUBJECT_UID, path, stat.st_size, stat.st_mtime_ns):
+            yield file_path
+
+def record_synced_file(folder_path, filename, stat, digest, media_id):
+    folder_manifest.record(
+        os.path.realpath(folder_path), SUBJECT_UID, filename, stat.st_size, stat.st_mtime_ns, digest, media_id
+    )
+
+def start_folder_watch(options, meta_tags, interval, batch_id, items):
+    """Re-sync a folder every interval seconds, starting with the given batch
+
+    The watch is kept in the job store, so any worker can list or stop it and
+    another worker takes it over if this one stops.
+    """
+    watch = job_store.create_watch(uuid.uuid4().hex, options, meta_tags, interval,
+                                   owner=WORKER_ID, lease=BATCH_LEASE_SECONDS)
+    run_folder_watch(watch, batch_id, items)
+    return watch
+
+def run_folder_watch(watch, batch_id=None, items=None):
+    """Run a watch this worker holds on a background thread"""
+    stop = threading.Event()
+    with folder_watches_lock:
+        folder_watches[watch['watch_id']] = stop
+    thread = threading.Thread(target=watch_folder, args=(watch, stop, batch_id, items))
+    thread.daemon = True
+    thread.start()
+
+def watch_folder(watch, stop, batch_id, items):
+    """Run one sync batch at a time until the watch is stopped or another worker holds it"""
+    watch_id, options, meta_tags = watch['watch_id'], watch['options'], watch['meta_tags']
+    try:
+        while True:
+            if batch_id is not None:
+                job_store.add_watch_batch(watch_id, batch_id, FOLDER_WATCH_HISTORY)
+                watch['batches'] = (watch['batches'] + [batch_id])[-FOLDER_WATCH_HISTORY:]
+                process_batch(batch_id, items, folder_uploader(batch_id, meta_tags, options))
+            job_store.watch_synced(watch_id)
+            while True:
+                if stop.wait(watch['interval']) or not job_store.holds_watch(watch_id, WORKER_ID):
+                    return
+                # After a takeover the previous owner's last batch is resumed on its own; sync once it is done
+                last_batch = job_store.get_batch(watch['batches'][-1]) if watch['batches'] else None
+                if last_batch is None or last_batch['status'] != 'processing':
+                    break
+            batch_id = None
             try:
-                # Method 1: Try the standard create and associate approach
-                media = CogniacMedia.create(
-                    cc,
-                    filename=file_path,
-                    meta_tags=meta_tags,
-                    force_set='training'
-                )
-                subject.associate_media(media)
-                
-            except Exception as e1:
-                try:
-                    # Method 2: Try creating media with different parameters
-                    media = CogniacMedia.create(
-                        cc,
-                        filename=file_path,
-                        meta_tags=meta_tags
-                    )
-                    subject.associate_media(media)
-                    
-                except Exception as e2:
-                    try:
-                        # Method 3: Try uploading directly through connection
-                        with open(file_path, 'rb') as f:
-                            media = cc.upload_media(
-                                f,
-                                filename=filename,
-                                meta_tags=meta_tags,
-                                subject_uid=subject.subject_uid
-                            )
-                    except Exception as e3:
-                        raise Exception(f"All upload methods failed. Last error: {str(e3)}")
-            
-            return {
-                'status': 'success',
-                'filename': filename,
-                'media_id': media.media_id
-            }
-            
+                batch_id, items = open_folder_batch(options, meta_tags)
+            except Exception as e:
+                print(f"Could not sync watched folder {options['folder_path']}: {str(e)}")
+    finally:
+        with folder_watches_lock:
+            folder_watches.pop(watch_id, None)
+
+def resume_folder_watches():
+    """Take over folder watches left by a stopped worker, once their lease has run out"""
+    for watch in job_store.claim_watches(WORKER_ID, BATCH_LEASE_SECONDS):
+        print(f"Resuming watch {watch['watch_id']} of {watch['options']['folder_path']}")
+        run_folder_watch(watch)
+
+def watch_summary(watch):
+    """Public view of a folder watch"""
+    return {
+        'watch_id': watch['watch_id'],
+        'folder_path': watch['options']['folder_path'],
+        'watch_interval': watch['interval'],
+        'created_at': watch['created_at'],
+        'last_sync_at': watch['last_sync_at'],
+        'recent_batches': watch['batches'],
+        'manifest': folder_manifest.stats(os.path.realpath(watch['options']['folder_path']), SUBJECT_UID)
+    }
+
+@app.route('/folder-watches', methods=['GET'])
+def list_folder_watches():
+    """Folders kept in sync, by every worker sharing the job store"""
+    return jsonify({'watches': [watch_summary(watch) for watch in job_store.list_watches()]})
+
+@app.route('/folder-watches/<watch_id>', methods=['DELETE'])
+def stop_folder_watch(watch_id):
+    """Stop re-syncing a folder; a batch already running finishes"""
+    watch = job_store.delete_watch(watch_id)
+    if watch is None:
+        return jsonify({'error': 'Folder watch not found'}), 404
+    # A watch run by another worker stops when that worker next checks the job store
+    with folder_watches_lock:
+        stop = folder_watches.get(watch_id)
+    if stop is not None:
+        stop.set()
+    return jsonify(dict(watch_summary(watch), status='stopped'))
+
+def iter_image_files(folder_path, recursive=FOLDER_RECURSIVE_DEFAULT):
+    """Yield image file paths under folder_path without listing the folder up front"""
+    directories = [folder_path]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            directories.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            print(f"Skipping unreadable directory {directory}: {str(e)}")
+
+def scan_folder_items(batch_id, folder_path, image_files, skip_known=False):
+    """Register folder images with the job store a chunk at a time and yield them as batch items"""
+    chunk = []
+    
+    def flush():
+        first_seq = job_store.add_items(batch_id, chunk)
+        items = [
+            {'seq': first_seq + offset, 'filename': filename, 'path': file_path}
+            for offset, (filename, file_path) in enumerate(chunk)
+        ]
+        chunk.clear()
+        return items
+    
+    for file_path in image_files:
+        if skip_known and job_store.has_source(batch_id, file_path):
+            continue
+        chunk.append((os.path.relpath(file_path, folder_path), file_path))
+        if len(chunk) >= FOLDER_SCAN_CHUNK:
+            yield from flush()
+    if chunk:
+        yield from flush()
+    
+    job_store.finish_scan(batch_id)
+
+def batch_uploader(batch_id, meta_tags, options):
+    """Return the per-item upload function for a /batch-upload batch"""
+    preprocess = options.get('preprocess')
+    
+    def upload_item(file_data):
+        return upload_single_image(file_data, meta_tags, batch_id, preprocess)
+    
+    return upload_item
+
+def folder_uploader(batch_id, meta_tags, options):
+    """Return the per-item upload function for a folder batch"""
+    near_duplicate_index = None
+    if options.get('near_duplicate_threshold') is not None:
+        near_duplicate_index = perceptual_hash.NearDuplicateIndex(
+            options['near_duplicate_threshold'],
+            options['near_duplicate_hash'],
+            capacity=NEAR_DUPLICATE_WINDOW
+        )
+    
+    def upload_item(item):
+        return upload_single_image_from_path(
+            item['path'],
+            meta_tags,
+            batch_id,
+            near_duplicate_index,
+            item['filename'],
+            options.get('preprocess'),
+            options['folder_path'] if options.get('sync') else None,
+            item
+        )
+    
+    return upload_item
+
+def process_batch(batch_id, items, upload_item):
+    """Upload batch items on the shared scheduler, recording each result in the job store
+
+    items may be any iterable, including a generator over a huge folder or
+    a request body that is still arriving: at most BATCH_MAX_IN_FLIGHT of
+    them are pulled ahead of their results.
+    """
+    budget = RetryBudget(RETRY_BUDGET_MIN)
+    # New items arrive as (item, None), finished uploads as (item, future)
+    events = queue.Queue()
+    room = threading.Semaphore(BATCH_MAX_IN_FLIGHT)
+    
+    def feed():
+        # A separate thread, so waiting on a slow source never holds up finished results
+        try:
+            for item in items:
+                room.acquire()
+                events.put((item, None))
+        finally:
+            events.put((None, None))
+    
+    def run(item):
+        job_store.mark_uploading(batch_id, item['seq'])
+        return upload_item(item)
+    
+    def submit(item):
+        future = upload_scheduler.submit(run, item, batch_id=batch_id)
+        future.add_done_callback(lambda future: events.put((item, future)))
+    
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    
+    in_flight = 0
+    fed_all = False
+    while not fed_all or in_flight:
+        item, future = events.get()
+        if future is None:
+            if item is None:
+                fed_all = True
+            else:
+                item['attempts'] = 0
+                budget.add(RETRY_BUDGET_RATIO)
+                submit(item)
+                in_flight += 1
+            continue
+        
+        # Process completed uploads
+        try:
+            result = future.result()
         except Exception as e:
-            return {
+            result = upload_error(item['filename'], e)
+        retryable = result.pop('retryable', False)
+        item['attempts'] += 1
+        
+        if retryable and retry_policy.should_retry(item['attempts']) and budget.spend():
+            # Back off on a timer so the wait doesn't hold an upload worker
+            timer = threading.Timer(retry_policy.delay(item['attempts']), submit, args=(item,))
+            timer.daemon = True
+            timer.start()
+            continue
+        
+        job_store.record_result(batch_id, item['seq'], result)
+        release_item(batch_id, item, result)
+        in_flight -= 1
+        room.release()
+    
+    # Update final status
+    job_store.finish_batch(batch_id)
+    upload_scheduler.release_batch(batch_id)
+    
+    if JOB_PAYLOAD_DIR:
+        # Only empty once every payload is released; failed ones stay for /batch-retry
+        try:
+            os.rmdir(os.path.join(JOB_PAYLOAD_DIR, batch_id))
+        except OSError:
+            pass
+
+def release_item(batch_id, item, result):
+    """Free a finished item's file data, keeping failed uploads for /batch-retry"""
+    part_slot = item.pop('part_slot', None)
+    if part_slot is not None:
+        # Let /batch-upload read the next image from its request body
+        part_slot.release()
+    
+    buffer = item.get('buffer')
+    payload_path = item.get('payload_path')
+    
+    if result['status'] == 'error':
+        if buffer is not None and not payload_path:
+            retain_failed_payload(batch_id, item['seq'], buffer)
+            return
+        # A failed item's copy in JOB_PAYLOAD_DIR is what /batch-retry resends
+        payload_path = None
+    
+    if buffer is not None:
+        buffer.close()
+    if payload_path and os.path.exists(payload_path):
+        os.remove(payload_path)
+
+def retain_failed_payload(batch_id, seq, buffer):
+    """Keep a failed item's buffer in memory for up to FAILED_PAYLOAD_TTL seconds, within FAILED_PAYLOAD_MAX_BYTES"""
+    global failed_payload_bytes
+    size = source_size(buffer)
+    with failed_payloads_lock:
+        failed_payloads[(batch_id, seq)] = (buffer, size, time.monotonic() + FAILED_PAYLOAD_TTL)
+        failed_payload_bytes += size
+        drop_failed_payloads()
+
+def take_failed_payload(batch_id, seq):
+    """Remove and return a retained failed buffer, or None if it is gone"""
+    global failed_payload_bytes
+    with failed_payloads_lock:
+        drop_failed_payloads()
+        entry = failed_payloads.pop((batch_id, seq), None)
+        if entry is None:
+            return None
+        failed_payload_bytes -= entry[1]
+        return entry[0]
+
+def drop_failed_payloads():
+    """Close retained buffers past the TTL, then the oldest while over the byte budget; hold failed_payloads_lock"""
+    global failed_payload_bytes
+    now = time.monotonic()
+    # Every buffer gets the same TTL, so the oldest expire first
+    while failed_payloads:
+        key, (buffer, size, expires) = next(iter(failed_payloads.items()))
+        if expires > now and failed_payload_bytes <= FAILED_PAYLOAD_MAX_BYTES:
+            return
+        del failed_payloads[key]
+        failed_payload_bytes -= size
+        buffer.close()
+
+def start_batch(batch_id, items, upload_item):
+    """Run process_batch on a background thread"""
+    thread = threading.Thread(target=process_batch, args=(batch_id, items, upload_item))
+    thread.daemon = True
+    thread.start()
+
+def save_payload(batch_id, seq, buffer):
+    """Write an uploaded file to JOB_PAYLOAD_DIR and return its path"""
+    payload_dir = os.path.join(JOB_PAYLOAD_DIR, batch_id)
+    os.makedirs(payload_dir, exist_ok=True)
+    payload_path = os.path.join(payload_dir, str(seq))
+    with open(payload_path, 'wb') as f:
+        shutil.copyfileobj(buffer, f)
+    buffer.seek(0)
+    return payload_path
+
+def resumable_items(batch):
+    """Yield the unfinished items of an interrupted batch"""
+    batch_id = batch['batch_id']
+    key = 'path' if batch['kind'] == 'folder' else 'payload_path'
+    for seq, filename, source in job_store.iter_pending_items(batch_id):
+        if source and os.path.exists(source):
+            yield {'seq': seq, 'filename': filename, key: source}
+        else:
+            job_store.record_result(batch_id, seq, {
                 'status': 'error',
                 'filename': filename,
-                'error': str(e)
-            }
+                'error': 'Upload was interrupted by a restart and the file is no longer available'
+            })
     
-    def process_folder_batch():
-        """Process folder batch upload in background"""
-        successful_uploads = []
-        failed_uploads = []
+    if batch['scanning']:
+        if batch['kind'] != 'folder':
+            # The rest of the /batch-upload body died with the request
+            job_store.finish_scan(batch_id)
+            return
+        # The folder walk was cut short; walk it again, skipping files the batch already has
+        yield from scan_folder_items(batch_id, batch['options']['folder_path'], folder_images(batch['options']),
+                                     skip_known=True)
+
+def resume_unfinished_batches():
+    """Restart batches left unfinished by a stopped worker, once their lease has run out"""
+    for batch in job_store.claim_batches(WORKER_ID, BATCH_LEASE_SECONDS):
+        batch_id = batch['batch_id']
+        meta_tags = batch['meta_tags']
         
-        # Use ThreadPoolExecutor for parallel uploads
-        max_workers = min(10, len(image_files))
+        print(f"Resuming batch {batch_id}: {batch['total'] - batch['completed']} files remaining")
+        if batch['kind'] == 'folder':
+            upload_item = folder_uploader(batch_id, meta_tags, batch['options'])
+        else:
+            upload_item = batch_uploader(batch_id, meta_tags, batch['options'])
+        start_batch(batch_id, resumable_items(batch), upload_item)
+
+@app.route('/batch-retry/<batch_id>', methods=['POST'])
+def retry_batch(batch_id):
+    """Re-queue only the failed files of a finished batch
+
+    Failed /batch-upload files are resent from JOB_PAYLOAD_DIR if it is set,
+    otherwise from the memory of the worker process that ran the batch;
+    through any other worker they are reported as unavailable.
+    """
+    with batch_retry_lock:
+        batch = job_store.get_batch(batch_id)
+        if batch is None:
+            return jsonify({'error': 'Batch ID not found'}), 404
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all upload tasks
-            future_to_file = {
-                executor.submit(upload_single_image_from_path, file_path, meta_tags, batch_id): file_path
-                for file_path in image_files
-            }
-            
-            # Process completed uploads
-            for future in as_completed(future_to_file):
-                file_path = future_to_file[future]
-                try:
-                    result = future.result()
-                    
-                    if result['status'] == 'success':
-                        successful_uploads.append(result)
-                        upload_progress[batch_id]['successful'] += 1
-                    else:
-                        failed_uploads.append(result)
-                        upload_progress[batch_id]['failed'] += 1
-                    
-                    upload_progress[batch_id]['completed'] += 1
-                    upload_progress[batch_id]['results'].append(result)
-                    
-                except Exception as e:
-                    failed_uploads.append({
-                        'status': 'error',
-                        'filename': os.path.basename(file_path),
-                        'error': str(e)
-                    })
-                    upload_progress[batch_id]['failed'] += 1
-                    upload_progress[batch_id]['completed'] += 1
+        if batch['status'] == 'processing':
+            return jsonify({'error': 'Batch is still processing'}), 409
+        
+        # Reuse the original paths or bytes; nothing is re-sent by the client
+        items = []
+        unavailable = []
+        for seq, filename, source, media_id in job_store.failed_items(batch_id):
+            item = {'seq': seq, 'filename': filename}
+            if media_id:
+                # Created before its association failed; only the association is retried
+                item['media_id'] = media_id
+            if batch['kind'] == 'folder':
+                item['path'] = source
+            elif source and os.path.exists(source):
+                item['payload_path'] = source
+            else:
+                item['buffer'] = take_failed_payload(batch_id, seq)
+                if item['buffer'] is None:
+                    unavailable.append(filename)
+                    continue
+            items.append(item)
         
-        # Update final status
-        upload_progress[batch_id]['status'] = 'completed'
+        if not items:
+            return jsonify({
+                'error': 'No failed files available to retry',
+                'unavailable': unavailable
+            }), 400
+        
+        # Another worker process may have reopened the batch since it was read
+        if job_store.requeue_items(batch_id, [item['seq'] for item in items],
+                                   owner=WORKER_ID, lease=BATCH_LEASE_SECONDS) is None:
+            # Keep the bytes for a later /batch-retry
+            for item in items:
+                if item.get('buffer') is not None:
+                    retain_failed_payload(batch_id, item['seq'], item['buffer'])
+            return jsonify({'error': 'Batch is still processing'}), 409
     
-    # Start batch processing in background
-    thread = threading.Thread(target=process_folder_batch)
-    thread.daemon = True
-    thread.start()
+    if batch['kind'] == 'folder':
+        upload_item = folder_uploader(batch_id, batch['meta_tags'], batch['options'])
+    else:
+        upload_item = batch_uploader(batch_id, batch['meta_tags'], batch['options'])
+    start_batch(batch_id, items, upload_item)
     
     return jsonify({
         'batch_id': batch_id,
-        'total_files': len(image_files),
+        'retrying': len(items),
+        'unavailable': unavailable,
         'status': 'processing',
-        'folder_path': folder_path,
-        'message': f'Folder batch upload started for {len(image_files)} images. Use /batch-status/{batch_id} to check progress.'
+        'message': f'Retrying {len(items)} failed files. Use /batch-status/{batch_id} to check progress.'
     })
 
+@app.route('/concurrency', methods=['GET'])
+def concurrency_status():
+    """Current adaptive upload concurrency limit and its history"""
+    return jsonify(upload_limiter.snapshot())
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_status():
+    """Upload queue depth and wait times for interactive uploads and each active batch"""
+    return jsonify(upload_scheduler.snapshot())
+
+@app.route('/upload-methods', methods=['GET'])
+def upload_methods_status():
+    """Success/failure/latency counters for each upload method, and how media are being associated"""
+    methods = upload_router.snapshot()
+    methods['association'] = subject_associator.snapshot()
+    return jsonify(methods)
+
+def upload_method_counts():
+    counts = {}
+    for name, stats in upload_router.snapshot()['methods'].items():
+        for outcome in ('successes', 'failures', 'fallbacks'):
+            counts[(name, outcome)] = stats[outcome]
+    return counts
+
+def queue_depths():
+    scheduler = upload_scheduler.snapshot()
+    return {
+        ('interactive',): (scheduler['interactive'] or {}).get('queue_depth', 0),
+        ('batch',): sum(batch['queue_depth'] for batch in scheduler['batches'].values())
+    }
+
+# Collected from the components that already keep these numbers
+APP_METRICS = [
+    stage_seconds,
+    queue_wait_seconds,
+    bytes_uploaded,
+    GaugeFunction('uploader_queue_depth', 'Uploads waiting for an upload worker', queue_depths, ['queue']),
+    GaugeFunction('uploader_uploads_in_flight', 'Uploads running on upload workers',
+                  lambda: upload_scheduler.snapshot()['running']),
+    GaugeFunction('uploader_active_batches', 'Batches with queued or running uploads',
+                  lambda: len(upload_scheduler.snapshot()['batches'])),
+    GaugeFunction('uploader_concurrency_limit', 'Current adaptive limit on concurrent Cogniac calls',
+                  lambda: upload_limiter.limit),
+    GaugeFunction('uploader_upload_method_total', 'Upload attempts by method and outcome; fallbacks are '
+                  'successes after an earlier method failed', upload_method_counts, ['method', 'outcome'],
+                  type='counter')
+]
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    return Response(metrics.render(APP_METRICS), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_profiling():
+    """Sample stacks during this request if profiling is enabled and the request asks for it
+
+    Only the request's own thread and the upload workers are sampled, since
+    uploads run on the latter; work for other requests running at the same
+    time shows up too.
+    """
+    if PROFILE_DIR and '1' in (request.args.get('profile'), request.headers.get('X-Profile')):
+        request_thread = threading.get_ident()
+        g.profile_path = os.path.join(PROFILE_DIR, f"{request.endpoint}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}.txt")
+        g.profiler = SamplingProfiler(
+            PROFILE_INTERVAL,
+            threads=lambda thread: thread.ident == request_thread or thread.name.startswith('upload-worker')
+        ).start()
+
+@app.after_request
+def name_profile(response):
+    """Name the file the request's profile is saved to in X-Profile-File"""
+    if 'profiler' in g:
+        response.headers['X-Profile-File'] = g.profile_path
+    return response
+
+@app.teardown_request
+def write_profile(error=None):
+    """Stop the request's profiler and save it as collapsed stacks
+
+    Teardown runs even when the view raises, which after_request does not, so
+    a failed request doesn't leave its profiler sampling forever.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.write_collapsed(g.pop('profile_path'))
+
 @app.route('/health', methods=['GET'])
 def health_check():
+    """Liveness: answers without touching Cogniac"""
     return jsonify({
         'status': 'healthy',
-        'subject_uid': subject.subject_uid,
-        'connection': 'active'
+        'subject_uid': SUBJECT_UID,
+        'connection': 'active' if cogniac_client.status()['connected'] else 'not connected',
+        'dedup': dedup_index.stats()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once this worker is logged in to Cogniac and can reach its job store
+
+    Never waits on a login; if there is no connection yet, one is started in
+    the background and the probe reports not ready.
+    """
+    connection = cogniac_client.status()
+    if not connection['connected']:
+        cogniac_client.start_connecting()
+        return jsonify({
+            'status': 'not ready',
+            'error': connection['last_error'] or 'Connecting to Cogniac',
+            'connection': connection
+        }), 503
+    try:
+        job_store.get_batch('')
+    except Exception as e:
+        return jsonify({'status': 'not ready', 'error': str(e), 'connection': connection}), 503
+    return jsonify({
+        'status': 'ready',
+        'subject_uid': SUBJECT_UID,
+        'connection': connection
+    })
+
+def keep_batch_leases():
+    """Renew this worker's batch and folder watch leases and pick up those abandoned by other workers"""
+    while True:
+        try:
+            resume_unfinished_batches()
+        except Exception as e:
+            print(f"Could not resume unfinished batches: {str(e)}")
+        try:
+            resume_folder_watches()
+        except Exception as e:
+            print(f"Could not resume folder watches: {str(e)}")
+        time.sleep(BATCH_LEASE_SECONDS / 3)
+        try:
+            job_store.renew_leases(WORKER_ID, BATCH_LEASE_SECONDS)
+        except Exception as e:
+            print(f"Could not renew batch leases: {str(e)}")
+
+def expire_finished_batches():
+    """Evict old finished batches from the job store, and their expired failed buffers, in the background"""
+    while True:
+        with failed_payloads_lock:
+            drop_failed_payloads()
+        try:
+            evicted = job_store.evict_finished(BATCH_RETENTION, BATCH_RETENTION_MAX, BATCH_ARCHIVE_DIR)
+        except Exception as e:
+            print(f"Could not evict finished batches: {str(e)}")
+        else:
+            if evicted:
+                print(f"Evicted {len(evicted)} finished batches from the job store")
+        time.sleep(BATCH_EVICT_INTERVAL)
+
+def release_batch_leases():
+    """On a clean shutdown, let another worker resume this one's batches without waiting out the lease"""
+    try:
+        job_store.release_leases(WORKER_ID)
+    except Exception as e:
+        print(f"Could not release batch leases: {str(e)}")
+
+def start_background_work():
+    """Start the session sweeper, lease keeper and batch evictor threads
+
+    Called by the entry points (wsgi.py, devserver.py) in the process that
+    serves requests rather than on import, since the debug reloader's
+    watcher process imports this module too.
+    """
+    session_sweeper = threading.Thread(target=expire_upload_sessions)
+    session_sweeper.daemon = True
+    session_sweeper.start()
+    lease_keeper = threading.Thread(target=keep_batch_leases)
+    lease_keeper.daemon = True
+    lease_keeper.start()
+    batch_evictor = threading.Thread(target=expire_finished_batches)
+    batch_evictor.daemon = True
+    batch_evictor.start()
+    atexit.register(release_batch_leases)
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
+    # Run as a script, preprocessing workers would re-run this whole module as __mp_main__
+    raise SystemExit('Run the development server with python devserver.py, or serve wsgi:app with gunicorn')
\ No newline at end of file
@@ -0,0 +1,68 @@
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+def multipart_boundary(content_type):
+    """Return the boundary of a multipart/form-data Content-Type, or None"""
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        return None
+    return options['boundary'].encode('latin-1')
+
+def iter_multipart(stream, boundary, file_factory, chunk_size=64 * 1024):
+    """Parse a multipart/form-data body as it is read, yielding each part once it has fully arrived
+
+    Yields ('field', name, value) and ('file', name, filename, buffer) in the
+    order the client sent them; a part is complete once the chunk holding its
+    closing boundary has been read. file_factory(name, filename) returns the
+    writable buffer for a file part, or None to discard the part; it may block
+    to hold back reading until there is room for another file. Buffers are
+    rewound before being yielded. A malformed or truncated body raises
+    ValueError; a partly received file is closed first.
+    """
+    decoder = MultipartDecoder(boundary)
+    part = None
+    container = None
+    held = b''
+
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            chunk, held = held + (data or b''), b''
+            # The decoder hands the line break before the closing boundary to
+            # the last part when a read ends between its two final dashes, so up
+            # to two trailing dashes wait for the next read
+            if data:
+                dashes = min(2, len(chunk) - len(chunk.rstrip(b'-')))
+                chunk, held = chunk[:len(chunk) - dashes], chunk[len(chunk) - dashes:]
+            if chunk:
+                decoder.receive_data(chunk)
+            if not data:
+                decoder.receive_data(None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    part = event
+                    container = []
+                elif isinstance(event, File):
+                    part = event
+                    container = file_factory(event.name, event.filename) if event.filename else None
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        container.append(event.data)
+                    elif container is not None:
+                        container.write(event.data)
+                    if not event.more_data:
+                        if isinstance(part, Field):
+                            yield 'field', part.name, b''.join(container).decode('utf-8', 'replace')
+                        elif container is not None:
+                            container.seek(0)
+                            # Ownership passes to the consumer
+                            buffer, container = container, None
+                            yield 'file', part.name, part.filename, buffer
+                        part = container = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not data:
+                return
+    finally:
+        if isinstance(part, File) and container is not None:
+            container.close()
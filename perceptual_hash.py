@@ -0,0 +1,117 @@
+import threading
+
+# NumPy and Pillow are only needed when near-duplicate filtering is requested
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+HASH_SIZE = 8  # 8x8 bits -> 64-bit hashes
+PHASH_SCALE = 4  # pHash takes the DCT of a (HASH_SIZE * PHASH_SCALE)^2 thumbnail
+
+def is_available():
+    """Return True if the optional NumPy/Pillow dependencies are installed"""
+    return np is not None and Image is not None
+
+def _grayscale(source, size):
+    """Load an image path or stream as a grayscale array of the given (width, height)"""
+    with Image.open(source) as img:
+        # Let the JPEG decoder downscale while decoding; far cheaper than a full-size decode
+        img.draft('L', (size[0] * 4, size[1] * 4))
+        img = img.convert('L').resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(img, dtype=np.float32)
+
+def _pack(bits):
+    """Pack a 64-element boolean array into an integer"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+def dhash(source):
+    """Difference hash: compares each pixel with its right-hand neighbour"""
+    pixels = _grayscale(source, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis of size n x n"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+_dct = None
+
+def phash(source):
+    """Perceptual hash: compares low-frequency DCT coefficients with their median"""
+    global _dct
+    size = HASH_SIZE * PHASH_SCALE
+    if _dct is None:
+        _dct = _dct_matrix(size)
+    pixels = _grayscale(source, (size, size))
+    coefficients = (_dct @ pixels @ _dct.T)[:HASH_SIZE, :HASH_SIZE]
+    # Leave out the DC term so overall brightness doesn't skew the median
+    median = np.median(coefficients.ravel()[1:])
+    return _pack(coefficients > median)
+
+HASH_FUNCTIONS = {
+    'dhash': dhash,
+    'phash': phash
+}
+
+class NearDuplicateIndex:
+    """Per-batch index of perceptual hashes for Hamming-distance lookups
+
+    Only the latest `capacity` images added are kept, so lookups cost the
+    same however large the batch grows; burst and frame captures sit next to
+    each other in a folder walk, well within the window.
+    """
+
+    def __init__(self, threshold, hash_name='dhash', capacity=10000):
+        self.threshold = threshold
+        self.hash_function = HASH_FUNCTIONS[hash_name]
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._filenames = [None] * capacity
+        self._slots = {}
+        self._count = 0
+        self._next = 0
+
+    def check(self, source, filename):
+        """Return (hash, match); match is (filename, distance) of a near-duplicate indexed earlier, or None
+
+        An entry under the same filename never matches, so an image checked
+        again on a retry is not taken for a duplicate of itself. Pass the
+        hash to add() once the image is uploaded.
+        """
+        value = np.uint64(self.hash_function(source))
+
+        with self._lock:
+            count = self._count
+            if not count:
+                return value, None
+            xor = self._hashes[:count] ^ value
+            distances = np.unpackbits(xor.view(np.uint8).reshape(count, 8), axis=1).sum(axis=1)
+            own_slot = self._slots.get(filename)
+            if own_slot is not None:
+                distances[own_slot] = self.threshold + 1
+            closest = int(np.argmin(distances))
+            if distances[closest] <= self.threshold:
+                return value, (self._filenames[closest], int(distances[closest]))
+            return value, None
+
+    def add(self, value, filename):
+        """Index an uploaded image by the hash check() returned, replacing the oldest once full"""
+        with self._lock:
+            slot = self._slots.get(filename)
+            if slot is None:
+                slot = self._next
+                self._next = (slot + 1) % self.capacity
+                self._count = min(self._count + 1, self.capacity)
+                replaced = self._filenames[slot]
+                if replaced is not None and self._slots.get(replaced) == slot:
+                    del self._slots[replaced]
+                self._filenames[slot] = filename
+                self._slots[filename] = slot
+            self._hashes[slot] = value
@@ -0,0 +1,48 @@
+import random
+import threading
+
+from concurrency import root_error
+
+def is_retryable(error):
+    """False for client errors (4xx other than 429) that would fail the same way again"""
+    cause = root_error(getattr(error, 'last_error', None) or error)
+    status_code = getattr(cause, 'status_code', None)
+    if status_code is not None and 400 <= status_code < 500 and status_code != 429:
+        return False
+    return not isinstance(cause, (FileNotFoundError, IsADirectoryError, PermissionError))
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt):
+        """True if an item that has failed `attempt` times may try again"""
+        return attempt < self.max_attempts
+
+    def delay(self, attempt):
+        """Seconds to wait before the next try after `attempt` failures"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+class RetryBudget:
+    """Caps the total number of retries one batch may spend"""
+
+    def __init__(self, retries):
+        self.remaining = retries
+        self._lock = threading.Lock()
+
+    def add(self, retries):
+        """Grow the budget, e.g. by a fraction of a retry for each item as it is queued"""
+        with self._lock:
+            self.remaining += retries
+
+    def spend(self):
+        """Take one retry from the budget; False once it is exhausted"""
+        with self._lock:
+            if self.remaining < 1:
+                return False
+            self.remaining -= 1
+            return True
@@ -0,0 +1,55 @@
+import sys
+import threading
+
+class SamplingProfiler:
+    """Samples the stack of every thread at a fixed interval while running
+
+    Cheap enough to leave on for a single slow request: nothing is traced,
+    a background thread just looks at sys._current_frames(). threads, if
+    given, picks the threading.Thread objects to sample. Results are
+    collapsed stacks ('thread;outer;...;inner count'), which flamegraph.pl
+    and speedscope read directly.
+    """
+
+    def __init__(self, interval=0.005, threads=None):
+        self.interval = interval
+        self.threads = threads
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            sampled = {
+                thread.ident: thread.name for thread in threading.enumerate()
+                if thread.ident != own_ident and (self.threads is None or self.threads(thread))
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident not in sampled:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(sampled[ident])
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def write_collapsed(self, path):
+        """Write one 'stack count' line per distinct stack, busiest first"""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {count}\n')
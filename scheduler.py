@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+INTERACTIVE = '__interactive__'
+
+class UploadScheduler:
+    """Process-wide upload worker pool with fair queuing across batches
+
+    Interactive tasks always run before bulk tasks. Bulk tasks are taken
+    round-robin from each batch's queue, so a large batch cannot starve a
+    small one. At most limit() tasks run at once, capped by the worker count.
+    on_wait(key, seconds), if given, is called as each task starts with how
+    long it was queued; key is the batch_id or INTERACTIVE.
+    """
+
+    def __init__(self, workers, limit=None, on_wait=None):
+        self.workers = workers
+        self._limit = limit or (lambda: workers)
+        self._on_wait = on_wait
+        self._condition = threading.Condition()
+        self._interactive = deque()
+        self._batches = OrderedDict()
+        self._stats = {}
+        self._running = 0
+
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'upload-worker-{index}')
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, fn, *args, batch_id=None, **kwargs):
+        """Queue fn(*args, **kwargs); tasks without a batch_id are interactive"""
+        future = Future()
+        task = (future, fn, args, kwargs, time.monotonic())
+        with self._condition:
+            if batch_id is None:
+                self._interactive.append(task)
+                stats = self._batch_stats(INTERACTIVE)
+            else:
+                self._batches.setdefault(batch_id, deque()).append(task)
+                stats = self._batch_stats(batch_id)
+            stats['queued'] += 1
+            self._condition.notify()
+        return future
+
+    def release_batch(self, batch_id):
+        """Drop the wait-time statistics of a finished batch"""
+        with self._condition:
+            self._stats.pop(batch_id, None)
+
+    def _batch_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {
+                'queued': 0,
+                'running': 0,
+                'completed': 0,
+                'total_wait': 0.0,
+                'max_wait': 0.0
+            }
+        return stats
+
+    def _next_task(self):
+        """Pop the next task to run, or None if nothing may run now"""
+        if self._running >= min(self.workers, max(1, self._limit())):
+            return None, None
+        if self._interactive:
+            return INTERACTIVE, self._interactive.popleft()
+        if self._batches:
+            batch_id, queue = self._batches.popitem(last=False)
+            task = queue.popleft()
+            if queue:
+                # Back of the line until every other batch has had a turn
+                self._batches[batch_id] = queue
+            return batch_id, task
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                key, task = self._next_task()
+                while task is None:
+                    # Also wake periodically in case the concurrency limit was raised
+                    self._condition.wait(timeout=1.0)
+                    key, task = self._next_task()
+                future, fn, args, kwargs, queued_at = task
+                self._running += 1
+                wait = time.monotonic() - queued_at
+                stats = self._batch_stats(key)
+                stats['queued'] -= 1
+                stats['running'] += 1
+                stats['total_wait'] += wait
+                stats['max_wait'] = max(stats['max_wait'], wait)
+
+            if self._on_wait is not None:
+                self._on_wait(key, wait)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._condition:
+                self._running -= 1
+                stats = self._stats.get(key)
+                if stats is not None:
+                    stats['running'] -= 1
+                    stats['completed'] += 1
+                self._condition.notify_all()
+
+    def snapshot(self):
+        """Return queue depth and wait times for interactive work and each active batch"""
+        with self._condition:
+            queues = {}
+            for key, stats in self._stats.items():
+                started = stats['running'] + stats['completed']
+                queues[key] = {
+                    'queue_depth': stats['queued'],
+                    'running': stats['running'],
+                    'completed': stats['completed'],
+                    'avg_wait': round(stats['total_wait'] / started, 3) if started else 0.0,
+                    'max_wait': round(stats['max_wait'], 3)
+                }
+            return {
+                'workers': self.workers,
+                'concurrency_limit': self._limit(),
+                'running': self._running,
+                'interactive': queues.pop(INTERACTIVE, None),
+                'batches': queues
+            }
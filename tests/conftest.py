@@ -0,0 +1,35 @@
+import os
+import sys
+
+# The service's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+class StatusError(Exception):
+    """An API error carrying an HTTP status, as the Cogniac SDK raises them"""
+
+    def __init__(self, status_code):
+        Exception.__init__(self, f'HTTP {status_code}')
+        self.status_code = status_code
+
+@pytest.fixture
+def two_workers():
+    """Build two instances of a store on one file or directory, standing in for two gunicorn workers"""
+    def build(factory, *args, **kwargs):
+        return factory(*args, **kwargs), factory(*args, **kwargs)
+    return build
+
+@pytest.fixture(scope='session')
+def service(tmp_path_factory):
+    """The upload service module, imported once with its stores in a temporary directory"""
+    directory = tmp_path_factory.mktemp('service')
+    os.environ.update(
+        JOB_STORE_URL='memory://',
+        DEDUP_DB_PATH=str(directory / 'dedup_index.sqlite3'),
+        FOLDER_MANIFEST_PATH=str(directory / 'folder_manifest.sqlite3'),
+        UPLOAD_SESSION_DIR=str(directory / 'upload_sessions'),
+        RETRY_BASE_DELAY='0.01'
+    )
+    import main
+    return main
@@ -0,0 +1,35 @@
+import io
+
+def test_failed_payloads_stay_within_the_byte_budget(service, monkeypatch):
+    monkeypatch.setattr(service, 'FAILED_PAYLOAD_MAX_BYTES', 10)
+    buffers = [io.BytesIO(b'12345') for _ in range(3)]
+    for seq, buffer in enumerate(buffers):
+        service.retain_failed_payload('budget', seq, buffer)
+
+    # The oldest went to make room
+    assert buffers[0].closed
+    assert service.take_failed_payload('budget', 0) is None
+    assert service.take_failed_payload('budget', 2) is buffers[2]
+    assert service.take_failed_payload('budget', 1) is buffers[1]
+    assert service.failed_payload_bytes == 0
+
+def test_expired_failed_payloads_are_dropped_on_access(service, monkeypatch):
+    monkeypatch.setattr(service, 'FAILED_PAYLOAD_TTL', 0)
+    buffer = io.BytesIO(b'12345')
+    service.retain_failed_payload('expired', 0, buffer)
+    assert service.take_failed_payload('expired', 0) is None
+    assert buffer.closed
+
+def test_refused_retry_keeps_the_failed_payload(service, monkeypatch):
+    service.job_store.create_batch('refused', 'upload', [], [('a.jpg', None)])
+    service.job_store.record_result('refused', 0, {'status': 'error', 'filename': 'a.jpg', 'error': 'boom'})
+    service.job_store.finish_batch('refused')
+    buffer = io.BytesIO(b'image bytes')
+    service.retain_failed_payload('refused', 0, buffer)
+    # Another worker reopened the batch in between
+    monkeypatch.setattr(service.job_store, 'requeue_items', lambda *args, **kwargs: None)
+
+    response = service.app.test_client().post('/batch-retry/refused')
+    assert response.status_code == 409
+    assert service.take_failed_payload('refused', 0) is buffer
+    assert not buffer.closed
@@ -0,0 +1,51 @@
+import time
+
+from bulk_associate import BulkAssociator
+from conftest import StatusError
+
+def test_repeated_group_failures_turn_grouping_off():
+    groups = []
+    singles = []
+
+    def associate_many(media_ids):
+        groups.append(media_ids)
+        raise StatusError(500)
+
+    def associate_one(media_id):
+        singles.append(media_id)
+        return f'capture-{media_id}'
+
+    associator = BulkAssociator(associate_many, associate_one, max_size=2, max_wait=0.01, max_failures=2)
+    for media_id in ('m1', 'm2', 'm3'):
+        assert associator.associate(media_id) == f'capture-{media_id}'
+    # Two failed groups, then straight to single requests
+    assert groups == [['m1'], ['m2']]
+    assert singles == ['m1', 'm2', 'm3']
+    assert associator.snapshot()['enabled'] is False
+
+def test_group_that_associates_nothing_counts_as_a_failure():
+    associator = BulkAssociator(lambda media_ids: {}, lambda media_id: 'capture', max_size=2, max_wait=0.01,
+                                max_failures=1)
+    assert associator.associate('m1') == 'capture'
+    assert associator.snapshot()['enabled'] is False
+
+def test_success_resets_the_failure_count():
+    answers = iter([StatusError(500), None, StatusError(500), None])
+
+    def associate_many(media_ids):
+        error = next(answers)
+        if error is not None:
+            raise error
+        return {media_id: 'capture' for media_id in media_ids}
+
+    associator = BulkAssociator(associate_many, lambda media_id: 'single', max_size=2, max_wait=0.01, max_failures=2)
+    for media_id in ('m1', 'm2', 'm3', 'm4'):
+        associator.associate(media_id)
+    assert associator.snapshot()['enabled'] is True
+
+def test_ungrouped_association_does_not_wait():
+    associator = BulkAssociator(lambda media_ids: {}, lambda media_id: 'single', max_size=25, max_wait=5)
+    started = time.monotonic()
+    assert associator.associate('m1', group=False) == 'single'
+    assert time.monotonic() - started < 1
+    assert associator.snapshot()['groups'] == 0
@@ -0,0 +1,28 @@
+from concurrency import AdaptiveConcurrencyLimiter
+
+def limiter():
+    return AdaptiveConcurrencyLimiter(initial=8, maximum=8, target_latency=1.0, target_bytes=1000)
+
+def call(limiter, seconds, size=None):
+    # Backdate the start rather than sleeping through the call
+    started = limiter.acquire()
+    limiter.release(started - seconds, size=size)
+
+def test_slow_small_call_cuts_the_limit():
+    small = limiter()
+    call(small, 2.0, size=500)
+    assert small.limit == 4
+
+def test_large_upload_is_allowed_time_in_proportion_to_its_size():
+    large = limiter()
+    call(large, 2.0, size=4000)
+    assert large.limit == 8
+    call(large, 5.0, size=4000)
+    assert large.limit == 4
+
+def test_calls_without_a_size_keep_the_plain_target():
+    unsized = limiter()
+    call(unsized, 0.5)
+    assert unsized.limit == 8
+    call(unsized, 2.0)
+    assert unsized.limit == 4
@@ -0,0 +1,33 @@
+import io
+
+from dedup_index import DedupIndex, hash_file, hash_stream
+
+def test_recorded_media_survives_reopening(tmp_path):
+    path = str(tmp_path / 'dedup.sqlite3')
+    index = DedupIndex(path)
+    digest = hash_stream(io.BytesIO(b'image bytes'))
+    index.record(digest, 'subject', 'media-1')
+
+    reopened = DedupIndex(path)
+    assert reopened.lookup(digest, 'subject') == 'media-1'
+    assert reopened.lookup(digest, 'other-subject') is None
+    assert reopened.stats()['entries'] == 1
+
+def test_hash_file_matches_hash_stream(tmp_path):
+    image = tmp_path / 'a.jpg'
+    image.write_bytes(b'image bytes')
+    assert hash_file(str(image)) == hash_stream(io.BytesIO(b'image bytes'))
+
+def test_eviction_counts_entries_from_every_process(tmp_path, two_workers):
+    first, second = two_workers(DedupIndex, str(tmp_path / 'dedup.sqlite3'), max_entries=10)
+    for n in range(6):
+        first.record(f'digest-{n}', 'subject', f'media-{n}')
+    for n in range(6, 12):
+        second.record(f'digest-{n}', 'subject', f'media-{n}')
+
+    # The 11th entry evicted the two least recently used, whichever index recorded them
+    assert first.stats()['entries'] == second.stats()['entries'] == 10
+    assert first.lookup('digest-0', 'subject') is None
+    assert first.lookup('digest-1', 'subject') is None
+    assert first.lookup('digest-2', 'subject') == 'media-2'
+    assert first.lookup('digest-11', 'subject') == 'media-11'
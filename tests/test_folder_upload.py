@@ -0,0 +1,60 @@
+import time
+
+from PIL import Image
+
+def test_retried_upload_is_not_a_near_duplicate_of_itself(service, tmp_path, monkeypatch):
+    Image.new('RGB', (64, 64), 'red').save(tmp_path / 'only.png')
+    calls = []
+
+    def upload_to_cogniac(source, filename, meta_tags, media_id=None, batch_id=None):
+        calls.append(filename)
+        if len(calls) == 1:
+            raise TimeoutError('timed out')
+        return 'media-1'
+
+    monkeypatch.setattr(service, 'upload_to_cogniac', upload_to_cogniac)
+    options = {'folder_path': str(tmp_path), 'near_duplicate_threshold': 5, 'near_duplicate_hash': 'dhash'}
+    batch_id, items = service.open_folder_batch(options, [])
+    service.process_batch(batch_id, items, service.folder_uploader(batch_id, [], options))
+
+    [(_, result)] = service.job_store.get_results(batch_id)
+    assert result == {'status': 'success', 'filename': 'only.png', 'media_id': 'media-1', 'attempts': 2}
+    assert calls == ['only.png', 'only.png']
+
+def test_near_duplicate_of_a_failed_upload_is_uploaded(service, tmp_path, monkeypatch):
+    Image.new('RGB', (64, 64), 'blue').save(tmp_path / 'a.png')
+    Image.new('RGB', (64, 64), 'blue').save(tmp_path / 'b.png', optimize=True)
+
+    def upload_to_cogniac(source, filename, meta_tags, media_id=None, batch_id=None):
+        if filename == 'a.png':
+            raise ValueError('rejected')
+        return 'media-b'
+
+    monkeypatch.setattr(service, 'upload_to_cogniac', upload_to_cogniac)
+    options = {'folder_path': str(tmp_path), 'near_duplicate_threshold': 5, 'near_duplicate_hash': 'dhash'}
+    uploader = service.folder_uploader('unused', [], options)
+    assert uploader({'path': str(tmp_path / 'a.png'), 'filename': 'a.png'})['status'] == 'error'
+    assert uploader({'path': str(tmp_path / 'b.png'), 'filename': 'b.png'})['status'] == 'success'
+    # Now that b.png is in Cogniac, the same picture again is left out
+    result = uploader({'path': str(tmp_path / 'a.png'), 'filename': 'a.png'})
+    assert (result['status'], result['duplicate_of']) == ('near_duplicate', 'b.png')
+
+def test_folder_is_walked_once_when_the_upload_starts(service, tmp_path, monkeypatch):
+    for name in ('a.png', 'b.png'):
+        Image.new('RGB', (8, 8), 'green').save(tmp_path / name)
+    walks = []
+    iter_image_files = service.iter_image_files
+
+    def counting_iter_image_files(*args):
+        walks.append(args)
+        return iter_image_files(*args)
+
+    monkeypatch.setattr(service, 'iter_image_files', counting_iter_image_files)
+    monkeypatch.setattr(service, 'upload_to_cogniac', lambda source, filename, *args, **kwargs: 'media-' + filename)
+    response = service.app.test_client().post('/upload-folder', json={'folder_path': str(tmp_path)})
+
+    assert response.status_code == 200
+    assert response.get_json()['total_files'] <= 2
+    assert len(walks) == 1
+    while service.job_store.get_batch(response.get_json()['batch_id'])['status'] == 'processing':
+        time.sleep(0.01)
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+from job_store import JobStore, load_archive
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+def test_expired_lease_is_claimed_by_another_worker(store):
+    store.create_batch('b1', 'folder', [], [('a.jpg', '/a.jpg')], owner='worker-1', lease=0.2)
+
+    # Still held by worker-1
+    assert store.claim_batches('worker-2', 60) == []
+
+    time.sleep(0.3)
+    # worker-1's own lapsed batch is still running in it, so it never claims it back
+    assert store.claim_batches('worker-1', 60) == []
+    claimed = store.claim_batches('worker-2', 60)
+    assert [batch['batch_id'] for batch in claimed] == ['b1']
+    assert claimed[0]['owner'] == 'worker-2'
+    assert store.get_batch('b1')['owner'] == 'worker-2'
+
+    # The new lease is held; nobody else can take the batch now
+    assert store.claim_batches('worker-3', 60) == []
+
+def test_released_lease_is_claimed_at_once(store):
+    store.create_batch('b1', 'folder', [], [('a.jpg', '/a.jpg')], owner='worker-1', lease=60)
+    store.release_leases('worker-1')
+    assert [batch['batch_id'] for batch in store.claim_batches('worker-2', 60)] == ['b1']
+
+def test_renewed_lease_is_not_claimed(store):
+    store.create_batch('b1', 'folder', [], [('a.jpg', '/a.jpg')], owner='worker-1', lease=0.2)
+    store.renew_leases('worker-1', 60)
+    time.sleep(0.3)
+    assert store.claim_batches('worker-2', 60) == []
+
+def test_folder_watch_is_shared_and_taken_over_once(tmp_path, two_workers):
+    store, other = two_workers(JobStore, str(tmp_path / 'jobs.sqlite3'))
+    options = {'folder_path': '/images', 'sync': True}
+    store.create_watch('w1', options, ['tag'], 30, owner='worker-1', lease=0.2)
+    # The other worker sees it, but can't take it while the lease is held
+    assert [watch['watch_id'] for watch in other.list_watches()] == ['w1']
+    assert other.claim_watches('worker-2', 60) == []
+
+    store.add_watch_batch('w1', 'b1', keep=2)
+    store.add_watch_batch('w1', 'b2', keep=2)
+    store.add_watch_batch('w1', 'b3', keep=2)
+    time.sleep(0.3)
+    assert store.claim_watches('worker-1', 60) == []
+    claimed = other.claim_watches('worker-2', 60)
+    assert [(watch['watch_id'], watch['owner']) for watch in claimed] == [('w1', 'worker-2')]
+    assert claimed[0]['options'] == options
+    assert claimed[0]['meta_tags'] == ['tag']
+    assert claimed[0]['batches'] == ['b2', 'b3']
+    assert not store.holds_watch('w1', 'worker-1')
+    assert store.holds_watch('w1', 'worker-2')
+    assert store.claim_watches('worker-3', 60) == []
+
+    # Released on shutdown, it is taken over at once; stopped, it is gone for everyone
+    other.release_leases('worker-2')
+    assert [watch['watch_id'] for watch in store.claim_watches('worker-3', 60)] == ['w1']
+    assert other.delete_watch('w1')['owner'] == 'worker-3'
+    assert not store.holds_watch('w1', 'worker-3')
+    assert store.list_watches() == []
+    assert store.delete_watch('w1') is None
+
+def test_requeue_keeps_attempt_counts_and_result_order(store):
+    store.create_batch('b1', 'upload', [], [('a.jpg', None), ('b.jpg', None)])
+    for _ in range(2):
+        store.mark_uploading('b1', 0)
+    store.record_result('b1', 0, {'status': 'error', 'filename': 'a.jpg', 'error': 'boom'})
+    store.mark_uploading('b1', 1)
+    store.record_result('b1', 1, {'status': 'success', 'filename': 'b.jpg', 'media_id': 'm1'})
+    store.finish_batch('b1')
+    assert store.get_results('b1')[0][1]['attempts'] == 2
+
+    assert store.requeue_items('b1', [0, 1], owner='worker-1', lease=60) == 1
+    batch = store.get_batch('b1')
+    assert (batch['status'], batch['completed'], batch['failed'], batch['successful']) == ('processing', 1, 0, 1)
+    # Only the successful result is left
+    assert [result['filename'] for _, result in store.get_results('b1')] == ['b.jpg']
+
+    store.mark_uploading('b1', 0)
+    store.record_result('b1', 0, {'status': 'success', 'filename': 'a.jpg', 'media_id': 'm2'})
+    results = store.get_results('b1')
+    # Result numbers are never reused, and the attempts before the requeue still count
+    assert [seq for seq, _ in results] == [2, 3]
+    assert results[-1][1]['attempts'] == 3
+    assert 'attempts' not in results[0][1]
+
+def test_requeue_refuses_a_processing_batch(store):
+    store.create_batch('b1', 'upload', [], [('a.jpg', None)])
+    store.record_result('b1', 0, {'status': 'error', 'filename': 'a.jpg', 'error': 'boom'})
+    assert store.requeue_items('b1', [0]) is None
+
+def test_eviction_removes_only_finished_batches(store, tmp_path):
+    for batch_id in ('running', 'old', 'new'):
+        store.create_batch(batch_id, 'upload', [], [('a.jpg', None)])
+    store.record_result('old', 0, {'status': 'success', 'filename': 'a.jpg', 'media_id': 'm1'})
+    store.finish_batch('old')
+    time.sleep(0.01)
+    store.record_result('new', 0, {'status': 'success', 'filename': 'a.jpg', 'media_id': 'm2'})
+    store.finish_batch('new')
+
+    archive_dir = str(tmp_path / 'archive')
+    # Keeps only the most recently finished batch
+    assert store.evict_finished(max_batches=1, archive_dir=archive_dir) == ['old']
+    assert store.get_batch('old') is None
+    assert store.get_batch('new') is not None
+    assert store.get_batch('running')['status'] == 'processing'
+
+    # An evicted batch can still be read back from its archive
+    batch, results = load_archive(archive_dir, 'old')
+    assert batch['successful'] == 1
+    assert results == [(1, {'status': 'success', 'filename': 'a.jpg', 'media_id': 'm1'})]
+
+    # By age, every finished batch goes, but a running batch never does however old
+    assert store.evict_finished(max_age=0) == ['new']
+    assert store.get_batch('running') is not None
+
+def test_change_committed_before_waiting_is_not_missed(store):
+    store.create_batch('b1', 'upload', [], [('a.jpg', None)])
+    version = store.change_version()
+    # Committed after the caller read the version but before it started waiting
+    store.record_result('b1', 0, {'status': 'success', 'filename': 'a.jpg', 'media_id': 'm1'})
+    started = time.monotonic()
+    assert store.wait_for_change(version, 2) == version + 1
+    assert time.monotonic() - started < 0.1
+
+def test_wait_for_change_sees_other_connections(tmp_path, two_workers):
+    store, other = two_workers(JobStore, str(tmp_path / 'jobs.sqlite3'))
+    store.create_batch('b1', 'upload', [], [('a.jpg', None)])
+    version = store.change_version()
+    other.finish_batch('b1')
+    assert store.wait_for_change(version, 2, poll_interval=0.05) == version + 1
+
+def test_wait_for_change_times_out_without_a_change(store):
+    assert store.wait_for_change(store.change_version(), 0.1) is None
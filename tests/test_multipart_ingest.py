@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+from multipart_ingest import iter_multipart, multipart_boundary
+
+BOUNDARY = b'----boundary42'
+
+def multipart_body(parts):
+    body = b''
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += b'--' + BOUNDARY + b'\r\nContent-Disposition: ' + disposition.encode() + b'\r\n\r\n'
+        body += content + b'\r\n'
+    return body + b'--' + BOUNDARY + b'--\r\n'
+
+def parse(body, chunk_size, file_factory=lambda name, filename: io.BytesIO()):
+    parts = []
+    for part in iter_multipart(io.BytesIO(body), BOUNDARY, file_factory, chunk_size=chunk_size):
+        if part[0] == 'file':
+            parts.append(part[:3] + (part[3].read(),))
+        else:
+            parts.append(part)
+    return parts
+
+BODY = multipart_body([
+    ('meta_tags', None, b'left,right'),
+    ('image', 'a.jpg', b'\xff\xd8' + b'--' + BOUNDARY[:-1] + b'\r\n' * 3 + b'\xff\xd9'),
+    ('image', 'b.jpg', b'second image'),
+    ('sync', None, b'true')
+])
+
+EXPECTED = [
+    ('field', 'meta_tags', 'left,right'),
+    ('file', 'image', 'a.jpg', b'\xff\xd8' + b'--' + BOUNDARY[:-1] + b'\r\n' * 3 + b'\xff\xd9'),
+    ('file', 'image', 'b.jpg', b'second image'),
+    ('field', 'sync', 'true')
+]
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 11, 16, 64 * 1024])
+def test_boundary_split_across_chunks(chunk_size):
+    # Small chunk sizes split every boundary, and the near-boundary bytes inside a.jpg, at each position
+    assert parse(BODY, chunk_size) == EXPECTED
+
+class TwoReads:
+    """A body that arrives in two reads, split at a given byte"""
+
+    def __init__(self, body, split):
+        self.chunks = [body[:split], body[split:]]
+
+    def read(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+@pytest.mark.parametrize('body', [BODY, BODY[:-2]], ids=['crlf', 'no-crlf'])
+def test_every_split_point(body):
+    for split in range(1, len(body)):
+        parts = [
+            part[:3] + (part[3].read(),) if part[0] == 'file' else part
+            for part in iter_multipart(TwoReads(body, split), BOUNDARY, lambda name, filename: io.BytesIO())
+        ]
+        assert parts == EXPECTED, f'split at byte {split}'
+
+def test_discarded_file_parts_are_skipped():
+    def file_factory(name, filename):
+        return None if filename == 'a.jpg' else io.BytesIO()
+
+    assert parse(BODY, 5, file_factory) == [EXPECTED[0], EXPECTED[2], EXPECTED[3]]
+
+def test_truncated_body_closes_the_partial_file():
+    buffers = []
+
+    def file_factory(name, filename):
+        buffers.append(io.BytesIO())
+        return buffers[-1]
+
+    with pytest.raises(ValueError):
+        parse(BODY[:BODY.index(b'second image') + 4], 7, file_factory)
+    assert buffers[-1].closed
+
+def test_multipart_boundary():
+    assert multipart_boundary('multipart/form-data; boundary=----boundary42') == BOUNDARY
+    assert multipart_boundary('application/json') is None
+    assert multipart_boundary('multipart/form-data') is None
@@ -0,0 +1,34 @@
+import numpy as np
+from PIL import Image
+
+from perceptual_hash import NearDuplicateIndex
+
+def save(tmp_path, name, color):
+    path = tmp_path / name
+    Image.new('RGB', (64, 64), color).save(path)
+    return str(path)
+
+def test_only_added_images_match_and_never_themselves(tmp_path):
+    index = NearDuplicateIndex(threshold=5)
+    first = save(tmp_path, 'a.png', 'red')
+    value, match = index.check(first, 'a.png')
+    assert match is None
+    # Checked again before it was added, as on a retry
+    assert index.check(first, 'a.png')[1] is None
+
+    index.add(value, 'a.png')
+    assert index.check(first, 'a.png')[1] is None
+    assert index.check(save(tmp_path, 'b.png', 'red'), 'b.png')[1] == ('a.png', 0)
+
+def test_oldest_entries_leave_a_full_index(tmp_path):
+    index = NearDuplicateIndex(threshold=0, capacity=2)
+    random = np.random.default_rng(0)
+    paths = []
+    for n in range(3):
+        paths.append(str(tmp_path / f'{n}.png'))
+        Image.fromarray(random.integers(0, 256, (64, 64), dtype=np.uint8)).save(paths[-1])
+        index.add(index.check(paths[-1], f'{n}.png')[0], f'{n}.png')
+
+    assert index.check(paths[0], 'copy.png')[1] is None
+    assert index.check(paths[1], 'copy.png')[1] == ('1.png', 0)
+    assert index.check(paths[2], 'copy.png')[1] == ('2.png', 0)
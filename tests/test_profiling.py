@@ -0,0 +1,30 @@
+import os
+import threading
+
+import pytest
+
+def profiler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'sampling-profiler']
+
+def test_profile_is_saved_and_named(service, tmp_path, monkeypatch):
+    monkeypatch.setattr(service, 'PROFILE_DIR', str(tmp_path))
+    response = service.app.test_client().get('/health?profile=1')
+
+    assert response.status_code == 200
+    # Written by the time the response is returned, even if the request was too quick to sample
+    assert os.path.exists(response.headers['X-Profile-File'])
+    assert not profiler_threads()
+
+def test_profiler_stops_when_the_view_raises(service, tmp_path, monkeypatch):
+    def status():
+        raise RuntimeError('status unavailable')
+
+    monkeypatch.setattr(service, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(service.cogniac_client, 'status', status)
+    # As under FLASK_DEBUG, where the error propagates and after_request never runs
+    monkeypatch.setitem(service.app.config, 'PROPAGATE_EXCEPTIONS', True)
+    with pytest.raises(RuntimeError):
+        service.app.test_client().get('/health', headers={'X-Profile': '1'})
+
+    assert not profiler_threads()
+    assert len(list(tmp_path.iterdir())) == 1
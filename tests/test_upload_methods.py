@@ -0,0 +1,59 @@
+import pytest
+from tenacity import RetryError, retry, stop_after_attempt
+
+from concurrency import is_congestion_error
+from conftest import StatusError
+from retry_policy import is_retryable
+from upload_methods import AllMethodsFailed, UploadMethodRouter
+
+def failing(status_code):
+    def method():
+        raise StatusError(status_code)
+    return method
+
+def test_method_rejected_before_a_fallback_succeeds_is_skipped():
+    router = UploadMethodRouter([('first', failing(400)), ('second', lambda: 'ok')], cooldown=60)
+    assert router.run() == 'ok'
+    assert [name for name, _ in router.order()] == ['second']
+    assert router.snapshot()['methods']['second']['fallbacks'] == 1
+
+def retried(status_code):
+    # The Cogniac SDK retries server errors itself, then raises tenacity's RetryError
+    return retry(stop=stop_after_attempt(2))(failing(status_code))
+
+def test_transient_failure_does_not_open_the_breaker():
+    router = UploadMethodRouter([('first', retried(503)), ('second', lambda: 'ok')], cooldown=60)
+    assert router.run() == 'ok'
+    assert [name for name, _ in router.order()] == ['first', 'second']
+
+def test_retried_errors_are_classified_by_their_cause():
+    for status_code, congested in ((503, True), (429, True), (400, False)):
+        with pytest.raises(RetryError) as raised:
+            retried(status_code)()
+        assert is_congestion_error(raised.value) is congested
+
+def test_failure_of_every_method_opens_no_breaker():
+    router = UploadMethodRouter([('first', failing(400)), ('second', failing(400))], cooldown=60)
+    with pytest.raises(AllMethodsFailed) as raised:
+        router.run()
+    assert raised.value.last_error.status_code == 400
+    assert [name for name, _ in router.order()] == ['first', 'second']
+
+def unsupported():
+    raise AttributeError("'CogniacConnection' object has no attribute 'upload_media'")
+
+def test_rejection_is_reported_over_an_unsupported_method():
+    router = UploadMethodRouter([('first', failing(400)), ('second', failing(400)), ('third', unsupported)])
+    with pytest.raises(AllMethodsFailed) as raised:
+        router.run()
+    assert raised.value.last_error.status_code == 400
+    assert 'HTTP 400' in str(raised.value)
+    assert [name for name, _ in raised.value.errors] == ['first', 'second', 'third']
+    assert not is_retryable(raised.value)
+
+def test_transient_failure_of_any_method_is_retried():
+    router = UploadMethodRouter([('first', failing(400)), ('second', retried(503)), ('third', unsupported)])
+    with pytest.raises(AllMethodsFailed) as raised:
+        router.run()
+    assert 'HTTP 503' in str(raised.value)
+    assert is_retryable(raised.value)
@@ -0,0 +1,53 @@
+import io
+import threading
+import time
+
+import pytest
+
+from upload_sessions import OffsetMismatch, UploadSessionStore
+
+class SlowStream:
+    """A request body that arrives a byte at a time"""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size):
+        time.sleep(0.01)
+        return self.stream.read(1)
+
+def read_data(store, session_id):
+    with open(store.data_path(session_id), 'rb') as f:
+        return f.read()
+
+def test_same_chunk_from_two_workers_is_written_once(tmp_path, two_workers):
+    first, second = two_workers(UploadSessionStore, str(tmp_path), ttl=60)
+    session_id = first.create('a.jpg', 10, [], {})['session_id']
+
+    offsets = []
+    threads = [
+        threading.Thread(target=lambda store=store: offsets.append(
+            store.append(session_id, SlowStream(b'01234'), 0, 5)))
+        for store in (first, second)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert offsets == [5, 5]
+    assert read_data(first, session_id) == b'01234'
+    assert second.append(session_id, io.BytesIO(b'3456789'), 3, 7) == 10
+    assert read_data(first, session_id) == b'0123456789'
+
+def test_chunk_past_the_size_is_rejected(tmp_path):
+    store = UploadSessionStore(str(tmp_path), ttl=60)
+    session_id = store.create('a.jpg', None, [], {})['session_id']
+    assert store.append(session_id, io.BytesIO(b'0123'), 0, 4, total=6) == 4
+
+    with pytest.raises(ValueError):
+        store.append(session_id, io.BytesIO(b'456'), 4, 3)
+    with pytest.raises(OffsetMismatch):
+        store.append(session_id, io.BytesIO(b'5'), 5, 1)
+    assert read_data(store, session_id) == b'0123'
+    assert store.get(session_id)['size'] == 6
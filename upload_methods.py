@@ -0,0 +1,142 @@
+import threading
+import time
+
+from concurrency import is_congestion_error, root_error
+
+# What a method the installed SDK lacks raises; it says nothing about the upload
+UNSUPPORTED_ERRORS = (AttributeError, NotImplementedError)
+
+class AllMethodsFailed(Exception):
+    """Raised when every upload method failed
+
+    errors holds (name, error) for each method tried, in order. last_error
+    is the one that explains the failure: a transient error if any method
+    hit one, as the upload may then work on a retry, otherwise the first
+    method's error. Methods the installed SDK does not support are passed
+    over unless nothing else was tried.
+    """
+
+    def __init__(self, errors):
+        supported = [error for _, error in errors if not isinstance(root_error(error), UNSUPPORTED_ERRORS)]
+        supported = supported or [error for _, error in errors]
+        transient = [error for error in supported if is_congestion_error(error)]
+        last_error = (transient or supported)[0]
+        Exception.__init__(self, f"All upload methods failed: {str(root_error(last_error))}")
+        self.errors = errors
+        self.last_error = last_error
+
+class AssociationFailed(Exception):
+    """Raised when a media was created but could not be associated with the subject
+
+    Keeps the media_id, so a retry associates that media instead of
+    creating another one.
+    """
+
+    def __init__(self, media_id, last_error):
+        Exception.__init__(
+            self, f"Media {media_id} was created but not associated with the subject: {str(last_error)}"
+        )
+        self.media_id = media_id
+        self.last_error = last_error
+
+class UploadMethodRouter:
+    """Tries upload methods in order of preference, learning which ones work
+
+    Each method has a circuit breaker. After failure_threshold consecutive
+    rejections a method is skipped for cooldown seconds, after which the next
+    upload probes it again. A failure only counts as a rejection when a later
+    method then succeeds for the same upload; if every method fails, the file
+    or the service is the likelier culprit. Throttling, server errors and
+    timeouts never count, since they say nothing about whether the method works.
+    """
+
+    def __init__(self, methods, failure_threshold=1, cooldown=300.0):
+        # methods: list of (name, function) in default order of preference
+        self.methods = list(methods)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {
+                'successes': 0,
+                'failures': 0,
+                'fallbacks': 0,
+                'consecutive_failures': 0,
+                'total_latency': 0.0,
+                'open_until': 0.0
+            }
+            for name, _ in self.methods
+        }
+
+    def order(self):
+        """Return the methods to try, skipping ones whose breaker is open"""
+        now = time.monotonic()
+        available = []
+        with self._lock:
+            for name, fn in self.methods:
+                stats = self._stats[name]
+                if stats['open_until'] > now:
+                    continue
+                if stats['consecutive_failures'] >= self.failure_threshold:
+                    # Cooldown is over: this upload probes the method while the others keep skipping it
+                    stats['open_until'] = now + self.cooldown
+                available.append((name, fn))
+        # Never refuse an upload outright; if everything is open, fall back to the full cascade
+        return available or list(self.methods)
+
+    def run(self, *args, **kwargs):
+        """Call each method in turn until one succeeds and return its result"""
+        failures = []
+        for name, fn in self.order():
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                failures.append((name, time.monotonic() - started, e))
+                continue
+            for failed_name, latency, error in failures:
+                self._record(failed_name, latency, error, rejected=True)
+            self._record(name, time.monotonic() - started, fallback=bool(failures))
+            return result
+
+        for failed_name, latency, error in failures:
+            self._record(failed_name, latency, error, rejected=False)
+        raise AllMethodsFailed([(name, error) for name, _, error in failures])
+
+    def _record(self, name, latency, error=None, rejected=False, fallback=False):
+        with self._lock:
+            stats = self._stats[name]
+            stats['total_latency'] += latency
+            if error is None:
+                stats['successes'] += 1
+                # Succeeded after an earlier method failed for the same upload
+                stats['fallbacks'] += int(fallback)
+                stats['consecutive_failures'] = 0
+                stats['open_until'] = 0.0
+                return
+
+            stats['failures'] += 1
+            if not rejected or is_congestion_error(error):
+                return
+            stats['consecutive_failures'] += 1
+            if stats['consecutive_failures'] >= self.failure_threshold:
+                stats['open_until'] = time.monotonic() + self.cooldown
+
+    def snapshot(self):
+        """Return per-method counters, latency and breaker state"""
+        now = time.monotonic()
+        with self._lock:
+            methods = {}
+            for name, _ in self.methods:
+                stats = self._stats[name]
+                calls = stats['successes'] + stats['failures']
+                methods[name] = {
+                    'successes': stats['successes'],
+                    'failures': stats['failures'],
+                    'fallbacks': stats['fallbacks'],
+                    'avg_latency': round(stats['total_latency'] / calls, 3) if calls else 0.0,
+                    'state': 'open' if stats['open_until'] > now else 'closed',
+                    'retry_in': round(max(0.0, stats['open_until'] - now), 1)
+                }
+            preferred = next((name for name, _ in self.methods if methods[name]['state'] == 'closed'), None)
+            return {'preferred': preferred, 'methods': methods}
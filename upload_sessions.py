@@ -0,0 +1,209 @@
+import contextlib
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)$')
+
+class OffsetMismatch(Exception):
+    """Raised when a chunk does not continue from the bytes already received"""
+
+    def __init__(self, offset):
+        Exception.__init__(self, f"Upload must continue from byte {offset}")
+        self.offset = offset
+
+def parse_content_range(header):
+    """Parse 'bytes start-end/total' into (start, end, total or None); None if malformed"""
+    match = CONTENT_RANGE.match((header or '').strip())
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == '*' else int(match.group(3))
+    if end < start or (total is not None and end >= total):
+        return None
+    return start, end, total
+
+class UploadSessionStore:
+    """Resumable uploads kept on disk, so they survive a restart
+
+    Each session is a directory holding the bytes received so far and a small
+    JSON record. The received offset is the size of the data file, so it is
+    always what actually reached the disk. Chunks must be sent in order; a
+    chunk that overlaps bytes already received only has its new tail written.
+    Writers hold an exclusive lock on the data file, so worker processes
+    sharing the directory never interleave their writes to a session.
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._session_locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id, name):
+        return os.path.join(self.directory, session_id, name)
+
+    def _session_lock(self, session_id):
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    @contextlib.contextmanager
+    def _locked(self, session_id):
+        """Hold the session against other threads and processes; yields the open data file, or None if unknown"""
+        with self._session_lock(session_id):
+            try:
+                f = open(self._path(session_id, 'data'), 'r+b')
+            except OSError:
+                yield None
+                return
+            with f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                yield f
+
+    def _write_record(self, session_id, record):
+        # Replace atomically so a crash never leaves a half-written record
+        tmp_path = self._path(session_id, 'session.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self._path(session_id, 'session.json'))
+
+    def create(self, filename, size, meta_tags, options):
+        """Start a session and return its record"""
+        session_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.directory, session_id))
+        open(self._path(session_id, 'data'), 'wb').close()
+        now = time.time()
+        record = {
+            'session_id': session_id,
+            'filename': filename,
+            'size': size,
+            'meta_tags': meta_tags,
+            'options': options,
+            'created_at': now,
+            'updated_at': now
+        }
+        self._write_record(session_id, record)
+        return self.describe(record)
+
+    def get(self, session_id):
+        """Return the session record with its current offset, or None if unknown or expired"""
+        if not re.fullmatch(r'[0-9a-f]{32}', session_id):
+            return None
+        try:
+            with open(self._path(session_id, 'session.json')) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record['updated_at'] + self.ttl < time.time():
+            self.remove(session_id)
+            return None
+        return self.describe(record)
+
+    def describe(self, record):
+        record = dict(record)
+        record['offset'] = os.path.getsize(self._path(record['session_id'], 'data'))
+        record['expires_at'] = record['updated_at'] + self.ttl
+        return record
+
+    def data_path(self, session_id):
+        return self._path(session_id, 'data')
+
+    def append(self, session_id, stream, start, length, total=None, chunk_size=1024 * 1024):
+        """Write `length` bytes from stream, which begin at byte `start`; returns the new offset
+
+        total, if given, sets the size of a session created without one. Raises
+        KeyError for an unknown session, OffsetMismatch if start is past the
+        bytes received so far and ValueError if the chunk overruns the size.
+        If the stream fails part way, whatever arrived is kept.
+        """
+        with self._locked(session_id) as f:
+            record = self.get(session_id) if f else None
+            if record is None:
+                raise KeyError(session_id)
+            offset = record.pop('offset')
+            del record['expires_at']
+            if start > offset:
+                raise OffsetMismatch(offset)
+            if record['size'] is None:
+                record['size'] = total
+            elif total is not None and total != record['size']:
+                raise ValueError(f"Upload size is {record['size']} bytes, not {total}")
+            if record['size'] is not None and start + length > record['size']:
+                raise ValueError(f"Chunk ends past the upload size of {record['size']} bytes")
+
+            # Skip whatever part of this chunk was already received and write
+            # the rest at the offset checked above
+            skip = offset - start
+            f.seek(offset)
+            try:
+                remaining = length
+                while remaining > 0:
+                    data = stream.read(min(chunk_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    if skip >= len(data):
+                        skip -= len(data)
+                        continue
+                    f.write(data[skip:])
+                    skip = 0
+            finally:
+                f.flush()
+                # The offset reported to the client must survive a crash
+                os.fsync(f.fileno())
+                record['updated_at'] = time.time()
+                self._write_record(session_id, record)
+            return f.tell()
+
+    def finalize(self, session_id, upload):
+        """Run upload(record) once every byte has arrived; returns (record, result)
+
+        record is None for an unknown session. The session is removed unless
+        the result's status is 'error', so a failed upload can be finalized
+        again. Raises ValueError if bytes are still missing.
+        """
+        with self._locked(session_id) as f:
+            record = self.get(session_id) if f else None
+            if record is None:
+                return None, None
+            if record['size'] is not None and record['offset'] != record['size']:
+                raise ValueError(f"Only {record['offset']} of {record['size']} bytes have been received")
+            result = upload(record)
+            if result['status'] != 'error':
+                shutil.rmtree(os.path.join(self.directory, session_id), ignore_errors=True)
+        if result['status'] != 'error':
+            with self._lock:
+                self._session_locks.pop(session_id, None)
+        return record, result
+
+    def remove(self, session_id):
+        shutil.rmtree(os.path.join(self.directory, session_id), ignore_errors=True)
+        with self._lock:
+            self._session_locks.pop(session_id, None)
+
+    def expire_idle(self):
+        """Delete sessions idle for longer than the TTL; returns how many were removed"""
+        expired = 0
+        now = time.time()
+        for session_id in os.listdir(self.directory):
+            if not os.path.isdir(os.path.join(self.directory, session_id)):
+                continue
+            with self._session_lock(session_id):
+                try:
+                    updated_at = os.path.getmtime(self._path(session_id, 'session.json'))
+                except OSError:
+                    # A session directory without a record was never finished being created
+                    updated_at = os.path.getmtime(os.path.join(self.directory, session_id))
+                if updated_at + self.ttl >= now:
+                    continue
+                shutil.rmtree(os.path.join(self.directory, session_id), ignore_errors=True)
+            with self._lock:
+                self._session_locks.pop(session_id, None)
+            expired += 1
+        return expired
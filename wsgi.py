@@ -0,0 +1,15 @@
+"""WSGI entry point for production serving, e.g.
+
+    gunicorn --workers 4 --worker-class gthread --threads 16 --timeout 300 --bind 0.0.0.0:5000 wsgi:app
+
+Each worker logs in to Cogniac on its first upload or /ready probe, not at
+start-up, so workers boot without network access and a Cogniac outage only
+fails uploads. Point the load balancer's readiness probe at /ready and its
+liveness probe at /health. Workers share batch progress through the job
+store (JOB_STORE_URL), so any of them can answer /batch-status and
+/batch-events for any batch. Don't use --preload: the upload workers and
+background threads do not survive the fork into worker processes.
+"""
+from main import app, start_background_work
+
+start_background_work()